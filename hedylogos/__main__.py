@@ -1,26 +1,201 @@
-from .controller import Controller
-from .model import Scenario
-from .receiver import KeyboardReceiver
+from .startup import StartupProfile
 
+import atexit
+import functools
+import inspect
+import json
+import logging
 from pathlib import Path
+import random
+import tempfile
+from typing import TYPE_CHECKING, Callable, Optional
 
 from typing_extensions import Annotated
 
 import typer
 
+if TYPE_CHECKING:
+    from .analytics import SessionLog
+    from .audio import Clip
+    from .compiled import CompiledScenario
+    from .controller import Controller
+    from .metrics import Metrics, MetricsWriter
+    from .reload import ScenarioWatcher
+
+# Every command imports the modules it needs itself. Loading all of them
+# (and pydantic with them) takes a good part of a second on a Raspberry Pi.
+
 app = typer.Typer()
 
+profile = StartupProfile()
+
+
+@app.callback()
+def main(
+    log_level: Annotated[str, typer.Option(help="least severe log messages shown: debug, info, warning or error")] = "info",
+    profile_startup: Annotated[bool, typer.Option(help="print how long each phase of the startup took, for the run commands until they are ready for input")] = False,
+):
+    if log_level.upper() not in ("DEBUG", "INFO", "WARNING", "ERROR"):
+        raise typer.BadParameter(f"unknown log level {log_level}")
+    logging.basicConfig(level=log_level.upper())
+    if profile_startup:
+        profile.enabled = True
+        profile.mark("cli")
+        atexit.register(profile.report, "command")
+
+
+def load_scenario(path: Path) -> tuple["CompiledScenario", Optional[Callable[[Path], "Clip"]]]:
+    """
+    Loads a scenario for running it together with the function loading it's
+    audio, None if the audio are plain files. A compiled file is used instead of
+    the JSON if it's up to date, thus skipping the validation (and pydantic).
+    """
+    from . import binary, bundle
+    from .bundle import Bundle
+    from .compiled import CompiledScenario
+
+    if path.suffix == bundle.SUFFIX:
+        scenario_bundle = Bundle(path)
+        return scenario_bundle.scenario, scenario_bundle.clip
+    if path.suffix == binary.SUFFIX:
+        return binary.load(path), None
+    compiled = binary.load_for(path)
+    if compiled:
+        return compiled, None
+    return compile_scenario(path), None
+
+
+def compile_scenario(path: Path) -> "CompiledScenario":
+    """Validates a scenario JSON file and compiles it while reading it."""
+    from .compiled import CompiledScenario
+
+    return CompiledScenario.from_json(path)
+
+
+def start_watcher(path: Path, controller: "Controller", scenario: "CompiledScenario") -> "ScenarioWatcher":
+    """Reloads the scenario into the controller whenever the file changes."""
+    from . import bundle
+    from .reload import ScenarioWatcher
+
+    if path.suffix == bundle.SUFFIX:
+        raise typer.BadParameter("bundles can't be watched, run the scenario JSON instead")
+    watcher = ScenarioWatcher(path, controller, scenario, lambda changed: load_scenario(changed)[0])
+    watcher.start()
+    return watcher
+
+
+def start_session_log(path: Optional[Path], max_size: int, max_files: int) -> Optional["SessionLog"]:
+    """Records what the visitors do if a path for the log is given."""
+    if not path:
+        return None
+    from .analytics import SessionLog
+
+    session_log = SessionLog(path, max_size * 1024 * 1024, max_files=max_files)
+    session_log.start()
+    return session_log
+
+
+def start_metrics(path: Optional[Path], interval: float) -> tuple[Optional["Metrics"], Optional["MetricsWriter"]]:
+    """Enables the metrics if a path for them is given."""
+    if not path:
+        return None, None
+    from .metrics import Metrics, MetricsWriter
+
+    metrics = Metrics()
+    writer = MetricsWriter(metrics, path, interval)
+    writer.start()
+    return metrics, writer
+
+
+@app.command()
+def analyze(
+    path: Annotated[Path, typer.Argument(help="path to scenario file")],
+    as_json: Annotated[bool, typer.Option("--json", help="print the result as JSON")] = False,
+):
+    """
+    Validates the scenario and reports all errors, unreachable nodes, dead ends
+    and cycles without exit.
+    """
+    from .analysis import Analysis
+
+    analysis = Analysis.from_json(path)
+    if as_json:
+        print(json.dumps(analysis.as_dict(), indent=2))
+    else:
+        for issue in analysis.issues:
+            print(issue)
+        print(f"{len(analysis.nodes)} nodes, {sum(analysis.reachable)} reachable, {len(analysis.errors)} error(s)")
+        for check, duration in analysis.timings.items():
+            print(f"{check:>14}: {duration * 1000:.2f} ms")
+    if not analysis.is_valid:
+        raise typer.Exit(code=1)
+
+
+@app.command(name="bundle")
+def create_bundle(
+    path: Annotated[Path, typer.Argument(help="path to scenario file")],
+    output: Annotated[Optional[Path], typer.Option(help="output path, defaults to the scenario path with the .hedb extension")] = None,
+):
+    """
+    Packs the scenario and all of it's audio files into a single file which can
+    be run directly. Audio files need to be WAV files (see prepare).
+    """
+    from . import binary, bundle
+    from .bundle import Bundle
+
+    scenario = compile_scenario(path)
+    output = output if output else path.with_suffix(bundle.SUFFIX)
+    Bundle.write(scenario, binary.source_hash(path), output)
+    print(f"written to {output} (sha256 {binary.source_hash(output).hex()})")
+
 
 @app.command()
 def check(
-    path: Annotated[Path, typer.Argument(help="output path")]
+    path: Annotated[Path, typer.Argument(help="path to scenario file")],
+    jobs: Annotated[Optional[int], typer.Option(help="number of parallel workers, defaults to a value based on the CPU count")] = None,
+    cache: Annotated[bool, typer.Option(help="reuse the results for files which didn't change since the last check")] = True,
+    verbose: Annotated[bool, typer.Option(help="list every audio file, not only the ones with problems")] = False,
 ):
     """
-    Checks if all audio files in the scenario can be found
+    Checks if all audio files in the scenario can be found and played, reports
+    their formats and durations.
     """
-    scenario = Scenario.from_json(path)
-    controller = Controller(scenario, path)
-    controller.check_paths()
+    from .check import AudioChecker, common_format
+
+    scenario = compile_scenario(path)
+    checker = AudioChecker(path.parent / ".hedylogos" / "check.json" if cache else None, jobs)
+    infos = checker.check(scenario.audio_paths())
+    errors = [info for info in infos if info.error]
+    common = common_format(infos)
+    deviating = [info for info in infos if not info.error and info.format != common]
+    for info in infos:
+        if verbose or info.error:
+            print(info)
+        elif info in deviating:
+            print(f"{info}, differs from the format of most other files")
+    duration = sum(info.duration for info in infos)
+    size = sum(info.nbytes for info in infos)
+    print(f"{len(infos)} audio files, {len(errors)} error(s), {len(deviating)} in a different format")
+    print(f"{duration / 60:.1f} min of audio, {size / 1024 / 1024:.1f} MiB to preload all of it")
+    print(f"{checker.inspected} inspected, {checker.cached} unchanged since the last check")
+    if errors:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def compile(
+    path: Annotated[Path, typer.Argument(help="path to scenario file")],
+    output: Annotated[Optional[Path], typer.Option(help="output path, defaults to the scenario path with the .hedc extension")] = None,
+):
+    """
+    Validates the scenario and writes it in a binary form which loads without
+    any validation. The run commands pick it up automatically as long as the
+    scenario file doesn't change.
+    """
+    from . import binary
+
+    scenario = compile_scenario(path)
+    binary.write(scenario, binary.source_hash(path), output if output else binary.default_path(path))
 
 
 @app.command()
@@ -30,38 +205,354 @@ def init(
     """
     Writes a new JSON Scenario files with some example values to the disk.
     """
+    from .model import Scenario
+
     scenario = Scenario.init_example()
     scenario.to_json(path)
 
 
 @app.command()
+def prepare(
+    path: Annotated[Path, typer.Argument(help="path to scenario file")],
+    output: Annotated[Optional[Path], typer.Option(help="path of the prepared scenario, defaults to NAME.prepared.json next to the scenario")] = None,
+    cache_dir: Annotated[Optional[Path], typer.Option(help="where the converted audio is stored, defaults to .hedylogos/audio next to the scenario")] = None,
+    rate: Annotated[int, typer.Option(help="sample rate in Hz")] = 44100,
+    width: Annotated[int, typer.Option(help="sample width in bytes")] = 2,
+    channels: Annotated[int, typer.Option(help="number of channels")] = 1,
+    loudness: Annotated[float, typer.Option(help="target loudness in LUFS")] = -16.0,
+    normalize: Annotated[bool, typer.Option(help="normalize the loudness of all audio files")] = True,
+    jobs: Annotated[Optional[int], typer.Option(help="number of worker processes, defaults to the number of CPUs")] = None,
+):
+    """
+    Converts all audio files of the scenario into one format and writes a copy
+    of the scenario using the converted files. Only new or changed audio files
+    are converted again. Needs ffmpeg.
+    """
+    from .model import Scenario
+    from .prepare import AudioFormat, AudioPreparer
+
+    scenario = Scenario.from_json(path)
+    preparer = AudioPreparer(
+        cache_dir if cache_dir else path.parent / ".hedylogos" / "audio",
+        AudioFormat(rate, width, channels, loudness if normalize else None),
+        jobs,
+    )
+    output = output if output else path.with_name(f"{path.stem}.prepared.json")
+    preparer.prepare(scenario, path, output)
+    print(f"{preparer.converted} converted, {preparer.reused} reused, written to {output}")
+
+
+class RunOptions:
+    """
+    Options shared by the run commands, see `run_options`. The annotations of
+    the parameters are the typer options.
+    """
+
+    def __init__(
+        self,
+        cache_size: Annotated[int, typer.Option(help="size limit of the decoded audio cache in MiB")] = 64,
+        prefetch_depth: Annotated[int, typer.Option(min=0, max=2, help="how many numbers ahead audio is loaded in the background, 0 disables prefetching")] = 1,
+        prefetch_budget: Annotated[int, typer.Option(help="how much audio in MiB may be prefetched when entering a node")] = 32,
+        audio_backend: Annotated[list[str], typer.Option(help="audio output: simpleaudio, alsa, alsa:DEVICE, null or file:PATH; repeat to run one session per output")] = ["simpleaudio"],
+        stream_threshold: Annotated[int, typer.Option(help="audio bigger than this (in MiB) is memory-mapped and read while it plays instead of being loaded at once")] = 4,
+        metrics: Annotated[Optional[Path], typer.Option(help="record latency metrics and write them to this file periodically, as Prometheus text if it ends with .prom and as JSON otherwise")] = None,
+        metrics_interval: Annotated[float, typer.Option(help="seconds between two writes of the metrics file")] = 10,
+        watch: Annotated[bool, typer.Option(help="reload the scenario whenever the file changes, running calls aren't affected")] = False,
+        gapless: Annotated[bool, typer.Option(help="load the audio following random links and ends of calls ahead and queue it right behind the current audio")] = True,
+        crossfade: Annotated[int, typer.Option(min=0, help="milliseconds gapless clips overlap with a crossfade, 0 disables it")] = 0,
+        session_log: Annotated[Optional[Path], typer.Option(help="record every pick up, dial and node of the visitors to this binary log, see stats")] = None,
+        session_log_size: Annotated[int, typer.Option(min=1, help="size in MiB after which the session log is rotated")] = 16,
+        session_log_files: Annotated[int, typer.Option(min=1, help="how many rotated session logs are kept, older ones are deleted")] = 10,
+    ):
+        self.cache_size = cache_size
+        self.prefetch_depth = prefetch_depth
+        self.prefetch_budget = prefetch_budget
+        self.audio_backend = audio_backend
+        self.stream_threshold = stream_threshold
+        self.metrics = metrics
+        self.metrics_interval = metrics_interval
+        self.watch = watch
+        self.gapless = gapless
+        self.crossfade = crossfade
+        self.session_log = session_log
+        self.session_log_size = session_log_size
+        self.session_log_files = session_log_files
+
+
+def run_options(command: Callable[..., None]) -> Callable[..., None]:
+    """
+    Adds the options of `RunOptions` to a run command, the command receives
+    them as it's `options` parameter.
+    """
+    own = [parameter for parameter in inspect.signature(command).parameters.values() if parameter.name != "options"]
+    shared = list(inspect.signature(RunOptions).parameters.values())
+
+    @functools.wraps(command)
+    def wrapper(**kwargs):
+        options = RunOptions(**{parameter.name: kwargs.pop(parameter.name) for parameter in shared})
+        command(options=options, **kwargs)
+
+    # Typer reads the options from the signature.
+    wrapper.__signature__ = inspect.Signature(own + shared)  # type: ignore[attr-defined]
+    wrapper.__annotations__ = {parameter.name: parameter.annotation for parameter in own + shared}
+    return wrapper
+
+
+class Run:
+    """The controller of a run command together with the writers it feeds."""
+
+    def __init__(self, path: Path, options: RunOptions):
+        """Loads the scenario and starts the controller, marking the phases of the startup."""
+        from .audio import backend_by_name
+        from .controller import Controller
+
+        scenario, loader = load_scenario(path)
+        profile.mark("scenario")
+        recorder, self.__writer = start_metrics(options.metrics, options.metrics_interval)
+        self.__log = start_session_log(options.session_log, options.session_log_size, options.session_log_files)
+        backends = [backend_by_name(name) for name in options.audio_backend]
+        profile.mark("audio")
+        self.controller = Controller(
+            scenario,
+            cache_limit=options.cache_size * 1024 * 1024,
+            prefetch_depth=options.prefetch_depth,
+            prefetch_budget=options.prefetch_budget * 1024 * 1024,
+            backends=backends,
+            loader=loader,
+            stream_threshold=options.stream_threshold * 1024 * 1024,
+            metrics=recorder,
+            gapless=options.gapless,
+            crossfade=options.crossfade / 1000,
+            session_log=self.__log,
+        )
+        if options.watch:
+            start_watcher(path, self.controller, scenario)
+        profile.mark("controller")
+
+    def stop(self):
+        """Waits for the controller to quit and flushes the metrics and the session log."""
+        self.controller.join()
+        if self.__writer:
+            self.__writer.stop()
+        if self.__log:
+            self.__log.stop()
+            if self.__log.dropped or self.__log.errors:
+                logging.warning(
+                    f"session log: {self.__log.dropped} event(s) dropped, {self.__log.errors} write(s) failed"
+                )
+
+
+@app.command()
+@run_options
 def run_keyboard(
-    path: Annotated[Path, typer.Argument(help="path to scenario file")]
+    path: Annotated[Path, typer.Argument(help="path to scenario, compiled scenario or bundle file")],
+    options: RunOptions,
 ):
     """
     Runs the scenario using the input form the keyboard.
     """
-    scenario = Scenario.from_json(path)
-    controller = Controller(scenario, path)
-    receiver = KeyboardReceiver(controller)
+    from .receiver import KeyboardReceiver
+    profile.mark("imports")
+
+    run = Run(path, options)
+    receiver = KeyboardReceiver(run.controller)
+    profile.report("receiver")
     receiver.run()
+    run.stop()
 
 
 @app.command()
+@run_options
 def run_phone(
-    path: Annotated[Path, typer.Argument(help="path to scenario file")]
+    path: Annotated[Path, typer.Argument(help="path to scenario, compiled scenario or bundle file")],
+    options: RunOptions,
 ):
     """
     Runs the scenario using input form a dial phone using rotarypi.
     """
-    scenario = Scenario.from_json(path)
-    controller = Controller(scenario, path)
-    if Path("/etc/rpi-issue").exists():
-        from .receiver import DialPhoneReceiver
-        receiver = DialPhoneReceiver(controller)
+    profile.mark("imports")
+
+    if len(options.audio_backend) != 1:
+        raise typer.BadParameter("a dial phone has a single session, give one --audio-backend")
+    # Checked first, so the scenario isn't loaded and the audio output not started in vain.
+    if not Path("/etc/rpi-issue").exists():
+        raise NotImplementedError("Reading input from a rotary phone is only implemented for Raspberry Pi's (where the rp.GPIO library is available)")
+    run = Run(path, options)
+    from .receiver import DialPhoneReceiver
+    receiver = DialPhoneReceiver(run.controller)
+    profile.report("receiver")
+    receiver.run()
+
+
+@app.command()
+@run_options
+def run_inputs(
+    path: Annotated[Path, typer.Argument(help="path to scenario, compiled scenario or bundle file")],
+    input: Annotated[list[str], typer.Option(help="input source: evdev:PATH, fifo:PATH, socket:PATH, rotary or replay:PATH; append @SESSION to act on another session than the first, repeat for several sources")],
+    options: RunOptions,
+    record: Annotated[Optional[Path], typer.Option(help="append every input to this trace file, it can be replayed with replay:PATH or simulate --trace")] = None,
+):
+    """
+    Runs the scenario with input from several devices at once, e.g. a keypad
+    and an audio output per kiosk. All inputs are read on a single thread.
+    """
+    from .inputs import InputReceiver, source_by_name
+    profile.mark("imports")
+
+    try:
+        sources = [source_by_name(name) for name in input]
+    except (OSError, ValueError) as e:
+        raise typer.BadParameter(str(e))
+    run = Run(path, options)
+    try:
+        receiver = InputReceiver(run.controller, sources, record)
+    except ValueError as e:
+        run.controller.quit()
+        raise typer.BadParameter(str(e))
+    profile.report("receiver")
+    try:
         receiver.run()
+    except KeyboardInterrupt:
+        pass
+    run.stop()
+
+
+@app.command()
+def serve(
+    path: Annotated[Path, typer.Argument(help="path to scenario file")],
+    host: Annotated[str, typer.Option(help="address to listen on, only local by default")] = "127.0.0.1",
+    port: Annotated[int, typer.Option(help="port to listen on")] = 8420,
+    allow_origin: Annotated[Optional[list[str]], typer.Option(help="origin of a page allowed to use the server besides localhost (e.g. https://example.com), repeat for several, defaults to the hosted editor")] = None,
+):
+    """
+    Keeps the scenario in memory and validates edits of the editor as they
+    happen. Only the changed nodes and their links are checked again.
+    """
+    from .server import LiveScenario, ScenarioServer
+
+    scenario = LiveScenario.from_json(path)
+    status = scenario.status()
+    print(f"{status['nodes']} nodes, {status['reachable']} reachable, {len(status['issues'])} issue(s)")
+    server = ScenarioServer(scenario, (host, port), allow_origin)
+    print(f"serving {path} on http://{host}:{server.server_address[1]}")
+    print(f"token for changes: {server.token}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+@app.command()
+def simulate(
+    path: Annotated[Path, typer.Argument(help="path to scenario, compiled scenario or bundle file")],
+    trace: Annotated[Optional[Path], typer.Option(help="replay this trace (JSON lines with time, session, action and number) instead of random visits")] = None,
+    visits: Annotated[int, typer.Option(help="number of random visits")] = 1000,
+    sessions: Annotated[int, typer.Option(min=1, help="number of handsets used at the same time by the random visitors")] = 1,
+    think_time: Annotated[float, typer.Option(help="average seconds a random visitor waits before dialing")] = 2,
+    hang_up_probability: Annotated[float, typer.Option(min=0, max=1, help="probability of a random visitor to hang up on each menu")] = 0.05,
+    seed: Annotated[Optional[int], typer.Option(help="seed for reproducible runs")] = None,
+    save_trace: Annotated[Optional[Path], typer.Option(help="write all simulated inputs to this trace file")] = None,
+    as_json: Annotated[bool, typer.Option("--json", help="print the result as JSON")] = False,
+):
+    """
+    Runs the scenario without audio output on a virtual clock, either with
+    random visitors or by replaying a trace. Reports how often each node was
+    visited and the distribution of the random links.
+    """
+    from .simulation import Simulation, read_trace, write_trace
+
+    scenario, loader = load_scenario(path)
+    if seed is not None:
+        random.seed(seed)
+    if trace:
+        events = read_trace(trace)
+        simulation = Simulation(scenario, max((event.session for event in events), default=0) + 1, loader, seed)
+        simulation.replay(events)
     else:
-        raise NotImplementedError("Reading input from a rotary phone is only implemented for Raspberry Pi's (where the rp.GPIO library is available)")
+        simulation = Simulation(scenario, sessions, loader, seed)
+        simulation.visit(visits, think_time, hang_up_probability=hang_up_probability)
+    if save_trace:
+        write_trace(simulation.trace, save_trace)
+    result = simulation.as_dict()
+    if as_json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{result['visits']} visits, {result['completed']} reached the end, {result['timed_out']} timed out, {result['events']} events")
+    print(f"{result['simulated_seconds']:.0f} s simulated in {result['wall_seconds']:.2f} s ({result['events_per_second'] or 0:.0f} events/s)")
+    for node in result["random_links"]:
+        print(f"{node['node']} ({node['total']} times):")
+        for target in node["targets"]:
+            print(f"  {target['target']:>20}: expected {target['expected']:6.1%}, observed {target['observed']:6.1%}")
+
+
+@app.command()
+def stats(
+    paths: Annotated[list[Path], typer.Argument(help="session logs written by --session-log, rotated files are included automatically")],
+    as_json: Annotated[bool, typer.Option("--json", help="print the result as JSON")] = False,
+):
+    """
+    Reports how often each node was visited, where visitors hung up, how often
+    they dialed an invalid number and how long they listened to each node.
+    """
+    from .analytics import aggregate
+
+    try:
+        result = aggregate(paths).as_dict()
+    except (FileNotFoundError, ValueError) as e:
+        raise typer.BadParameter(str(e))
+    if as_json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{result['calls']} calls, {result['completed']} reached the end, {result['timed_out']} timed out, {result['records']} records")
+    print(f"{'node':>20} {'visits':>8} {'hang ups':>8} {'invalid':>8} {'listened':>9}")
+    for node in result["nodes"]:
+        invalid = f"{node['invalid_rate']:.1%}" if node["invalid_rate"] is not None else "-"
+        listened = f"{node['mean_listen_seconds']:.1f} s" if node["mean_listen_seconds"] is not None else "-"
+        print(f"{node['node']:>20} {node['visits']:>8} {node['drop_offs']:>8} {invalid:>8} {listened:>9}")
+
+
+@app.command()
+def benchmark(
+    nodes: Annotated[int, typer.Option(min=1, help="number of nodes of the generated scenario")] = 10000,
+    fan_out: Annotated[int, typer.Option(min=1, max=10, help="links per node")] = 5,
+    random_share: Annotated[float, typer.Option(min=0, max=1, help="share of nodes with unnumbered (random) links")] = 0.2,
+    audio_files: Annotated[int, typer.Option(min=1, help="number of distinct audio files")] = 20,
+    audio_seconds: Annotated[float, typer.Option(help="duration of each audio file")] = 5,
+    content_length: Annotated[int, typer.Option(min=0, help="characters of the transcript (content) of each node")] = 0,
+    repeat: Annotated[int, typer.Option(min=1, help="how often each measurement is repeated")] = 5,
+    output: Annotated[Optional[Path], typer.Option(help="write the results as JSON to this file")] = None,
+    baseline: Annotated[Optional[Path], typer.Option(help="results of an earlier run to compare with")] = None,
+    keep: Annotated[Optional[Path], typer.Option(help="generate the scenario into this directory and keep it")] = None,
+):
+    """
+    Generates a synthetic scenario and measures loading, validation, lookups,
+    event handling and audio loading.
+    """
+    from .benchmark import Benchmark, ScenarioGenerator, compare, read_results
+
+    generator = ScenarioGenerator(
+        nodes=nodes,
+        fan_out=fan_out,
+        random_share=random_share,
+        audio_files=audio_files,
+        audio_seconds=audio_seconds,
+        content_length=content_length,
+    )
+    if keep:
+        result = Benchmark(generator, repeat).run(keep)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            result = Benchmark(generator, repeat).run(Path(directory))
+    if output:
+        with open(output, "w") as f:
+            json.dump(result, f, indent=2)
+    for name, median, ratio in compare(result, read_results(baseline) if baseline else None):
+        change = f" ({ratio:.2f}x)" if ratio else ""
+        print(f"{name:>24}: {median * 1000:10.4f} ms{change}")
+    for name, size in result["memory"].items():
+        print(f"{'memory ' + name:>24}: {size / 1024 / 1024:10.2f} MiB per 10k nodes")
 
 
 @app.command()
@@ -71,6 +562,8 @@ def schema(
     """
     Writes the JSON Schema of a Scenario file to disk.
     """
+    from .model import Scenario
+
     Scenario.to_json_schema(path)
 
 
@@ -0,0 +1,278 @@
+from .model import Node, Scenario
+
+from collections import deque
+from enum import Enum
+import json
+from pathlib import Path
+import time
+from typing import Any, Callable, Optional
+
+from pydantic import ValidationError
+
+
+class Severity(str, Enum):
+    """How bad a finding of the analysis is."""
+
+    ERROR = "error"
+    """The scenario can't be loaded."""
+    WARNING = "warning"
+    """The scenario works but probably not as intended."""
+    INFO = "info"
+
+
+class Issue:
+    """A single finding of the analysis."""
+
+    def __init__(
+        self,
+        severity: Severity,
+        check: str,
+        message: str,
+        node: Optional[str] = None,
+    ):
+        self.severity = severity
+        self.check = check
+        self.message = message
+        self.node = node
+
+    def __str__(self) -> str:
+        if self.node is None:
+            return f"{self.severity.value}: {self.message}"
+        return f"{self.severity.value}: node '{self.node}': {self.message}"
+
+    def as_dict(self) -> dict[str, Optional[str]]:
+        return {
+            "severity": self.severity.value,
+            "check": self.check,
+            "message": self.message,
+            "node": self.node,
+        }
+
+
+class Analysis:
+    """
+    Validates a scenario and inspects the structure of it's graph. In contrast
+    to `Scenario.from_json` all problems are collected instead of stopping at
+    the first one. Every check runs in linear time of the number of nodes and
+    links, the time taken by each check is recorded in `timings`.
+    """
+
+    def __init__(self):
+        self.issues: list[Issue] = []
+        self.timings: dict[str, float] = {}
+        """Duration of each check in seconds."""
+        self.ids: list[Optional[str]] = []
+        """Id of every node by it's position, None if the node has no valid id."""
+        self.nodes: list[Optional[Node]] = []
+        """Every node by it's position, None if the node itself is invalid."""
+        self.edges: list[list[int]] = []
+        """Positions of the link targets of every node."""
+        self.index: dict[str, int] = {}
+        self.start: Optional[int] = None
+        self.reachable: list[bool] = []
+
+    @classmethod
+    def from_json(cls, path: Path) -> "Analysis":
+        """Analyzes a scenario JSON file."""
+        rsl = cls()
+        data = rsl.__timed("parse", lambda: rsl.__parse(path))
+        if data is not None:
+            rsl.run(data)
+        return rsl
+
+    def run(self, data: dict[str, Any]):
+        """Runs all checks on the deserialized JSON of a scenario."""
+        self.__timed("fields", lambda: self.__check_fields(data))
+        self.__timed("unique ids", self.__check_unique_ids)
+        self.__timed("link targets", self.__check_link_targets)
+        self.__timed("start node", lambda: self.__check_start_node(data.get("start_node")))
+        self.__timed("reachability", self.__check_reachability)
+        self.__timed("dead ends", self.__check_dead_ends)
+        self.__timed("cycles", self.__check_cycles)
+
+    @property
+    def errors(self) -> list[Issue]:
+        return [issue for issue in self.issues if issue.severity is Severity.ERROR]
+
+    @property
+    def is_valid(self) -> bool:
+        return len(self.errors) == 0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "valid": self.is_valid,
+            "nodes": len(self.nodes),
+            "reachable": sum(self.reachable),
+            "issues": [issue.as_dict() for issue in self.issues],
+            "timings": self.timings,
+        }
+
+    def __timed(self, check: str, fn: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        rsl = fn()
+        self.timings[check] = time.perf_counter() - start
+        return rsl
+
+    def __add(self, severity: Severity, check: str, message: str, node: Optional[str] = None):
+        self.issues.append(Issue(severity, check, message, node))
+
+    def __parse(self, path: Path) -> Optional[dict[str, Any]]:
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except json.JSONDecodeError as e:
+            self.__add(Severity.ERROR, "parse", f"invalid JSON: {e}")
+            return None
+        if not isinstance(data, dict):
+            self.__add(Severity.ERROR, "parse", "scenario has to be a JSON object")
+            return None
+        return data
+
+    def __check_fields(self, data: dict[str, Any]):
+        """
+        Validates the scenario itself without it's nodes and afterwards every
+        node on it's own, so one broken node doesn't hide the others.
+        """
+        raw_nodes = data.get("nodes")
+        if not isinstance(raw_nodes, list):
+            self.__add(Severity.ERROR, "fields", "nodes has to be a list")
+            raw_nodes = []
+        try:
+            Scenario.model_validate({**data, "nodes": []})
+        except ValidationError as e:
+            for error in e.errors():
+                field = ".".join(str(part) for part in error["loc"])
+                self.__add(Severity.ERROR, "fields", f"{field}: {error['msg']}")
+        for position, raw in enumerate(raw_nodes):
+            id = raw.get("id") if isinstance(raw, dict) else None
+            label = id if isinstance(id, str) and id else f"#{position}"
+            self.ids.append(id if isinstance(id, str) and id else None)
+            try:
+                self.nodes.append(Node.model_validate(raw))
+            except ValidationError as e:
+                self.nodes.append(None)
+                for error in e.errors():
+                    field = ".".join(str(part) for part in error["loc"])
+                    self.__add(Severity.ERROR, "fields", f"{field}: {error['msg']}", label)
+
+    def __check_unique_ids(self):
+        duplicates: dict[str, int] = {}
+        for position, id in enumerate(self.ids):
+            if id is None:
+                continue
+            if id in self.index:
+                duplicates[id] = duplicates.get(id, 1) + 1
+                continue
+            self.index[id] = position
+        for id, count in duplicates.items():
+            self.__add(Severity.ERROR, "unique ids", f"id is used by {count} nodes", id)
+
+    def __check_link_targets(self):
+        for node in self.nodes:
+            edges: list[int] = []
+            self.edges.append(edges)
+            if node is None or not node.links:
+                continue
+            invalid: list[str] = []
+            for link in node.links:
+                target = self.index.get(link.target)
+                if target is None:
+                    invalid.append(link.target)
+                else:
+                    edges.append(target)
+            if invalid:
+                self.__add(Severity.ERROR, "link targets", f"invalid link target(s) {', '.join(invalid)}", node.id)
+
+    def __check_start_node(self, start_node: Any):
+        if not isinstance(start_node, str):
+            # Already reported by the field validation.
+            return
+        self.start = self.index.get(start_node)
+        if self.start is None:
+            self.__add(Severity.ERROR, "start node", f"start node '{start_node}' doesn't exist")
+
+    def __check_reachability(self):
+        self.reachable = [False] * len(self.nodes)
+        if self.start is None:
+            return
+        self.reachable[self.start] = True
+        queue = deque([self.start])
+        while queue:
+            for target in self.edges[queue.popleft()]:
+                if not self.reachable[target]:
+                    self.reachable[target] = True
+                    queue.append(target)
+        for position, reachable in enumerate(self.reachable):
+            if not reachable and self.ids[position] is not None:
+                self.__add(Severity.WARNING, "reachability", "not reachable from the start node", self.ids[position])
+
+    def __check_dead_ends(self):
+        """Nodes without any link, the call ends after them."""
+        for position, node in enumerate(self.nodes):
+            if node is None or node.links:
+                continue
+            if self.reachable[position]:
+                self.__add(Severity.INFO, "dead ends", "call ends after this node", node.id)
+
+    def __check_cycles(self):
+        """
+        Finds groups of reachable nodes which can't be left again (strongly
+        connected components without an outgoing link and without a node that
+        ends the call). Uses an iterative version of Tarjan's algorithm.
+        """
+        count = len(self.nodes)
+        order = [-1] * count
+        low = [0] * count
+        on_stack = [False] * count
+        stack: list[int] = []
+        counter = 0
+        for root in range(count):
+            if order[root] != -1 or not self.reachable[root]:
+                continue
+            work = [(root, 0)]
+            while work:
+                node, edge = work.pop()
+                if edge == 0:
+                    order[node] = low[node] = counter
+                    counter += 1
+                    stack.append(node)
+                    on_stack[node] = True
+                edges = self.edges[node]
+                if edge < len(edges):
+                    work.append((node, edge + 1))
+                    target = edges[edge]
+                    if order[target] == -1:
+                        work.append((target, 0))
+                    elif on_stack[target]:
+                        low[node] = min(low[node], order[target])
+                    continue
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == order[node]:
+                    component: list[int] = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component.append(member)
+                        if member == node:
+                            break
+                    self.__check_component(component)
+
+    def __check_component(self, component: list[int]):
+        members = set(component)
+        for member in component:
+            node = self.nodes[member]
+            if node is None or not node.links:
+                return
+            if any(target not in members for target in self.edges[member]):
+                return
+        if len(component) == 1 and component[0] not in self.edges[component[0]]:
+            return
+        ids = [str(self.ids[member]) for member in sorted(component)]
+        self.__add(
+            Severity.WARNING,
+            "cycles",
+            f"the call can't leave the cycle {', '.join(ids)} anymore",
+            ids[0],
+        )
@@ -0,0 +1,312 @@
+from collections import Counter, deque
+from enum import IntEnum
+import logging
+import os
+from pathlib import Path
+import struct
+from threading import Event, Thread
+import time
+from typing import Iterable, Iterator, Optional
+
+
+MAGIC = b"HEDYLOG\x01"
+"""Start of every session log file, the last byte is the version of the format."""
+
+_RECORD = struct.Struct("<dHiBb")
+"""Time, session, node code, event and digit of a single record."""
+
+_NAME = 255
+"""
+Event type of the entries defining the id of a node code. The session field
+holds the length of the UTF-8 encoded id, which directly follows the record.
+"""
+
+_MAX_NAME = 2 ** 16 - 1
+"""Longest node id (in bytes) a name entry can hold, longer ones are cut."""
+
+_NO_NODE = -1
+_NO_DIGIT = -1
+
+
+class SessionEvent(IntEnum):
+    """What happened in a session."""
+
+    PICK_UP = 0
+    HANG_UP = 1
+    """The node is the one the visitor hung up on, none if the call had already ended."""
+    ENTER = 2
+    DIAL = 3
+    """A valid number was dialed, the node is the one it was dialed on."""
+    INVALID_DIGIT = 4
+    END = 5
+    """The call reached a node without links and ended."""
+    TIMEOUT = 6
+    """Nobody dialed while the node was repeated, the call ended."""
+
+
+class SessionLog(Thread):
+    """
+    Append-only binary log of what visitors do, 16 bytes per event. Recording
+    only appends a tuple to a bounded in-memory queue, so the controller thread
+    is never blocked by the disk. The writer thread encodes the queued events
+    in batches, syncs them to disk once per interval and rotates the file when
+    it grows beyond `max_bytes`. Only the newest `max_files` rotated files are
+    kept, all of them if it's None. If the queue is full the event is dropped
+    and counted in `dropped`. If writing fails the batch is lost, counted in
+    `errors` and the next batch starts a new file.
+
+    Nodes are stored as small codes, each file defines the codes it uses the
+    first time they appear. Thus every file can be read on it's own and stays
+    valid when the scenario is reloaded.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_bytes: int = 16 * 1024 * 1024,
+        interval: float = 1,
+        capacity: int = 65536,
+        max_files: Optional[int] = None,
+    ):
+        super().__init__(daemon=True, name="session-log")
+        if max_files is not None and max_files < 1:
+            raise ValueError(f"at least one rotated session log has to be kept, got {max_files}")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.__interval = interval
+        self.__capacity = capacity
+        self.__events: deque[tuple[float, int, Optional[str], int, int]] = deque()
+        """Appended by the controller and consumed by the writer, both ends are thread-safe."""
+        self.__stopped = Event()
+        self.__file = None
+        self.__size: int = 0
+        self.__codes: dict[str, int] = {}
+        """Codes of the node ids defined in the current file."""
+        self.dropped: int = 0
+        self.written: int = 0
+        self.errors: int = 0
+        """Failed writes, the events of each one are lost."""
+
+    def record(self, event: SessionEvent, session: int, node: Optional[str] = None, digit: int = _NO_DIGIT):
+        if len(self.__events) >= self.__capacity:
+            self.dropped += 1
+            return
+        self.__events.append((time.time(), session, node, event, digit))
+
+    def run(self):
+        self.__try_open()
+        while not self.__stopped.wait(self.__interval):
+            self.__flush()
+        self.__flush()
+        if self.__file:
+            self.__file.close()
+
+    def stop(self):
+        """Writes the remaining events and closes the file."""
+        self.__stopped.set()
+        self.join()
+
+    def __flush(self):
+        if not self.__events:
+            return
+        if not self.__file and not self.__try_open():
+            return
+        buffer = bytearray()
+        count = 0
+        while self.__events:
+            timestamp, session, node, event, digit = self.__events.popleft()
+            code = _NO_NODE
+            if node is not None:
+                code = self.__codes.get(node, _NO_NODE)
+                if code == _NO_NODE:
+                    code = self.__codes[node] = len(self.__codes)
+                    # Cutting at a character keeps the name valid UTF-8.
+                    name = node.encode()[:_MAX_NAME].decode(errors="ignore").encode()
+                    buffer += _RECORD.pack(timestamp, len(name), code, _NAME, _NO_DIGIT)
+                    buffer += name
+            buffer += _RECORD.pack(timestamp, session, code, event, digit)
+            count += 1
+        assert self.__file
+        try:
+            self.__file.write(buffer)
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+        except OSError as e:
+            self.errors += 1
+            logging.error(f"writing {count} event(s) to the session log {self.path} failed, they're lost: {e}")
+            # The file might end with a partial record, later ones would be misread.
+            self.__try_open()
+            return
+        self.written += count
+        self.__size += len(buffer)
+        if self.__size >= self.max_bytes:
+            self.__try_open()
+
+    def __try_open(self) -> bool:
+        """Opens a new file like `__open`, on errors the next flush tries again."""
+        try:
+            self.__open()
+            return True
+        except OSError as e:
+            self.errors += 1
+            self.__file = None
+            logging.error(f"opening the session log {self.path} failed: {e}")
+            return False
+
+    def __open(self):
+        """Starts a new file, an existing one is rotated first."""
+        if self.__file:
+            file, self.__file = self.__file, None
+            try:
+                file.close()
+            except OSError:
+                # Already reported by the write which failed.
+                pass
+        if self.path.exists() and self.path.stat().st_size > 0:
+            rotated = log_files(self.path)
+            number = int(rotated[-2].suffix[1:]) + 1 if len(rotated) > 1 else 1
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.{number}"))
+            if self.max_files is not None:
+                for expired in log_files(self.path)[:-self.max_files]:
+                    expired.unlink(missing_ok=True)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.__file = open(self.path, "wb")
+        self.__file.write(MAGIC)
+        self.__size = len(MAGIC)
+        self.__codes = {}
+
+
+def log_files(path: Path) -> list[Path]:
+    """The rotated files of a log (oldest first) followed by the file itself if it exists."""
+    rotated: list[tuple[int, Path]] = []
+    for candidate in path.parent.glob(f"{path.name}.*"):
+        if candidate.suffix[1:].isdigit():
+            rotated.append((int(candidate.suffix[1:]), candidate))
+    files = [candidate for _, candidate in sorted(rotated)]
+    if path.exists():
+        files.append(path)
+    return files
+
+
+def read(path: Path, block_size: int = 1024 * 1024) -> Iterator[tuple[float, int, Optional[str], SessionEvent, int]]:
+    """
+    Streams the records of a single log file as (time, session, node, event,
+    digit) with a constant amount of memory. An incomplete record at the end
+    (like after a power cut) is ignored.
+    """
+    names: dict[int, str] = {}
+    with open(path, "rb") as f:
+        header = f.read(len(MAGIC))
+        if not header:
+            # Created but nothing written yet.
+            return
+        if header != MAGIC:
+            raise ValueError(f"{path} isn't a session log")
+        rest = b""
+        while True:
+            block = f.read(block_size)
+            if not block:
+                return
+            data = rest + block
+            offset = 0
+            end = len(data)
+            while offset + _RECORD.size <= end:
+                timestamp, session, code, event, digit = _RECORD.unpack_from(data, offset)
+                if event == _NAME:
+                    if offset + _RECORD.size + session > end:
+                        break
+                    start = offset + _RECORD.size
+                    names[code] = data[start:start + session].decode()
+                    offset = start + session
+                    continue
+                offset += _RECORD.size
+                yield timestamp, session, names.get(code), SessionEvent(event), digit
+            rest = data[offset:]
+
+
+class SessionStats:
+    """
+    Aggregates session logs: how often each node was entered, where visitors
+    hung up, how often they dialed numbers without a link and how long they
+    listened to each node.
+    """
+
+    def __init__(self):
+        self.records: int = 0
+        self.calls: int = 0
+        self.completed: int = 0
+        self.timed_out: int = 0
+        self.visits: Counter[str] = Counter()
+        self.drop_offs: Counter[str] = Counter()
+        self.dials: Counter[str] = Counter()
+        self.invalid: Counter[str] = Counter()
+        self.listened: Counter[str] = Counter()
+        """Total seconds spent in each node."""
+        self.__listens: Counter[str] = Counter()
+        self.__current: dict[int, tuple[str, float]] = {}
+        """Node each session is in and when it was entered."""
+
+    def add_file(self, path: Path):
+        for timestamp, session, node, event, digit in read(path):
+            self.add(timestamp, session, node, event)
+
+    def add(self, timestamp: float, session: int, node: Optional[str], event: SessionEvent):
+        self.records += 1
+        if event is SessionEvent.DIAL or event is SessionEvent.INVALID_DIGIT:
+            if node is not None:
+                self.dials[node] += 1
+                if event is SessionEvent.INVALID_DIGIT:
+                    self.invalid[node] += 1
+            return
+        current = self.__current.pop(session, None)
+        if event is SessionEvent.PICK_UP:
+            # Without a hang up before, the process was stopped during a call.
+            self.calls += 1
+            return
+        if current:
+            self.listened[current[0]] += timestamp - current[1]
+            self.__listens[current[0]] += 1
+        if event is SessionEvent.ENTER and node is not None:
+            self.visits[node] += 1
+            self.__current[session] = (node, timestamp)
+        elif event is SessionEvent.HANG_UP and node is not None:
+            self.drop_offs[node] += 1
+        elif event is SessionEvent.END:
+            self.completed += 1
+        elif event is SessionEvent.TIMEOUT:
+            self.timed_out += 1
+
+    def as_dict(self) -> dict:
+        nodes = sorted(set(self.visits) | set(self.dials), key=lambda node: (-self.visits[node], node))
+        return {
+            "records": self.records,
+            "calls": self.calls,
+            "completed": self.completed,
+            "timed_out": self.timed_out,
+            "nodes": [
+                {
+                    "node": node,
+                    "visits": self.visits[node],
+                    "drop_offs": self.drop_offs[node],
+                    "dials": self.dials[node],
+                    "invalid_rate": self.invalid[node] / self.dials[node] if self.dials[node] else None,
+                    "mean_listen_seconds": (
+                        self.listened[node] / self.__listens[node] if self.__listens[node] else None
+                    ),
+                }
+                for node in nodes
+            ],
+        }
+
+
+def aggregate(paths: Iterable[Path]) -> SessionStats:
+    """Reads the given logs (each including it's rotated files) in order."""
+    stats = SessionStats()
+    for path in paths:
+        files = log_files(path)
+        if not files:
+            raise FileNotFoundError(f"no session log at {path}")
+        for file in files:
+            stats.add_file(file)
+    return stats
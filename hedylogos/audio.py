@@ -0,0 +1,813 @@
+from array import array
+from collections import deque
+import logging
+import mmap
+import os
+from pathlib import Path
+import shutil
+import struct
+import subprocess
+import sys
+from threading import Condition, Thread
+import time
+from typing import Callable, Optional, Union
+import wave
+
+
+class Clip:
+    """Decoded PCM audio ready to be handed to an output backend."""
+
+    MAP_THRESHOLD = 16 * 1024 * 1024
+    """WAV files bigger than this (in bytes) are memory-mapped by `load`."""
+
+    def __init__(
+        self,
+        data: Union[bytes, memoryview],
+        channels: int,
+        sample_width: int,
+        sample_rate: int,
+        mapped: bool = False,
+    ):
+        self.data = data
+        self.channels = channels
+        self.sample_width = sample_width
+        self.sample_rate = sample_rate
+        self.mapped = mapped
+        """
+        Whether the data is a view into a memory-mapped file. Such clips only
+        occupy memory while (and after) their pages are read.
+        """
+
+    @classmethod
+    def load(cls, path: Path, map_threshold: int = MAP_THRESHOLD) -> "Clip":
+        """Reads small WAV files into memory and memory-maps big ones."""
+        if os.path.getsize(path) > map_threshold:
+            return cls.map_wave_file(path)
+        return cls.from_wave_file(path)
+
+    @classmethod
+    def map_wave_file(cls, path: Path) -> "Clip":
+        """Memory-maps a PCM WAV file, nothing is read until it's played."""
+        with open(path, "rb") as f:
+            buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return cls.from_wave_buffer(buffer, mapped=True)
+
+    @classmethod
+    def from_wave_file(cls, path: Path) -> "Clip":
+        """Reads and decodes a WAV file."""
+        with wave.open(str(path), "rb") as f:
+            return cls(
+                f.readframes(f.getnframes()),
+                f.getnchannels(),
+                f.getsampwidth(),
+                f.getframerate(),
+            )
+
+    @classmethod
+    def from_wave_buffer(cls, buffer: memoryview, mapped: bool = False, strict: bool = False) -> "Clip":
+        """
+        Reads a PCM WAV file which is already in memory (or memory-mapped). The
+        audio data of the clip is a view into the buffer, nothing is copied.
+        With `strict` truncated files and odd formats are errors instead of
+        being played as far as possible.
+        """
+        if len(buffer) < 12 or buffer[0:4] != b"RIFF" or buffer[8:12] != b"WAVE":
+            raise wave.Error("not a WAV file")
+        format: Optional[tuple[int, int, int, int]] = None
+        position = 12
+        while position + 8 <= len(buffer):
+            chunk_id = bytes(buffer[position:position + 4])
+            size, = struct.unpack_from("<I", buffer, position + 4)
+            start = position + 8
+            if chunk_id == b"fmt ":
+                format = struct.unpack_from("<HHI6xH", buffer, start)
+            elif chunk_id == b"data":
+                if format is None:
+                    raise wave.Error("data chunk before fmt chunk")
+                encoding, channels, sample_rate, bits = format
+                if encoding not in (1, 0xFFFE):
+                    raise wave.Error(f"unsupported WAV encoding {encoding}, only PCM is supported")
+                if strict:
+                    if channels < 1 or sample_rate < 1 or bits not in (8, 16, 24, 32):
+                        raise wave.Error(f"unsupported format: {channels} channel(s), {sample_rate} Hz, {bits} bit")
+                    if start + size > len(buffer):
+                        raise wave.Error(f"file truncated, {start + size - len(buffer)} bytes of audio data missing")
+                    if size % (channels * bits // 8):
+                        raise wave.Error("audio data ends within a frame")
+                return cls(buffer[start:start + size], channels, bits // 8, sample_rate, mapped)
+            # Chunks are padded to an even size.
+            position = start + size + (size & 1)
+        raise wave.Error("no data chunk found")
+
+    @property
+    def frame_size(self) -> int:
+        """Size of one frame (a sample for each channel) in bytes."""
+        return self.channels * self.sample_width
+
+    @property
+    def frames(self) -> int:
+        return len(self.data) // self.frame_size
+
+    @property
+    def duration(self) -> float:
+        """Duration in seconds."""
+        return self.frames / self.sample_rate
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data)
+
+    def split(self, frames: int) -> tuple["Clip", "Clip"]:
+        """Splits the clip after the given number of frames, both parts are views."""
+        data = memoryview(self.data)
+        at = frames * self.frame_size
+        return (
+            Clip(data[:at], self.channels, self.sample_width, self.sample_rate, self.mapped),
+            Clip(data[at:], self.channels, self.sample_width, self.sample_rate, self.mapped),
+        )
+
+    def crossfade(self, following: "Clip") -> Optional[tuple["Clip", "Clip"]]:
+        """
+        Fades this clip out while the following one fades in. Returns the mixed
+        part (as long as the shorter of both clips) and the rest of the following
+        clip, None if the formats of the clips differ or aren't supported.
+        """
+        if (
+            self.channels != following.channels
+            or self.sample_rate != following.sample_rate
+            or self.sample_width != following.sample_width
+            or self.sample_width not in _SAMPLE_TYPES
+        ):
+            return None
+        typecode, center = _SAMPLE_TYPES[self.sample_width]
+        frames = min(self.frames, following.frames)
+        head, rest = following.split(frames)
+        fading_out = _samples(typecode, self.data[:frames * self.frame_size])
+        fading_in = _samples(typecode, head.data)
+        mixed = array(typecode, bytes(len(fading_in) * fading_in.itemsize))
+        channels = self.channels
+        # Integer weights (frame k of the following clip has k/frames) keep
+        # the mix exact and avoid a float per sample, each channel is mixed
+        # in one pass over it's slices.
+        weights = range(frames)
+        rounding = frames // 2
+        for channel in range(channels):
+            mixed[channel::channels] = array(typecode, [
+                ((out - center) * (frames - k) + (into - center) * k + rounding) // frames + center
+                for k, out, into in zip(weights, fading_out[channel::channels], fading_in[channel::channels])
+            ])
+        if sys.byteorder != "little":
+            mixed.byteswap()
+        return Clip(mixed.tobytes(), channels, self.sample_width, self.sample_rate), rest
+
+
+_SAMPLE_TYPES = {
+    1: ("B", 128),
+    2: ("h", 0),
+    4: ("i", 0),
+}
+"""Array typecode and the value of silence for each sample width supported by `Clip.crossfade`."""
+
+
+def _samples(typecode: str, data: Union[bytes, memoryview]) -> array:
+    samples = array(typecode)
+    samples.frombytes(data)
+    if sys.byteorder != "little":
+        samples.byteswap()
+    return samples
+
+
+class Stream:
+    """
+    A continuous output of PCM frames in one format. A channel opens a stream
+    once and writes all clips of that format into it back to back, thus they
+    play without a gap in between. Writing never blocks, a stream only takes
+    as much audio as fits into it's buffer.
+    """
+
+    BUFFER_TIME = 0.05
+    """
+    How much audio (in seconds) a stream holds ahead of what is audible. A stop
+    or a switch to another clip is heard after at most this long.
+    """
+
+    FEED_SILENCE = False
+    """Whether silence has to be written while nothing plays to keep the stream running."""
+
+    def write(self, data: memoryview) -> int:
+        """
+        Takes as many whole frames of the data as fit into the buffer without
+        blocking, returns their size in bytes.
+        """
+        raise NotImplementedError
+
+    def played(self) -> int:
+        """Number of frames played since the stream was opened."""
+        raise NotImplementedError
+
+    def discard(self):
+        """Drops the audio which was written but not played yet, if the output allows it."""
+        pass
+
+    def close(self):
+        pass
+
+
+class Backend:
+    """
+    Interface of an audio output. Each channel of the `OutputEngine` uses
+    exactly one backend for it's whole lifetime.
+    """
+
+    def open(self, channels: int, sample_width: int, sample_rate: int) -> Stream:
+        """Opens a stream, the channel reopens it only if the format of the audio changes."""
+        raise NotImplementedError
+
+    def close(self):
+        """Releases the output, called once when the engine shuts down."""
+        pass
+
+
+class _SimpleaudioStream(Stream):
+    """
+    simpleaudio can't be fed continuously, every buffer opens the device anew.
+    A write takes a whole clip once the previous one ended and the end is
+    noticed by polling, so there is a short gap between two clips. The data is
+    handed over as is, memory-mapped clips aren't copied.
+    """
+
+    def __init__(self, simpleaudio, channels: int, sample_width: int, sample_rate: int):
+        self.__simpleaudio = simpleaudio
+        self.__channels = channels
+        self.__sample_width = sample_width
+        self.__sample_rate = sample_rate
+        self.__play_object = None
+        self.__start: float = 0
+        self.__frames: int = 0
+        """Frames of the current buffer."""
+        self.__done: int = 0
+        """Frames of all previous buffers."""
+
+    def write(self, data: memoryview) -> int:
+        if self.__play_object and self.__play_object.is_playing():
+            return 0
+        self.__finish()
+        frames = len(data) // (self.__channels * self.__sample_width)
+        if not frames:
+            return 0
+        self.__play_object = self.__simpleaudio.play_buffer(
+            data[:frames * self.__channels * self.__sample_width],
+            self.__channels,
+            self.__sample_width,
+            self.__sample_rate,
+        )
+        self.__start = time.monotonic()
+        self.__frames = frames
+        return frames * self.__channels * self.__sample_width
+
+    def played(self) -> int:
+        if not self.__play_object:
+            return self.__done
+        if not self.__play_object.is_playing():
+            self.__finish()
+            return self.__done
+        elapsed = int((time.monotonic() - self.__start) * self.__sample_rate)
+        return self.__done + min(elapsed, self.__frames - 1)
+
+    def discard(self):
+        if self.__play_object:
+            self.__play_object.stop()
+        self.__finish()
+
+    def close(self):
+        self.discard()
+
+    def __finish(self):
+        if self.__play_object:
+            self.__play_object = None
+            self.__done += self.__frames
+
+
+class SimpleaudioBackend(Backend):
+    """
+    Plays the audio on the default sound device using simpleaudio. Clips are
+    played one after another with a short gap in between, see `AlsaBackend`
+    for a continuous stream.
+    """
+
+    def __init__(self):
+        import simpleaudio
+        self.__simpleaudio = simpleaudio
+
+    def open(self, channels: int, sample_width: int, sample_rate: int) -> Stream:
+        return _SimpleaudioStream(self.__simpleaudio, channels, sample_width, sample_rate)
+
+
+class _AplayStream(Stream):
+    """
+    A running aplay process reading raw PCM from a pipe. The pipe is kept small,
+    thus the audio written ahead is bounded by the pipe and the buffer of aplay.
+    """
+
+    FEED_SILENCE = True
+    """aplay only plays whole periods, the end of a clip would wait for the next one."""
+
+    PIPE_SIZE = 4096
+    """Requested size of the pipe in bytes, the kernel rounds it up to a page."""
+
+    def __init__(self, args: list[str], frame_size: int, sample_rate: int):
+        import fcntl
+        import termios
+        self.__fcntl = fcntl
+        self.__fionread = termios.FIONREAD
+        self.__process = subprocess.Popen(
+            [*args, "-B", str(int(self.BUFFER_TIME * 1_000_000))],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        assert self.__process.stdin
+        self.__stdin = self.__process.stdin
+        self.__fd = self.__stdin.fileno()
+        os.set_blocking(self.__fd, False)
+        if hasattr(fcntl, "F_SETPIPE_SZ"):
+            try:
+                fcntl.fcntl(self.__fd, fcntl.F_SETPIPE_SZ, self.PIPE_SIZE)
+            except OSError:
+                pass
+        self.__frame_size = frame_size
+        self.__sample_rate = sample_rate
+        self.__buffer_frames = int(self.BUFFER_TIME * sample_rate)
+        self.__written: int = 0
+        """Bytes written into the pipe."""
+        self.__rest = b""
+        """The part of a frame the pipe didn't take, written before anything else."""
+        self.__played: int = 0
+        self.__drained_since: Optional[float] = None
+        """When the pipe was found empty, from then on aplay plays what it has buffered."""
+
+    def write(self, data: memoryview) -> int:
+        if self.__rest:
+            self.__rest = self.__rest[self.__write(self.__rest):]
+            if self.__rest:
+                return 0
+        size = len(data) - len(data) % self.__frame_size
+        written = self.__write(data[:size])
+        # The pipe may take a partial frame, the rest of it is written later.
+        split = -written % self.__frame_size
+        if split:
+            self.__rest = bytes(data[written:written + split])
+            written += split
+        return written
+
+    def played(self) -> int:
+        queued = array("i", [0])
+        self.__fcntl.ioctl(self.__fd, self.__fionread, queued)
+        queued_frames = (queued[0] + len(self.__rest)) // self.__frame_size
+        if queued_frames:
+            self.__drained_since = None
+            buffered = self.__buffer_frames
+        else:
+            now = time.monotonic()
+            if self.__drained_since is None:
+                self.__drained_since = now
+            buffered = max(0, self.__buffer_frames - int((now - self.__drained_since) * self.__sample_rate))
+        estimate = self.__written // self.__frame_size - queued_frames - buffered
+        self.__played = max(self.__played, estimate)
+        return self.__played
+
+    def close(self):
+        try:
+            self.__stdin.close()
+        except OSError:
+            pass
+        self.__process.kill()
+        self.__process.wait()
+
+    def __write(self, data: Union[bytes, memoryview]) -> int:
+        if not data:
+            return 0
+        try:
+            written = os.write(self.__fd, data)
+        except BlockingIOError:
+            return 0
+        self.__written += written
+        return written
+
+
+class AlsaBackend(Backend):
+    """
+    Plays the audio on a specific ALSA device (e.g. `plughw:1,0`) by piping it
+    into a long-running `aplay`. The device stays open, consecutive clips play
+    without a gap. Unlike simpleaudio this allows a process to serve multiple
+    handsets each connected to it's own sound card.
+    """
+
+    FORMATS = {
+        1: "U8",
+        2: "S16_LE",
+        3: "S24_3LE",
+        4: "S32_LE",
+    }
+    """aplay sample format for each sample width in bytes."""
+
+    def __init__(self, device: Optional[str] = None):
+        if not shutil.which("aplay"):
+            raise RuntimeError("aplay (alsa-utils) is needed for the alsa backend but wasn't found")
+        self.device = device
+
+    def open(self, channels: int, sample_width: int, sample_rate: int) -> Stream:
+        args = ["aplay", "-q", "-t", "raw"]
+        if self.device:
+            args.extend(["-D", self.device])
+        args.extend([
+            "-f", self.FORMATS[sample_width],
+            "-c", str(channels),
+            "-r", str(sample_rate),
+        ])
+        return _AplayStream(args, channels * sample_width, sample_rate)
+
+
+class _NullStream(Stream):
+    """Takes audio as fast as a sound device would, measured by the clock of the backend."""
+
+    def __init__(self, backend: "NullBackend", frame_size: int, sample_rate: int):
+        self.__backend = backend
+        self.__frame_size = frame_size
+        self.__sample_rate = sample_rate
+        self.__buffer_frames = max(1, int(self.BUFFER_TIME * sample_rate))
+        self.__written: int = 0
+        """Frames written."""
+        self.__base: int = 0
+        self.__since: Optional[float] = None
+        """Since when the frames after `__base` are played, None while nothing is left to play."""
+
+    def write(self, data: memoryview) -> int:
+        played = self.played()
+        frames = min(len(data) // self.__frame_size, played + self.__buffer_frames - self.__written)
+        if frames <= 0:
+            return 0
+        if self.__since is None:
+            self.__since = self.__backend.clock()
+            self.__base = self.__written
+        self.__written += frames
+        self.__backend._on_write(data[:frames * self.__frame_size])
+        return frames * self.__frame_size
+
+    def played(self) -> int:
+        if self.__since is None:
+            return self.__written
+        played = self.__base + int((self.__backend.clock() - self.__since) * self.__sample_rate)
+        if played < self.__written:
+            return played
+        self.__since = None
+        return self.__written
+
+
+class NullBackend(Backend):
+    """
+    Discards all audio but takes as long as a sound device would to play it.
+    Used for testing without a sound device.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+
+    def open(self, channels: int, sample_width: int, sample_rate: int) -> Stream:
+        return _NullStream(self, channels * sample_width, sample_rate)
+
+    def _on_write(self, data: memoryview):
+        """Called with the audio which was written into a stream."""
+        pass
+
+
+class FileBackend(NullBackend):
+    """
+    Writes everything that was played into a WAV file, a stopped clip is cut at
+    most `Stream.BUFFER_TIME` after the stop. All clips need to have the same
+    format.
+    """
+
+    def __init__(self, path: Path, clock: Callable[[], float] = time.monotonic):
+        super().__init__(clock)
+        self.__path = path
+        self.__file: Optional[wave.Wave_write] = None
+
+    def open(self, channels: int, sample_width: int, sample_rate: int) -> Stream:
+        if not self.__file:
+            self.__file = wave.open(str(self.__path), "wb")
+            self.__file.setnchannels(channels)
+            self.__file.setsampwidth(sample_width)
+            self.__file.setframerate(sample_rate)
+        elif (
+            self.__file.getnchannels() != channels
+            or self.__file.getsampwidth() != sample_width
+            or self.__file.getframerate() != sample_rate
+        ):
+            raise ValueError(f"clip format differs from the one of {self.__path}")
+        return super().open(channels, sample_width, sample_rate)
+
+    def close(self):
+        if self.__file:
+            self.__file.close()
+            self.__file = None
+
+    def _on_write(self, data: memoryview):
+        if self.__file:
+            self.__file.writeframes(data)
+
+
+def backend_by_name(name: str) -> Backend:
+    """
+    Returns a backend by it's name as used on the command line: `simpleaudio`,
+    `alsa`, `alsa:DEVICE`, `null` or `file:PATH`.
+    """
+    if name == "simpleaudio":
+        return SimpleaudioBackend()
+    if name == "alsa":
+        return AlsaBackend()
+    if name.startswith("alsa:"):
+        return AlsaBackend(name[len("alsa:"):])
+    if name == "null":
+        return NullBackend()
+    if name.startswith("file:"):
+        return FileBackend(Path(name[len("file:"):]))
+    raise ValueError(f"unknown audio backend '{name}'")
+
+
+class _Queued:
+    """A clip which is (being) written into the stream of a channel."""
+
+    def __init__(self, clip: Clip, token: int, start: int):
+        self.token = token
+        self.mapped = clip.mapped
+        data = memoryview(clip.data).cast("B")
+        # A truncated file may end within a frame.
+        self.data = data[:len(data) - len(data) % clip.frame_size]
+        self.start = start
+        """Position of the first frame within the stream."""
+        self.end = start + len(self.data) // clip.frame_size
+        """Position of the frame after the last one within the stream."""
+        self.written: int = 0
+        """Bytes written into the stream."""
+        self.read: int = 0
+        """Bytes of a mapped clip whose pages were read in."""
+
+    @property
+    def complete(self) -> bool:
+        return self.written >= len(self.data)
+
+
+class Channel:
+    """
+    One output of the `OutputEngine`, e.g. the handset of one phone. The channel
+    keeps a stream of it's backend open and writes the queued clips into it one
+    after another, a clip starts with the frame after the last one of the
+    previous clip. Whenever a clip ends on it's own, `on_ended` is called with
+    the token the clip was queued with. Stopped clips never produce this
+    callback, thus the receiver can rely on the token to tell whether an end
+    event still belongs to the current playback. The optional `on_started` is
+    called with the token and the time (in seconds) the backend took to start
+    the playback of a clip.
+    """
+
+    def __init__(
+        self,
+        backend: Backend,
+        on_ended: Callable[[int], None],
+        condition: Condition,
+        readahead: int,
+        on_started: Optional[Callable[[int, float], None]] = None,
+    ):
+        self.__backend = backend
+        self.__on_ended = on_ended
+        self.__on_started = on_started
+        self.__condition = condition
+        self.__readahead = readahead
+        self.__pending: deque[tuple[Clip, int]] = deque()
+        """Clips which weren't written into the stream yet."""
+        self.__queued: deque[_Queued] = deque()
+        """Clips written (or being written) into the stream which didn't end yet."""
+        self.__stream: Optional[Stream] = None
+        self.__format: tuple[int, int, int] = (0, 0, 0)
+        """Channels, sample width and sample rate of the stream."""
+        self.__written: int = 0
+        """Frames written into the stream."""
+        self.__silence = b""
+
+    def play(self, clip: Clip, token: int):
+        """Stops everything and plays the given clip right away."""
+        with self.__condition:
+            self.__stop_current()
+            self.__pending.append((clip, token))
+            self.__condition.notify()
+
+    def enqueue(self, clip: Clip, token: int):
+        """Plays the clip right after everything queued before it."""
+        with self.__condition:
+            self.__pending.append((clip, token))
+            self.__condition.notify()
+
+    def stop(self):
+        """Stops the current playback and drops all queued clips."""
+        with self.__condition:
+            self.__stop_current()
+
+    def _service(self) -> Optional[memoryview]:
+        """
+        Reports ended clips and fills the stream, called by the engine with the
+        lock held. Returns the part of a mapped clip whose pages should be read
+        in next.
+        """
+        try:
+            self.__report_ended()
+            self.__feed()
+        except (OSError, ValueError) as e:
+            self.__fail(e)
+            return None
+        return self.__to_read()
+
+    def _timeout(self) -> Optional[float]:
+        """
+        How long the engine may sleep before the channel has to be serviced
+        again, None if nothing is playing.
+        """
+        if not self.__stream:
+            return None
+        if not self.__queued and not self.__pending:
+            return OutputEngine.POLL_INTERVAL if self.__stream.FEED_SILENCE else None
+        first = self.__queued[0] if self.__queued else None
+        if first and first.complete:
+            # Wake up right when the clip is expected to end.
+            remaining = (first.end - self.__stream.played()) / self.__format[2]
+            return max(0.001, min(OutputEngine.POLL_INTERVAL, remaining))
+        return OutputEngine.POLL_INTERVAL
+
+    def _close(self):
+        self.__stop_current()
+        self.__close_stream()
+        self.__backend.close()
+
+    def __report_ended(self):
+        if not self.__queued:
+            return
+        assert self.__stream
+        played = self.__stream.played()
+        while self.__queued and self.__queued[0].complete and self.__queued[0].end <= played:
+            # The callback only enqueues, it's safe to call it with the lock held.
+            self.__on_ended(self.__queued.popleft().token)
+
+    def __feed(self):
+        while True:
+            if self.__queued and not self.__queued[-1].complete:
+                entry = self.__queued[-1]
+            elif self.__pending:
+                started = self.__start()
+                if not started:
+                    return
+                entry = started
+            else:
+                if self.__stream and self.__stream.FEED_SILENCE:
+                    while self.__write(memoryview(self.__silence)):
+                        pass
+                return
+            entry.written += self.__write(entry.data[entry.written:])
+            if not entry.complete:
+                return
+
+    def __start(self) -> Optional[_Queued]:
+        """Moves the first pending clip into the stream, None if it has to wait."""
+        clip, token = self.__pending[0]
+        format = (clip.channels, clip.sample_width, clip.sample_rate)
+        start = time.perf_counter()
+        if self.__stream and format != self.__format:
+            if self.__queued:
+                # The clips in the previous format have to end first.
+                return None
+            self.__close_stream()
+        if not self.__stream:
+            self.__stream = self.__backend.open(*format)
+            self.__format = format
+            self.__written = 0
+            silence = _SAMPLE_TYPES[clip.sample_width][1] if clip.sample_width in _SAMPLE_TYPES else 0
+            self.__silence = bytes([silence]) * (clip.frame_size * max(1, int(Stream.BUFFER_TIME * clip.sample_rate)))
+        self.__pending.popleft()
+        entry = _Queued(clip, token, self.__written)
+        self.__queued.append(entry)
+        if self.__on_started:
+            self.__on_started(token, time.perf_counter() - start)
+        return entry
+
+    def __write(self, data: memoryview) -> int:
+        assert self.__stream
+        written = self.__stream.write(data)
+        self.__written += written // (self.__format[0] * self.__format[1])
+        return written
+
+    def __to_read(self) -> Optional[memoryview]:
+        if not self.__stream:
+            return None
+        played = self.__stream.played()
+        frame_size = self.__format[0] * self.__format[1]
+        for entry in self.__queued:
+            if not entry.mapped:
+                continue
+            until = min(len(entry.data), max(0, played - entry.start) * frame_size + self.__readahead)
+            if entry.read < until:
+                region = entry.data[entry.read:until]
+                entry.read = until
+                return region
+        return None
+
+    def __fail(self, error: Exception):
+        """The output broke, the clips are reported as ended and the stream is opened again for the next one."""
+        logging.error(f"audio output failed: {error}")
+        tokens = [entry.token for entry in self.__queued] + [token for _, token in self.__pending]
+        self.__queued.clear()
+        self.__pending.clear()
+        self.__close_stream()
+        for token in tokens:
+            self.__on_ended(token)
+
+    def __stop_current(self):
+        self.__pending.clear()
+        self.__queued.clear()
+        if self.__stream:
+            self.__stream.discard()
+
+    def __close_stream(self):
+        if self.__stream:
+            try:
+                self.__stream.close()
+            except OSError:
+                pass
+            self.__stream = None
+
+
+class OutputEngine(Thread):
+    """
+    Long-lived audio output driving any number of channels from a single
+    thread, each channel plays on it's own backend.
+
+    Each channel keeps one stream open and the clips are written into it in
+    small portions as it takes them, so starting a clip doesn't open the
+    device and chained clips follow each other without a gap (as far as the
+    backend allows it, see `SimpleaudioBackend`). The pages of memory-mapped
+    clips are read in ahead of the playback.
+    """
+
+    POLL_INTERVAL = 0.01
+    """How often (in seconds) the streams are filled while something plays."""
+
+    READAHEAD = 4 * 1024 * 1024
+    """How far ahead (in bytes) of the playback the pages of mapped clips are read in."""
+
+    def __init__(self, readahead: int = READAHEAD):
+        super().__init__(daemon=True, name="output-engine")
+        self.__readahead = readahead
+        self.__channels: list[Channel] = []
+        self.__closed = False
+        self.__condition = Condition()
+
+    def channel(
+        self,
+        backend: Backend,
+        on_ended: Callable[[int], None],
+        on_started: Optional[Callable[[int, float], None]] = None,
+    ) -> Channel:
+        """Adds a channel playing on the given backend."""
+        with self.__condition:
+            channel = Channel(backend, on_ended, self.__condition, self.__readahead, on_started)
+            self.__channels.append(channel)
+            return channel
+
+    def close(self):
+        """Stops all playbacks and terminates the engine thread."""
+        with self.__condition:
+            for channel in self.__channels:
+                channel.stop()
+            self.__closed = True
+            self.__condition.notify()
+
+    def run(self):
+        while True:
+            with self.__condition:
+                if self.__closed:
+                    break
+                to_read = [region for region in (channel._service() for channel in self.__channels) if region]
+                if not to_read:
+                    self.__wait()
+                    continue
+            # Fault in the pages ahead of the playback without holding the lock,
+            # so a stop isn't delayed by a slow disk.
+            for region in to_read:
+                region[::mmap.PAGESIZE].tobytes()
+        for channel in self.__channels:
+            channel._close()
+
+    def __wait(self):
+        timeouts = [
+            timeout for timeout in (channel._timeout() for channel in self.__channels)
+            if timeout is not None
+        ]
+        self.__condition.wait(min(timeouts) if timeouts else None)
@@ -0,0 +1,265 @@
+from . import binary
+from .audio import Clip
+from .compiled import CompiledScenario
+from .model import Link, Node, Nodes, Scenario
+from .simulation import Simulation
+from .stream import write_scenario
+
+import gc
+import json
+from pathlib import Path
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+from typing import Callable, Iterator, Optional
+import wave
+
+
+class ScenarioGenerator:
+    """
+    Generates synthetic scenarios for benchmarks. Every node links to it's
+    successor so the whole graph is reachable, the other links point to random
+    nodes. The audio files are silence and shared round-robin by the nodes.
+    """
+
+    def __init__(
+        self,
+        nodes: int = 10000,
+        fan_out: int = 5,
+        random_share: float = 0.2,
+        end_share: float = 0.01,
+        audio_files: int = 20,
+        audio_seconds: float = 5,
+        content_length: int = 0,
+        seed: int = 0,
+    ):
+        if not 1 <= fan_out <= 10:
+            raise ValueError(f"fan out has to be between 1 and 10, got {fan_out}")
+        self.nodes = nodes
+        self.fan_out = fan_out
+        self.random_share = random_share
+        """Share of the nodes with unnumbered (random) links."""
+        self.end_share = end_share
+        """Share of the nodes without links."""
+        self.audio_files = audio_files
+        self.audio_seconds = audio_seconds
+        self.content_length = content_length
+        """Characters of the transcript of each node."""
+        self.seed = seed
+
+    def parameters(self) -> dict:
+        return {
+            "nodes": self.nodes,
+            "fan_out": self.fan_out,
+            "random_share": self.random_share,
+            "end_share": self.end_share,
+            "audio_files": self.audio_files,
+            "audio_seconds": self.audio_seconds,
+            "content_length": self.content_length,
+            "seed": self.seed,
+        }
+
+    def resized(self, nodes: int) -> "ScenarioGenerator":
+        """The same generator for another number of nodes."""
+        return ScenarioGenerator(**(self.parameters() | {"nodes": nodes}))
+
+    def scenario(self) -> Scenario:
+        return self.settings().model_copy(update={"nodes": Nodes(list(self.generate_nodes()))})
+
+    def settings(self) -> Scenario:
+        """The scenario without any nodes."""
+        return Scenario(
+            name="Synthetic benchmark scenario",
+            description=None,
+            nodes=Nodes([]),
+            start_node="n0",
+            invalid_number_audio=self.__audio(0),
+            invalid_number_fun_audio=None,
+            internal_error_audio=self.__audio(0),
+            end_call_audio=self.__audio(0),
+        )
+
+    def generate_nodes(self) -> Iterator[Node]:
+        rnd = random.Random(self.seed)
+        content = ("Lorem ipsum dolor sit amet. " * (self.content_length // 28 + 1))[:self.content_length] or None
+        for i in range(self.nodes):
+            links: Optional[list[Link]] = None
+            if i == self.nodes - 1 or (i > 0 and rnd.random() < self.end_share):
+                links = None
+            elif rnd.random() < self.random_share:
+                targets = [i + 1] + [rnd.randrange(self.nodes) for _ in range(self.fan_out - 1)]
+                links = [Link(target=f"n{target}", number=None, weight=rnd.choice([None, 2.0])) for target in targets]
+            else:
+                targets = [i + 1] + [rnd.randrange(self.nodes) for _ in range(self.fan_out - 1)]
+                links = [Link(target=f"n{target}", number=number) for number, target in enumerate(targets)]
+            yield Node(
+                id=f"n{i}",
+                name=f"Node {i}",
+                content=content,
+                audio=self.__audio(i),
+                links=links,
+            )
+
+    def write(self, directory: Path) -> Path:
+        """Writes the scenario and it's audio files, returns the path of the scenario."""
+        (directory / "audio").mkdir(parents=True, exist_ok=True)
+        frames = int(self.audio_seconds * 44100)
+        for i in range(self.audio_files):
+            with wave.open(str(directory / self.__audio(i)), "wb") as f:
+                f.setnchannels(1)
+                f.setsampwidth(2)
+                f.setframerate(44100)
+                f.writeframes(b"\0" * (2 * frames))
+        path = directory / "scenario.json"
+        # The nodes are generated while writing, a huge scenario never is in memory at once.
+        write_scenario(path, self.settings(), self.generate_nodes())
+        return path
+
+    def __audio(self, node: int) -> str:
+        return f"audio/{node % self.audio_files}.wav"
+
+
+class Benchmark:
+    """
+    Measures the stages from loading a scenario to handling events on a
+    generated scenario. The results are plain data, so results of different
+    releases can be stored and compared.
+    """
+
+    def __init__(self, generator: ScenarioGenerator, repeat: int = 5):
+        self.generator = generator
+        self.repeat = repeat
+        self.results: dict[str, dict] = {}
+        self.memory: dict[str, float] = {}
+        """Bytes in use per 10k nodes by each representation of the scenario."""
+
+    def run(self, directory: Path) -> dict:
+        path = self.generator.write(directory)
+        scenario = Scenario.from_json(path)
+        nodes = scenario.nodes.root
+
+        self.__measure("parse_validate", lambda: Scenario.from_json(path))
+        for size in sorted({max(1, len(nodes) * factor // 8) for factor in (1, 2, 4, 8)}):
+            # The validators of Nodes are the part which depends on the whole graph.
+            data = [node.model_dump() for node in self.generator.resized(size).scenario().nodes.root]
+            self.__measure(f"nodes_validator[{size}]", lambda data=data: Nodes.model_validate(data))
+
+        def nodes_dict():
+            scenario.nodes_dict = None
+            scenario.get_nodes_dict()
+        self.__measure("get_nodes_dict", nodes_dict)
+        ids = [node.id for node in nodes]
+
+        def lookups():
+            for id in ids:
+                scenario.node_by_id(id)
+        self.__measure("node_by_id", lookups, per=len(ids))
+
+        compiled = CompiledScenario.from_scenario(scenario, path)
+        self.__measure("compile", lambda: CompiledScenario.from_scenario(scenario, path))
+        self.__measure("stream_compile", lambda: CompiledScenario.from_json(path))
+        compiled_path = binary.default_path(path)
+        binary.write(compiled, binary.source_hash(path), compiled_path)
+        self.__measure("binary_load", lambda: binary.load(compiled_path))
+
+        audio = sorted(set(compiled.audio))
+        self.__measure("audio_load", lambda: [Clip.load(file) for file in audio], per=len(audio))
+
+        def dispatch() -> int:
+            simulation = Simulation(compiled, sessions=4, seed=self.generator.seed)
+            simulation.visit(200)
+            return simulation.events
+        self.__measure("dispatch", dispatch, per=None)
+
+        def models() -> Scenario:
+            loaded = Scenario.from_json(path)
+            loaded.get_nodes_dict()
+            return loaded
+        per_10k = 10000 / len(nodes)
+        self.memory["models"] = self.__allocated(models) * per_10k
+        self.memory["compiled"] = self.__allocated(
+            lambda: CompiledScenario.from_scenario(Scenario.from_json(path), path)
+        ) * per_10k
+        # The tables of a compiled file are memory-mapped and don't show up here.
+        self.memory["binary"] = self.__allocated(lambda: binary.load(compiled_path)) * per_10k
+        # Highest use while compiling, with and without holding all models at once.
+        self.memory["compile_peak"] = self.__peak(
+            lambda: CompiledScenario.from_scenario(Scenario.from_json(path), path)
+        ) * per_10k
+        self.memory["stream_compile_peak"] = self.__peak(lambda: CompiledScenario.from_json(path)) * per_10k
+
+        return {
+            "time": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "parameters": self.generator.parameters() | {"repeat": self.repeat},
+            "results": self.results,
+            "memory": self.memory,
+        }
+
+    def __measure(self, name: str, function: Callable, per: Optional[int] = 1):
+        """
+        Runs a function `repeat` times, durations are divided by `per`. If
+        `per` is None the function returns the number of operations itself.
+        """
+        durations: list[float] = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            rsl = function()
+            duration = time.perf_counter() - start
+            durations.append(duration / (rsl if per is None else per))
+        self.results[name] = {
+            "min": min(durations),
+            "median": statistics.median(durations),
+            "mean": statistics.mean(durations),
+            "max": max(durations),
+        }
+
+    @staticmethod
+    def __allocated(build: Callable[[], object]) -> int:
+        """Bytes allocated by `build` which are still in use by it's result."""
+        # Once for the caches of the first call, they aren't part of the result.
+        build()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            rsl = build()
+            gc.collect()
+            size = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        del rsl
+        return size
+
+    @staticmethod
+    def __peak(build: Callable[[], object]) -> int:
+        """Most bytes in use at once while `build` runs."""
+        build()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            build()
+            size = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return size
+
+
+def compare(current: dict, baseline: Optional[dict]) -> list[tuple[str, float, Optional[float]]]:
+    """
+    Returns the median of each result together with the ratio to the baseline
+    (None if there is no baseline or it doesn't contain the result).
+    """
+    rsl: list[tuple[str, float, Optional[float]]] = []
+    for name, values in current["results"].items():
+        previous = baseline["results"].get(name) if baseline else None
+        ratio = values["median"] / previous["median"] if previous and previous["median"] else None
+        rsl.append((name, values["median"], ratio))
+    return rsl
+
+
+def read_results(path: Path) -> dict:
+    with open(path, "r") as f:
+        return json.load(f)
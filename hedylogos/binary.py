@@ -0,0 +1,336 @@
+from .compiled import CompiledScenario, Groups
+
+from array import array
+import hashlib
+import mmap
+import os
+from pathlib import Path
+import struct
+import sys
+from typing import Optional, Sequence
+
+
+MAGIC = b"HEDYLOGO"
+VERSION = 3
+SUFFIX = ".hedc"
+"""File extension of compiled scenarios."""
+
+_HEADER = struct.Struct("<8sHxx32s20I")
+_NONE = 0xFFFFFFFF
+
+
+class InvalidBinary(Exception):
+    """Raised when a file isn't a compiled scenario of the supported version."""
+
+
+def source_hash(path: Path) -> bytes:
+    """SHA-256 of a scenario JSON file as stored in the compiled file."""
+    return hash_file(path).digest()
+
+
+def hash_file(path: Path) -> "hashlib._Hash":
+    """SHA-256 of a file, read in blocks so big files aren't loaded at once."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest
+
+
+def default_path(path: Path) -> Path:
+    """The location of the compiled file for a scenario JSON file."""
+    return path.with_suffix(SUFFIX)
+
+
+def write(scenario: CompiledScenario, source: bytes, path: Path):
+    """
+    Writes a compiled scenario to disk. `source` is the hash of the JSON file
+    the scenario was compiled from.
+    """
+    data = encode(scenario, source, path.resolve().parent)
+    # A running exhibit loading the file never sees it partially written.
+    temporary = path.with_name(f".{path.name}.tmp")
+    with open(temporary, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def encode(scenario: CompiledScenario, source: bytes, location: Path) -> bytes:
+    """
+    Serializes a compiled scenario, audio paths are stored relative to
+    `location`. Layout (little-endian, every section aligned to 8 bytes):
+
+    - header: magic, format version, source hash, counts, audio indices of the
+      special audio files, the maximum number of repeats, the digit timeout in
+      milliseconds and the offsets of the sections
+    - string table: `u32[strings + 1]` offsets followed by the UTF-8 data
+    - audio path table: `u32[audio]` string index of each path, relative to
+      the compiled file
+    - node table: `u32[nodes]` string index of the id, `u32[nodes]` audio
+      index and `u8[nodes]` kind (see `CompiledScenario`)
+    - link table: `i32[nodes * 10]` targets of the numbers, `u32[nodes + 1]`
+      offsets into the random links, `i32[links]` random targets and
+      `f64[links]` their cumulative weights (0 if unweighted)
+    - repeat table: `f64[nodes]` seconds before each node is repeated (0 for
+      never)
+    - code table: `u32[codes]` node, `u32[codes]` string index of the digits
+      and `i32[codes]` target of each code with more than one digit
+    """
+    strings: dict[str, int] = {}
+    audio: dict[Path, int] = {}
+
+    def string(value: str) -> int:
+        if value not in strings:
+            strings[value] = len(strings)
+        return strings[value]
+
+    def audio_index(value: Optional[Path]) -> int:
+        if value is None:
+            return _NONE
+        if value not in audio:
+            audio[value] = len(audio)
+        return audio[value]
+
+    ids = array("I", (string(id) for id in scenario.ids))
+    node_audio = array("I", (audio_index(path) for path in scenario.audio))
+    specials = [
+        audio_index(scenario.invalid_number_audio),
+        audio_index(scenario.invalid_number_fun_audio),
+        audio_index(scenario.internal_error_audio),
+        audio_index(scenario.end_call_audio),
+    ]
+    audio_strings = array("I", (string(_relative(value, location)) for value in audio))
+    kinds = array("B", scenario.kinds)
+    repeat_after = array("d", scenario.repeat_after)
+    code_nodes = array("I")
+    code_strings = array("I")
+    code_targets = array("i")
+    for node, codes in scenario.codes.items():
+        for code, target in codes.items():
+            code_nodes.append(node)
+            code_strings.append(string(code))
+            code_targets.append(target)
+    targets = array("i", scenario.targets)
+    random_offsets = array("I", [0])
+    random_targets = array("i")
+    random_weights = array("d")
+    for node_targets, weights in zip(scenario.random_targets, scenario.random_weights):
+        random_targets.extend(node_targets)
+        random_weights.extend(weights if weights else [0.0] * len(node_targets))
+        random_offsets.append(len(random_targets))
+    encoded = [value.encode() for value in strings]
+    string_offsets = array("I", [0])
+    for value in encoded:
+        string_offsets.append(string_offsets[-1] + len(value))
+
+    sections = [
+        string_offsets,
+        b"".join(encoded),
+        audio_strings,
+        ids,
+        node_audio,
+        kinds,
+        targets,
+        random_offsets,
+        random_targets,
+        random_weights,
+        repeat_after,
+        code_nodes,
+        code_strings,
+        code_targets,
+    ]
+    offsets: list[int] = []
+    position = _HEADER.size
+    for section in sections:
+        position = _align(position)
+        offsets.append(position)
+        position += len(_bytes(section))
+    header = _HEADER.pack(
+        MAGIC,
+        VERSION,
+        source,
+        len(scenario),
+        len(strings),
+        len(audio),
+        len(random_targets),
+        scenario.start,
+        *specials,
+        _NONE if scenario.max_repeats is None else scenario.max_repeats,
+        len(code_nodes),
+        round(scenario.digit_timeout * 1000),
+        offsets[0],
+        offsets[2],
+        offsets[3],
+        offsets[6],
+        offsets[7],
+        offsets[9],
+        offsets[10],
+        offsets[11],
+    )
+    rsl = bytearray(header)
+    for offset, section in zip(offsets, sections):
+        rsl.extend(b"\0" * (offset - len(rsl)))
+        rsl.extend(_bytes(section))
+    return bytes(rsl)
+
+
+def read_hash(path: Path) -> bytes:
+    """Returns the hash of the source JSON stored in a compiled file."""
+    with open(path, "rb") as f:
+        return _unpack_header(f.read(_HEADER.size))[2]
+
+
+def load(path: Path) -> CompiledScenario:
+    """
+    Loads a compiled scenario without any validation, the tables are used
+    straight from a memory map of the file.
+    """
+    with open(path, "rb") as f:
+        buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    return decode(buffer, path.resolve().parent)
+
+
+def decode(buffer: memoryview, location: Path) -> CompiledScenario:
+    """
+    Reads a compiled scenario from a buffer, relative audio paths are resolved
+    against `location`. The numeric tables stay views into the buffer. Raises
+    InvalidBinary if the buffer is truncated or corrupt.
+    """
+    try:
+        return _decode(buffer, location)
+    except (IndexError, TypeError, ValueError) as e:
+        raise InvalidBinary(f"compiled scenario is corrupt: {e}")
+
+
+def _decode(buffer: memoryview, location: Path) -> CompiledScenario:
+    (
+        _, _, _,
+        node_count, string_count, audio_count, random_count, start,
+        invalid_number, invalid_number_fun, internal_error, end_call, max_repeats,
+        code_count, digit_timeout, strings_offset, audio_offset, nodes_offset,
+        targets_offset, random_offset, weights_offset, repeat_offset, codes_offset,
+    ) = _unpack_header(buffer[:_HEADER.size])
+
+    string_offsets = _table(buffer, "I", strings_offset, string_count + 1)
+    data_offset = _align(strings_offset + 4 * (string_count + 1))
+    strings = bytes(_section(buffer, data_offset, string_offsets[-1]))
+
+    def string(index: int) -> str:
+        return strings[string_offsets[index]:string_offsets[index + 1]].decode()
+
+    # The paths are stored relative to the location, normalizing drops the ".."
+    # so they're equal to the resolved paths of the JSON file (e.g. for the cache).
+    audio = [Path(os.path.normpath(location / string(index))) for index in _table(buffer, "I", audio_offset, audio_count)]
+
+    def audio_path(index: int) -> Optional[Path]:
+        return None if index == _NONE else audio[index]
+
+    id_offset = nodes_offset
+    node_audio_offset = _align(id_offset + 4 * node_count)
+    kinds_offset = _align(node_audio_offset + 4 * node_count)
+    ids = [string(index) for index in _table(buffer, "I", id_offset, node_count)]
+    node_audio = [audio[index] for index in _table(buffer, "I", node_audio_offset, node_count)]
+    kinds = _table(buffer, "B", kinds_offset, node_count)
+    targets = _table(buffer, "i", targets_offset, 10 * node_count)
+    random_offsets = _table(buffer, "I", random_offset, node_count + 1)
+    random_targets_offset = _align(random_offset + 4 * (node_count + 1))
+    all_random_targets = _table(buffer, "i", random_targets_offset, random_count)
+    all_random_weights = _table(buffer, "d", weights_offset, random_count)
+
+    code_strings_offset = _align(codes_offset + 4 * code_count)
+    code_targets_offset = _align(code_strings_offset + 4 * code_count)
+    codes: dict[int, dict[str, int]] = {}
+    for node, code, target in zip(
+        _table(buffer, "I", codes_offset, code_count),
+        _table(buffer, "I", code_strings_offset, code_count),
+        _table(buffer, "i", code_targets_offset, code_count),
+    ):
+        codes.setdefault(node, {})[string(code)] = target
+
+    fun_audio = audio_path(invalid_number_fun)
+    return CompiledScenario(
+        ids=ids,
+        kinds=kinds,
+        audio=node_audio,
+        targets=targets,
+        random_targets=Groups(all_random_targets, random_offsets),
+        random_weights=Groups(all_random_weights, random_offsets, optional=True),
+        start=start,
+        invalid_number_audio=audio[invalid_number],
+        invalid_number_fun_audio=fun_audio,
+        internal_error_audio=audio[internal_error],
+        end_call_audio=audio[end_call],
+        repeat_after=_table(buffer, "d", repeat_offset, node_count),
+        max_repeats=None if max_repeats == _NONE else max_repeats,
+        codes=codes,
+        digit_timeout=digit_timeout / 1000,
+    )
+
+
+def load_for(path: Path) -> Optional[CompiledScenario]:
+    """
+    Loads the compiled file belonging to a scenario JSON file. Returns None if
+    there is none or it was compiled from another version of the JSON file.
+    """
+    compiled = default_path(path)
+    if not compiled.exists():
+        return None
+    try:
+        if read_hash(compiled) != source_hash(path):
+            return None
+        return load(compiled)
+    except InvalidBinary:
+        return None
+
+
+def _unpack_header(data: bytes) -> tuple:
+    if len(data) < _HEADER.size:
+        raise InvalidBinary("file too short to be a compiled scenario")
+    header = _HEADER.unpack(data)
+    if header[0] != MAGIC:
+        raise InvalidBinary("not a compiled scenario")
+    if header[1] != VERSION:
+        raise InvalidBinary(f"compiled scenario has version {header[1]}, expected {VERSION}, compile (or bundle) it again")
+    return header
+
+
+def _relative(path: Path, location: Path) -> str:
+    try:
+        return os.path.relpath(path, location)
+    except ValueError:
+        # Different drive on Windows, fall back to the absolute path.
+        return str(path)
+
+
+def _align(position: int) -> int:
+    return (position + 7) & ~7
+
+
+def _bytes(section) -> bytes:
+    if isinstance(section, bytes):
+        return section
+    if sys.byteorder != "little":
+        section = array(section.typecode, section)
+        section.byteswap()
+    return section.tobytes()
+
+
+def _table(buffer: memoryview, typecode: str, offset: int, count: int) -> Sequence:
+    """
+    A table of the file as a sequence of numbers. On little-endian machines
+    this is a view into the memory map, thus nothing gets copied.
+    """
+    view = _section(buffer, offset, array(typecode).itemsize * count)
+    if sys.byteorder == "little":
+        return view.cast(typecode)
+    table = array(typecode, view.tobytes())
+    table.byteswap()
+    return table
+
+
+def _section(buffer: memoryview, offset: int, length: int) -> memoryview:
+    if offset + length > len(buffer):
+        raise InvalidBinary(f"compiled scenario truncated, section at {offset} ends after the file")
+    return buffer[offset:offset + length]
@@ -0,0 +1,183 @@
+from . import binary
+from .audio import Clip, OutputEngine
+from .compiled import CompiledScenario
+
+import json
+import mmap
+import os
+from pathlib import Path
+import shutil
+import struct
+from typing import Optional
+import wave
+
+
+MAGIC = b"HEDYBNDL"
+VERSION = 1
+SUFFIX = ".hedb"
+"""File extension of bundles."""
+
+_HEADER = struct.Struct("<8sH6xQQQQ")
+_ALIGNMENT = 16
+_COPY_BLOCK = 1024 * 1024
+
+
+class InvalidBundle(Exception):
+    """Raised when a file isn't a bundle of the supported version."""
+
+
+class Bundle:
+    """
+    A single file containing a compiled scenario and all of it's audio files,
+    the audio is deduplicated by content. The file is memory-mapped and clips
+    are views into the map, thus playing audio from a bundle neither opens any
+    files nor copies the audio data.
+
+    Layout: header (magic, version, offset and length of the compiled scenario
+    and of the index), the compiled scenario (see `binary`), the WAV files and
+    the index. The index is a JSON object mapping the name of each audio file
+    to it's offset and length. Within the compiled scenario the audio paths
+    are those names.
+    """
+
+    READAHEAD = OutputEngine.READAHEAD
+    """
+    Bytes at the start of a clip the kernel is asked to read ahead, from then on
+    the output engine reads ahead of the playback.
+    """
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            try:
+                self.__map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise InvalidBundle("file too short to be a bundle")
+        self.__buffer = memoryview(self.__map)
+        size = len(self.__buffer)
+        if size < _HEADER.size:
+            raise InvalidBundle("file too short to be a bundle")
+        (
+            magic, version,
+            scenario_offset, scenario_length, index_offset, index_length,
+        ) = _HEADER.unpack(self.__buffer[:_HEADER.size])
+        if magic != MAGIC:
+            raise InvalidBundle("not a bundle")
+        if version != VERSION:
+            raise InvalidBundle(f"bundle has version {version}, expected {VERSION}")
+        if scenario_offset + scenario_length > size or index_offset + index_length > size:
+            raise InvalidBundle("bundle is truncated")
+        try:
+            index = json.loads(bytes(self.__buffer[index_offset:index_offset + index_length]))
+            self.__audio: dict[str, tuple[int, int]] = {
+                name: (offset, length) for name, (offset, length) in index["audio"].items()
+            }
+        except (KeyError, TypeError, ValueError) as e:
+            raise InvalidBundle(f"index of the bundle is corrupt: {e}")
+        for name, (offset, length) in self.__audio.items():
+            if not isinstance(offset, int) or not isinstance(length, int):
+                raise InvalidBundle(f"index of the bundle is corrupt: invalid entry for '{name}'")
+            if offset < 0 or length < 0 or offset + length > size:
+                raise InvalidBundle(f"audio '{name}' lies outside of the bundle")
+        try:
+            self.scenario = binary.decode(
+                self.__buffer[scenario_offset:scenario_offset + scenario_length],
+                Path("."),
+            )
+        except binary.InvalidBinary as e:
+            raise InvalidBundle(str(e))
+
+    def clip(self, path: Path) -> Clip:
+        """
+        Returns the clip of an audio file within the bundle. Used as loader of
+        the `AudioCache`.
+        """
+        try:
+            offset, length = self.__audio[str(path)]
+        except KeyError:
+            raise FileNotFoundError(f"no audio '{path}' in the bundle")
+        if hasattr(self.__map, "madvise"):
+            # Let the kernel read the first pages ahead while the playback starts.
+            start = offset - offset % mmap.PAGESIZE
+            self.__map.madvise(mmap.MADV_WILLNEED, start, offset + min(length, self.READAHEAD) - start)
+        return Clip.from_wave_buffer(self.__buffer[offset:offset + length], mapped=True)
+
+    @staticmethod
+    def write(scenario: CompiledScenario, source: bytes, path: Path):
+        """
+        Packs a compiled scenario with all of it's audio into a bundle. The file
+        is written to a temporary location first and then moved into place, so
+        a running exhibit never sees a partially written bundle.
+        """
+        names: dict[Path, str] = {}
+        sources: dict[str, Path] = {}
+        for audio in dict.fromkeys(scenario.audio_paths()):
+            # Fail now instead of in the middle of a visit.
+            _check_wave(audio)
+            name = f"{binary.hash_file(audio).hexdigest()}.wav"
+            names[audio] = name
+            sources.setdefault(name, audio)
+
+        renamed = {audio: Path(name) for audio, name in names.items()}
+
+        def rename(audio: Optional[Path]) -> Optional[Path]:
+            return renamed[audio] if audio is not None else None
+
+        bundled = CompiledScenario(
+            ids=scenario.ids,
+            kinds=scenario.kinds,
+            audio=[renamed[audio] for audio in scenario.audio],
+            targets=scenario.targets,
+            random_targets=scenario.random_targets,
+            random_weights=scenario.random_weights,
+            start=scenario.start,
+            invalid_number_audio=renamed[scenario.invalid_number_audio],
+            invalid_number_fun_audio=rename(scenario.invalid_number_fun_audio),
+            internal_error_audio=renamed[scenario.internal_error_audio],
+            end_call_audio=renamed[scenario.end_call_audio],
+            repeat_after=scenario.repeat_after,
+            max_repeats=scenario.max_repeats,
+            codes=scenario.codes,
+            digit_timeout=scenario.digit_timeout,
+        )
+        compiled = binary.encode(bundled, source, Path("."))
+
+        temporary = path.with_name(f".{path.name}.tmp")
+        with open(temporary, "wb") as f:
+            f.write(b"\0" * _HEADER.size)
+            scenario_offset = f.tell()
+            f.write(compiled)
+            index: dict[str, tuple[int, int]] = {}
+            for name, audio in sources.items():
+                f.write(b"\0" * (-f.tell() % _ALIGNMENT))
+                offset = f.tell()
+                with open(audio, "rb") as source:
+                    shutil.copyfileobj(source, f, _COPY_BLOCK)
+                index[name] = (offset, f.tell() - offset)
+            index_offset = f.tell()
+            encoded_index = json.dumps({"audio": index}).encode()
+            f.write(encoded_index)
+            f.seek(0)
+            f.write(_HEADER.pack(
+                MAGIC,
+                VERSION,
+                scenario_offset,
+                len(compiled),
+                index_offset,
+                len(encoded_index),
+            ))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+
+def _check_wave(path: Path):
+    """Raises a ValueError if a file isn't a WAV file, only it's header is read."""
+    with open(path, "rb") as f:
+        try:
+            view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ValueError(f"{path}: empty file")
+    try:
+        Clip.from_wave_buffer(memoryview(view))
+    except wave.Error as e:
+        raise ValueError(f"{path}: {e}")
@@ -0,0 +1,172 @@
+from .audio import Clip
+
+from collections import OrderedDict
+import os
+from pathlib import Path
+from threading import Event, Lock
+from typing import Callable, Iterable, Optional
+
+
+class AudioCache:
+    """
+    Size bounded cache of decoded audio files. The least recently used entries
+    are evicted as soon as the total size of the cached audio data exceeds the
+    limit. Memory-mapped clips are backed by their file, they only count with
+    `MAPPED_WEIGHT` so the number of maps stays bounded as well. The cache is
+    thread safe as it's shared between the controller and the prefetch workers.
+    """
+
+    DEFAULT_LIMIT = 64 * 1024 * 1024
+    """Default size limit of the cache in bytes (64 MiB)."""
+
+    MAPPED_WEIGHT = 256 * 1024
+    """Size (in bytes) a memory-mapped clip counts with towards the limit."""
+
+    def __init__(
+        self,
+        limit: int = DEFAULT_LIMIT,
+        loader: Callable[[Path], Clip] = Clip.load,
+    ):
+        if limit < 0:
+            raise ValueError(f"cache limit has to be positive, got {limit}")
+        self.limit = limit
+        self.loader = loader
+        """Reads the audio for a path, the files on disk by default."""
+        self.size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.__entries: OrderedDict[Path, Clip] = OrderedDict()
+        self.__versions: dict[Path, Optional[tuple[int, int]]] = {}
+        """Modification time and size of each cached file when it was read."""
+        self.__loading: dict[Path, Event] = {}
+        self.__lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __contains__(self, path: Path) -> bool:
+        return path in self.__entries
+
+    def get(self, path: Path) -> Clip:
+        """
+        Returns the decoded audio of the given file. The file is only read from
+        disk if it isn't already cached.
+        """
+        while True:
+            with self.__lock:
+                clip = self.__entries.get(path)
+                if clip is not None:
+                    self.__entries.move_to_end(path)
+                    self.hits += 1
+                    return clip
+                loading = self.__loading.get(path)
+                if loading is None:
+                    self.misses += 1
+                    loading = self.__loading[path] = Event()
+                    break
+            # Another thread (most likely the prefetcher) is already decoding
+            # the file, wait for it instead of reading the file twice.
+            loading.wait()
+            if path not in self.__entries:
+                # Wasn't cached (too big or evicted right away), decode it ourselves.
+                with self.__lock:
+                    self.misses += 1
+                return self.loader(path)
+        return self.__load(path, loading)
+
+    def preload(self, path: Path) -> int:
+        """
+        Decodes a file into the cache without touching the hit/miss counters.
+        Returns the number of bytes added to the cache.
+        """
+        with self.__lock:
+            if path in self.__entries or path in self.__loading:
+                return 0
+            loading = self.__loading[path] = Event()
+        return _weight(self.__load(path, loading))
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        with self.__lock:
+            self.__entries.clear()
+            self.__versions.clear()
+            self.size = 0
+
+    def changed(self) -> list[Path]:
+        """
+        Cached files which changed on disk since they were read. Stats every
+        cached file, thus it's only called on reloads of the scenario.
+        """
+        with self.__lock:
+            versions = list(self.__versions.items())
+        return [path for path, version in versions if _version(path) != version]
+
+    def discard(self, paths: Iterable[Path]) -> int:
+        """Removes the entries of the given files, returns how many were cached."""
+        discarded = 0
+        with self.__lock:
+            for path in paths:
+                clip = self.__entries.pop(path, None)
+                if clip is None:
+                    continue
+                del self.__versions[path]
+                self.size -= _weight(clip)
+                discarded += 1
+        return discarded
+
+    def stats(self) -> dict[str, int]:
+        """Returns the counters of the cache."""
+        with self.__lock:
+            return {
+                "entries": len(self.__entries),
+                "size": self.size,
+                "limit": self.limit,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def __load(self, path: Path, loading: Event) -> Clip:
+        """Decodes a file which was registered as loading by the caller."""
+        try:
+            # Decode outside of the lock so a slow disk doesn't block other threads.
+            version = _version(path)
+            clip = self.loader(path)
+            self.__put(path, clip, version)
+            return clip
+        finally:
+            with self.__lock:
+                del self.__loading[path]
+            loading.set()
+
+    def __put(self, path: Path, clip: Clip, version: Optional[tuple[int, int]]):
+        size = _weight(clip)
+        if size > self.limit:
+            # Would evict everything else and still not fit, so don't cache it.
+            return
+        with self.__lock:
+            if path in self.__entries:
+                return
+            self.__entries[path] = clip
+            self.__versions[path] = version
+            self.size += size
+            while self.size > self.limit:
+                evicted_path, evicted = self.__entries.popitem(last=False)
+                del self.__versions[evicted_path]
+                self.size -= _weight(evicted)
+                self.evictions += 1
+
+
+def _weight(clip: Clip) -> int:
+    """Size a clip counts with towards the limit of the cache."""
+    return min(clip.nbytes, AudioCache.MAPPED_WEIGHT) if clip.mapped else clip.nbytes
+
+
+def _version(path: Path) -> Optional[tuple[int, int]]:
+    """Modification time and size of a file, None if it isn't a file on disk (e.g. bundled audio)."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,182 @@
+from .audio import Clip
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import json
+import mmap
+import os
+from pathlib import Path
+import struct
+from typing import Iterable, Optional
+import wave
+
+
+class AudioInfo:
+    """Result of inspecting one audio file."""
+
+    def __init__(
+        self,
+        path: Path,
+        error: Optional[str] = None,
+        channels: int = 0,
+        sample_width: int = 0,
+        sample_rate: int = 0,
+        frames: int = 0,
+    ):
+        self.path = path
+        self.error = error
+        """Why the file can't be played, None if it's fine."""
+        self.channels = channels
+        self.sample_width = sample_width
+        self.sample_rate = sample_rate
+        self.frames = frames
+
+    @property
+    def format(self) -> tuple[int, int, int]:
+        """Sample rate, sample width and channels."""
+        return (self.sample_rate, self.sample_width, self.channels)
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.sample_rate if self.sample_rate else 0
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the decoded audio in memory."""
+        return self.frames * self.channels * self.sample_width
+
+    def as_dict(self) -> dict:
+        return {
+            "error": self.error,
+            "channels": self.channels,
+            "sample_width": self.sample_width,
+            "sample_rate": self.sample_rate,
+            "frames": self.frames,
+        }
+
+    @classmethod
+    def from_dict(cls, path: Path, data: dict) -> "AudioInfo":
+        return cls(path, **data)
+
+    def __str__(self) -> str:
+        if self.error:
+            return f"{self.path}: {self.error}"
+        return f"{self.path}: {_format_name(self.format)}, {self.duration:.1f} s"
+
+
+def inspect(path: Path) -> AudioInfo:
+    """Parses a WAV file and checks whether it can be played."""
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return AudioInfo(path, "not found")
+    except OSError as e:
+        return AudioInfo(path, str(e))
+    if size == 0:
+        return AudioInfo(path, "empty file")
+    try:
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                kind = _other_format(buffer[:4])
+                if kind:
+                    return AudioInfo(path, f"{kind} file, only WAV is supported (see prepare)")
+                view = memoryview(buffer)
+                try:
+                    clip = Clip.from_wave_buffer(view, strict=True)
+                    info = AudioInfo(path, None, clip.channels, clip.sample_width, clip.sample_rate, clip.frames)
+                    del clip
+                finally:
+                    view.release()
+                return info
+    except (wave.Error, struct.error) as e:
+        return AudioInfo(path, str(e))
+    except OSError as e:
+        return AudioInfo(path, str(e))
+
+
+class AudioChecker:
+    """
+    Inspects all audio files of a scenario in parallel. The results are cached
+    in a JSON file and reused as long as the modification time and the size of
+    a file don't change, thus checking a big scenario again is almost instant.
+    """
+
+    def __init__(self, cache: Optional[Path] = None, jobs: Optional[int] = None):
+        self.cache = cache
+        self.jobs = jobs
+        self.inspected: int = 0
+        self.cached: int = 0
+
+    def check(self, paths: Iterable[Path]) -> list[AudioInfo]:
+        """Returns the info of each unique path, in the order of the paths."""
+        unique = list(dict.fromkeys(paths))
+        entries = self.__read_cache()
+        infos: dict[Path, AudioInfo] = {}
+        keys: dict[Path, Optional[list[int]]] = {}
+        to_inspect: list[Path] = []
+        for path in unique:
+            keys[path] = _cache_key(path)
+            entry = entries.get(str(path))
+            if keys[path] is not None and entry and entry["key"] == keys[path]:
+                infos[path] = AudioInfo.from_dict(path, entry["info"])
+            else:
+                to_inspect.append(path)
+        self.cached = len(unique) - len(to_inspect)
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            for info in executor.map(inspect, to_inspect):
+                infos[info.path] = info
+        self.inspected = len(to_inspect)
+        if to_inspect:
+            for path in to_inspect:
+                if keys[path] is not None:
+                    entries[str(path)] = {"key": keys[path], "info": infos[path].as_dict()}
+            self.__write_cache(entries)
+        return [infos[path] for path in unique]
+
+    def __read_cache(self) -> dict[str, dict]:
+        if not self.cache:
+            return {}
+        try:
+            with open(self.cache, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def __write_cache(self, entries: dict[str, dict]):
+        if not self.cache:
+            return
+        self.cache.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.cache.with_suffix(".tmp")
+        with open(temporary, "w") as f:
+            json.dump(entries, f)
+        os.replace(temporary, self.cache)
+
+
+def common_format(infos: list[AudioInfo]) -> Optional[tuple[int, int, int]]:
+    """The format most of the valid files use."""
+    formats = Counter(info.format for info in infos if not info.error)
+    return formats.most_common(1)[0][0] if formats else None
+
+
+def _cache_key(path: Path) -> Optional[list[int]]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _other_format(magic: bytes) -> Optional[str]:
+    """Recognizes common audio formats which aren't WAV."""
+    if magic[:3] == b"ID3" or (len(magic) > 1 and magic[0] == 0xFF and magic[1] & 0xE0 == 0xE0):
+        return "MP3"
+    if magic == b"OggS":
+        return "Ogg"
+    if magic == b"fLaC":
+        return "FLAC"
+    return None
+
+
+def _format_name(format: tuple[int, int, int]) -> str:
+    rate, width, channels = format
+    return f"{rate} Hz, {8 * width} bit, {'mono' if channels == 1 else f'{channels} channels'}"
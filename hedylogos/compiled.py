@@ -0,0 +1,283 @@
+from array import array
+from bisect import bisect
+from itertools import accumulate
+from pathlib import Path
+import random
+import sys
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, Optional, Sequence
+
+if TYPE_CHECKING:
+    # Only needed for compiling, running a compiled scenario doesn't load pydantic.
+    from .model import Node, Scenario
+
+
+class Groups:
+    """
+    Values of different count for each node (like the targets of the random
+    links) in two flat arrays instead of a tuple per node. Indexing returns the
+    values of a node as a slice. If `optional` is set, a group starting with
+    zero stands for None, as used for the weights.
+    """
+
+    __slots__ = ("values", "offsets", "optional")
+
+    def __init__(self, values: Sequence, offsets: Sequence[int], optional: bool = False):
+        self.values = values
+        self.offsets = offsets
+        """Start of the values of node `n` at `n`, the end at `n + 1`."""
+        self.optional = optional
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, node: int) -> Optional[Sequence]:
+        begin = self.offsets[node]
+        end = self.offsets[node + 1]
+        if self.optional and (begin == end or self.values[begin] == 0):
+            return None
+        return self.values[begin:end]
+
+    def __iter__(self) -> Iterator[Optional[Sequence]]:
+        for node in range(len(self)):
+            yield self[node]
+
+
+class CompiledScenario:
+    """
+    Read-only form of a `Scenario` the controller runs on. Nodes are addressed
+    by their index, the targets of the numbered links are stored in a flat
+    table with ten slots per node and all audio paths are already resolved.
+    Thus handling an event boils down to a few list lookups.
+
+    The tables are arrays and the random links are `Groups`, names and content
+    of the nodes aren't kept at all. A node takes about 100 bytes instead of
+    the several kilobytes of the validated models.
+    """
+
+    NO_NODE = -1
+    """Placeholder for a missing node/target in the tables."""
+
+    MENU = 0
+    """Kind of a node with numbered links, waits for the user to dial."""
+    RANDOM = 1
+    """Kind of a node with unnumbered links, continues with a random link."""
+    END = 2
+    """Kind of a node without any links, ends the call."""
+
+    __NO_TARGETS = array("i", [NO_NODE]) * 10
+
+    def __init__(
+        self,
+        ids: Sequence[str],
+        kinds: Sequence[int],
+        audio: Sequence[Path],
+        targets: Sequence[int],
+        random_targets: Groups,
+        random_weights: Groups,
+        start: int,
+        invalid_number_audio: Path,
+        invalid_number_fun_audio: Optional[Path],
+        internal_error_audio: Path,
+        end_call_audio: Path,
+        repeat_after: Sequence[float],
+        max_repeats: Optional[int],
+        codes: dict[int, dict[str, int]],
+        digit_timeout: float,
+    ):
+        self.ids = ids
+        self.kinds = kinds
+        self.audio = audio
+        self.targets = targets
+        """Index of the target for node `n` and number `d` is at `n * 10 + d`."""
+        self.random_targets = random_targets
+        self.random_weights = random_weights
+        """Cumulative weights of the random targets, None for a node if all of it's weights are equal."""
+        self.start = start
+        self.invalid_number_audio = invalid_number_audio
+        self.invalid_number_fun_audio = invalid_number_fun_audio
+        self.internal_error_audio = internal_error_audio
+        self.end_call_audio = end_call_audio
+        self.repeat_after = repeat_after
+        """Seconds without input before node `n` is played again, 0 if it's never repeated."""
+        self.max_repeats = max_repeats
+        """Repeats of a node before the call ends, None for no limit."""
+        self.codes = codes
+        """Targets of the codes with more than one digit by node, only nodes with such codes are included."""
+        self.digit_timeout = digit_timeout
+        self.__prefixes = {
+            (node, code[:length])
+            for node, node_codes in codes.items()
+            for code in node_codes
+            for length in range(1, len(code))
+        }
+        """Beginnings of the codes, dialing one of them waits for further digits."""
+
+    @classmethod
+    def from_scenario(cls, scenario: "Scenario", scenario_path: Path) -> "CompiledScenario":
+        """
+        Compiles a validated scenario. Audio paths are resolved relative to the
+        location of the scenario file.
+        """
+        return cls.from_nodes(scenario.nodes.root, lambda: scenario, scenario_path)
+
+    @classmethod
+    def from_json(cls, path: Path) -> "CompiledScenario":
+        """
+        Compiles a scenario JSON file while it's read, each node is validated
+        and compiled on it's own and dropped afterwards (see `ScenarioReader`).
+        """
+        from .stream import ScenarioReader
+
+        reader = ScenarioReader(path, skip_content=True)
+        return cls.from_nodes(reader.nodes(), reader.settings, path)
+
+    @classmethod
+    def from_nodes(cls, nodes: Iterable["Node"], settings: Callable[[], "Scenario"], scenario_path: Path) -> "CompiledScenario":
+        """
+        Compiles validated nodes in a single pass. `settings` returns the
+        scenario the nodes belong to, it's called after all nodes were read
+        (the fields of a streamed file might follow the nodes). Links can point
+        to nodes which come later, thus targets are numbered in the order they
+        appear first and mapped to the positions of the nodes at the end.
+        """
+        location = scenario_path.resolve().parent
+        resolved: dict[str, Path] = {}
+
+        def resolve(path: str) -> Path:
+            # Many nodes share the same audio, resolving hits the file system.
+            if path not in resolved:
+                resolved[path] = (location / Path(path)).resolve()
+            return resolved[path]
+
+        symbols: dict[str, int] = {}
+
+        def symbol(id: str) -> int:
+            if id not in symbols:
+                symbols[id] = len(symbols)
+            return symbols[id]
+
+        ids: list[str] = []
+        audio: list[Path] = []
+        kinds = array("B")
+        targets = array("i")
+        random_offsets = array("I", [0])
+        random_targets = array("i")
+        # Cumulative weights, zeros if all weights of the node are equal.
+        random_weights = array("d")
+        # -1 where the value of the scenario applies, it's only known at the end.
+        repeat_after = array("d")
+        codes: dict[int, dict[str, int]] = {}
+        for i, node in enumerate(nodes):
+            # The models are dropped after compiling, interning leaves a single copy of each id.
+            ids.append(sys.intern(node.id))
+            symbol(node.id)
+            audio.append(resolve(node.audio))
+            repeat_after.append(node.repeat_after if node.repeat_after is not None else -1.0)
+            targets.extend(cls.__NO_TARGETS)
+            if not node.links:
+                kinds.append(cls.END)
+            elif node.has_unnumbered_links():
+                kinds.append(cls.RANDOM)
+                random_targets.extend(symbol(link.target) for link in node.links)
+                weights = [link.weight if link.weight else 1.0 for link in node.links]
+                if all(weight == weights[0] for weight in weights):
+                    random_weights.extend(0.0 for _ in weights)
+                else:
+                    random_weights.extend(accumulate(weights))
+            else:
+                kinds.append(cls.MENU)
+                # The first link wins if a number or code is used twice.
+                for link in node.links:
+                    code = str(link.number) if link.number is not None else link.code
+                    if code is None:
+                        continue
+                    if len(code) > 1:
+                        codes.setdefault(i, {}).setdefault(code, symbol(link.target))
+                    elif targets[10 * i + int(code)] == cls.NO_NODE:
+                        targets[10 * i + int(code)] = symbol(link.target)
+            random_offsets.append(len(random_targets))
+
+        scenario = settings()
+        positions = array("i", [cls.NO_NODE]) * len(symbols)
+        for i, id in enumerate(ids):
+            positions[symbols[id]] = i
+        if scenario.start_node not in symbols or positions[symbols[scenario.start_node]] == cls.NO_NODE:
+            raise KeyError(f"no Node for start_node '{scenario.start_node}' found")
+        missing = [id for id, number in symbols.items() if positions[number] == cls.NO_NODE]
+        if missing:
+            raise KeyError(f"no Node for link target(s) '{', '.join(missing)}' found")
+        for table in (targets, random_targets):
+            for j, target in enumerate(table):
+                if target != cls.NO_NODE:
+                    table[j] = positions[target]
+        for node_codes in codes.values():
+            for code, target in node_codes.items():
+                node_codes[code] = positions[target]
+        default_repeat = scenario.repeat_after if scenario.repeat_after else 0.0
+        for j, value in enumerate(repeat_after):
+            if value < 0:
+                repeat_after[j] = default_repeat
+        return cls(
+            ids=ids,
+            kinds=kinds,
+            audio=audio,
+            targets=targets,
+            random_targets=Groups(random_targets, random_offsets),
+            random_weights=Groups(random_weights, random_offsets, optional=True),
+            start=positions[symbols[scenario.start_node]],
+            invalid_number_audio=resolve(scenario.invalid_number_audio),
+            invalid_number_fun_audio=resolve(scenario.invalid_number_fun_audio) if scenario.invalid_number_fun_audio else None,
+            internal_error_audio=resolve(scenario.internal_error_audio),
+            end_call_audio=resolve(scenario.end_call_audio),
+            repeat_after=repeat_after,
+            max_repeats=scenario.max_repeats,
+            codes=codes,
+            digit_timeout=scenario.digit_timeout,
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def target(self, node: int, number: int) -> int:
+        """Returns the node reached by dialing a number or `NO_NODE`."""
+        return self.targets[10 * node + number]
+
+    def code_target(self, node: int, digits: str) -> int:
+        """Returns the node reached by dialing a sequence of digits or `NO_NODE`."""
+        if len(digits) == 1:
+            return self.target(node, int(digits))
+        codes = self.codes.get(node)
+        return codes.get(digits, self.NO_NODE) if codes else self.NO_NODE
+
+    def expects_more(self, node: int, digits: str) -> bool:
+        """Whether the dialed digits are the beginning of a longer code of the node."""
+        return node in self.codes and (node, digits) in self.__prefixes
+
+    def random_target(self, node: int) -> int:
+        """Selects one of the targets of a node with unnumbered links."""
+        targets = self.random_targets[node]
+        weights = self.random_weights[node]
+        if weights is None:
+            return targets[int(random.random() * len(targets))]
+        return targets[bisect(weights, random.random() * weights[-1])]
+
+    def successors(self, node: int) -> list[int]:
+        """All nodes which can follow the given one."""
+        if self.kinds[node] == self.RANDOM:
+            return list(self.random_targets[node])
+        rsl = [target for target in self.targets[10 * node:10 * node + 10] if target != self.NO_NODE]
+        if node in self.codes:
+            rsl.extend(self.codes[node].values())
+        return rsl
+
+    def audio_paths(self) -> list[Path]:
+        """All audio files used in the scenario."""
+        paths = [
+            self.invalid_number_audio,
+            self.internal_error_audio,
+            self.end_call_audio,
+        ]
+        if self.invalid_number_fun_audio:
+            paths.append(self.invalid_number_fun_audio)
+        paths.extend(self.audio)
+        return paths
@@ -1,12 +1,19 @@
-from .model import Node, Scenario
+from .analytics import SessionEvent, SessionLog
+from .audio import Backend, Channel, Clip, OutputEngine, SimpleaudioBackend
+from .cache import AudioCache
+from .compiled import CompiledScenario
+from .metrics import Histogram, Metrics
+from .prefetch import Prefetcher
+from .scheduler import Scheduler, Timer
 
+from collections import deque
 from enum import Enum
-import queue
+from functools import partial
+import logging
 from pathlib import Path
-from threading import Thread
-from typing import Optional
-
-import simpleaudio
+from threading import Condition, Thread
+import time
+from typing import Callable, Optional, Sequence
 
 
 class _Action(str, Enum):
@@ -17,40 +24,208 @@ class _Action(str, Enum):
     DIAL = "dial"
     QUIT = "quit"
     PLAYBACK_ENDED = "playback_ended"
+    RELOAD = "reload"
+    CHAIN_READY = "chain_ready"
+    TIMEOUT = "timeout"
+    DIGIT_TIMEOUT = "digit_timeout"
+
+
+_NO_TOKEN = -1
+"""Token of clips whose end isn't of interest, like the mixed part of a crossfade."""
 
 
 class _Command:
-    def __init__(self, action: _Action, number: Optional[int]=None):
+    def __init__(
+        self,
+        action: _Action,
+        number: Optional[int]=None,
+        generation: Optional[int]=None,
+        session: int=0,
+        scenario: Optional[CompiledScenario]=None,
+        chain: Optional["_Chain"]=None,
+    ):
         self.action = action
         self.number = number
+        self.generation = generation
+        self.session = session
+        self.scenario = scenario
+        self.chain = chain
+        """Audio files which changed on disk, for a reload."""
+        self.digits: list[int] = [number] if number is not None else []
+        """Digits of a dial command, several if they were dialed in a burst (see `_CommandQueue`)."""
+        self.queued: float = 0
+        """When the command was queued, only set if metrics are enabled."""
 
 
-class Player(Thread):
-    def __init__(self, path: Path, queue: queue.Queue):
-        super().__init__()
-        self.__path = path
-        self.__queue = queue
-        self.__player: Optional[simpleaudio.PlayObject] = None
-        self.__manual_stop: bool = False
-    
-    def run(self):
-        wave = simpleaudio.WaveObject.from_wave_file(str(self.__path))
-        self.__player = wave.play()
-        self.__player.wait_done()
-        if not self.__manual_stop:
-            self.__queue.put(_Command(_Action.PLAYBACK_ENDED))
-    
-    def stop(self):
-        if not self.__player:
-            return
-        self.__manual_stop = True
-        self.__player.stop()
+class _CommandQueue:
+    """
+    Commands for the controller thread. Hang ups and quit are urgent and
+    handed out before everything else. A hang up drops the commands of it's
+    session which were queued after the last pick up, they belong to the call
+    which just ended. Digits of a session dialed while the controller was busy
+    are handed out together as a single dial command.
+    """
+
+    _DROPPED_BY_HANG_UP = (_Action.DIAL, _Action.PLAYBACK_ENDED, _Action.CHAIN_READY)
+
+    def __init__(self):
+        self.__condition = Condition()
+        self.__urgent: deque[_Command] = deque()
+        self.__normal: deque[_Command] = deque()
+        self.dropped: int = 0
+
+    def __len__(self) -> int:
+        return len(self.__urgent) + len(self.__normal)
+
+    def put(self, command: _Command):
+        with self.__condition:
+            if command.action is _Action.QUIT:
+                self.__urgent.append(command)
+            elif command.action is _Action.HANG_UP:
+                self.__put_hang_up(command)
+            else:
+                self.__normal.append(command)
+            self.__condition.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[_Command]:
+        """Waits at most `timeout` seconds for a command, None if there is none until then."""
+        with self.__condition:
+            if not self.__urgent and not self.__normal:
+                self.__condition.wait(timeout)
+            if self.__urgent:
+                return self.__urgent.popleft()
+            if not self.__normal:
+                return None
+            command = self.__normal.popleft()
+            if command.action is _Action.DIAL:
+                self.__take_burst(command)
+            return command
+
+    def __put_hang_up(self, command: _Command):
+        normal = self.__normal
+        pick_up = -1
+        for i in range(len(normal) - 1, -1, -1):
+            if normal[i].session == command.session and normal[i].action is _Action.PICK_UP:
+                pick_up = i
+                break
+        kept = deque(
+            queued for i, queued in enumerate(normal)
+            if i <= pick_up
+            or queued.session != command.session
+            or queued.action not in self._DROPPED_BY_HANG_UP
+        )
+        self.dropped += len(normal) - len(kept)
+        self.__normal = kept
+        if pick_up >= 0:
+            # The pick up has to be handled first, otherwise the phone would end up off the hook.
+            kept.append(command)
+        else:
+            self.__urgent.append(command)
+
+    def __take_burst(self, command: _Command):
+        """Moves the following digits of the session into the command, up to it's next command of another kind."""
+        taken: set[int] = set()
+        for i, queued in enumerate(self.__normal):
+            if queued.session != command.session:
+                continue
+            if queued.action is not _Action.DIAL:
+                break
+            command.digits.extend(queued.digits)
+            taken.add(i)
+        if taken:
+            self.__normal = deque(queued for i, queued in enumerate(self.__normal) if i not in taken)
+
+
+class _Chain:
+    """
+    The clip following the current playback of a session without any input,
+    i.e. the audio of the chosen random link or the end of the call. It's
+    loaded while the current clip plays and queued right behind it.
+    """
+
+    __slots__ = ("after", "node", "path", "tail", "loaded", "clips", "queued", "held")
+
+    def __init__(self, after: int, node: int, path: Path, tail: Optional[Clip]):
+        self.after = after
+        """Generation of the playback the clip follows."""
+        self.node = node
+        """Node which becomes the current one once the clip starts, NO_NODE for the end of the call."""
+        self.path = path
+        self.tail = tail
+        """End of the current clip held back for the crossfade."""
+        self.loaded: bool = False
+        self.clips: Optional[list[Clip]] = None
+        """What will be queued, None until loaded or if loading failed."""
+        self.queued: bool = False
+        self.held: Optional[Clip] = None
+        """End of the queued clip held back for the crossfade into the next chain."""
+
+
+class _Session:
+    """
+    State of one handset. All sessions of a controller share the scenario and
+    the audio cache, a session itself is just a few numbers and it's output.
+    A call keeps the version of the scenario it started with even if the
+    scenario is reloaded in the meantime.
+    """
+
+    __slots__ = (
+        "index",
+        "output",
+        "scenario",
+        "prefetch_paths",
+        "node",
+        "generation",
+        "plays_invalid_audio",
+        "played_normal_invalid_audio",
+        "started_by",
+        "chain",
+        "timer",
+        "repeats",
+        "digits",
+        "digit_timer",
+    )
+
+    def __init__(
+        self,
+        index: int,
+        output: Channel,
+        scenario: CompiledScenario,
+        prefetch_paths: list[Optional[list[Path]]],
+    ):
+        self.index = index
+        self.output = output
+        self.scenario = scenario
+        self.prefetch_paths = prefetch_paths
+        """Memoized prefetch paths of each node of the scenario."""
+        self.node: int = CompiledScenario.NO_NODE
+        self.generation: int = 0
+        """
+        Incremented with every started or stopped playback. End events of the
+        output carry the generation of their playback, stale ones are ignored.
+        """
+        self.plays_invalid_audio: bool = False
+        self.played_normal_invalid_audio: int = 0
+        self.started_by: Optional[tuple[int, _Command]] = None
+        """Generation of the latest playback and the command causing it, only set if metrics are enabled."""
+        self.chain: Optional[_Chain] = None
+        self.timer: Optional[Timer] = None
+        """Repeats the current node if nobody dials, only set while waiting for input."""
+        self.repeats: int = 0
+        """How many times the current node was repeated since the last input."""
+        self.digits: str = ""
+        """Digits dialed so far which are the beginning of a longer code."""
+        self.digit_timer: Optional[Timer] = None
 
 
 class Controller(Thread):
     """
     The controller handles the playback of the audio files and reacts to events
-    with the phone.
+    with the phones. Each phone (or keyboard) is a session with it's own output
+    backend, all sessions are served by the thread of the controller and a
+    single output engine thread. Timeouts are timers of a scheduler run by the
+    controller thread in between the events, they don't need threads of their
+    own.
     """
 
     PLAY_NORMAL_MESSAGE = 2
@@ -61,135 +236,601 @@ class Controller(Thread):
     fourth time the fun message will be played.
     """
 
-    def __init__(self, scenario: Scenario, scenario_path: Path):
+    def __init__(
+        self,
+        scenario: CompiledScenario,
+        cache_limit: int = AudioCache.DEFAULT_LIMIT,
+        prefetch_depth: int = 1,
+        prefetch_budget: int = 32 * 1024 * 1024,
+        backends: Optional[Sequence[Backend]] = None,
+        loader: Optional[Callable[[Path], Clip]] = None,
+        stream_threshold: int = OutputEngine.READAHEAD,
+        metrics: Optional[Metrics] = None,
+        output: Optional[OutputEngine] = None,
+        on_node: Optional[Callable[[int, int], None]] = None,
+        gapless: bool = True,
+        crossfade: float = 0,
+        session_log: Optional[SessionLog] = None,
+        clock: Callable[[], float] = time.monotonic,
+        on_timeout: Optional[Callable[[int], None]] = None,
+    ):
         super().__init__()
         self.__scenario = scenario
-        self.__scenario_location = scenario_path.resolve().parent
-        self.__queue: queue.Queue = queue.Queue()
-        self.__player: Optional[Player] = None
-        self.__current_node: Optional[Node] = None
-        self.__plays_invalid_audio: bool = False
-        self.__played_normal_invalid_audio: int = 0
-    
-    def pick_up(self):
+        self.__gapless = gapless
+        """Whether random links and the end of a call are queued right behind the current clip."""
+        self.__crossfade = crossfade if gapless else 0
+        """Length (in seconds) of the crossfade between chained clips."""
+        if loader is None:
+            # Big files are mapped and read while they play, no need to read them up front.
+            loader = partial(Clip.load, map_threshold=stream_threshold)
+        self.__metrics = metrics
+        if metrics:
+            loader = metrics.timed("audio_load_seconds", loader)
+            self.__queue_wait = metrics.histogram("queue_wait_seconds")
+            self.__queue_depth = metrics.histogram("queue_depth", bounds=Histogram.COUNTS)
+            self.__handler_time = {
+                action: metrics.histogram("handler_seconds", {"action": action.value})
+                for action in _Action
+            }
+            self.__playback_start = metrics.histogram("playback_start_seconds")
+            self.__event_to_playback = {
+                action: metrics.histogram("event_to_playback_seconds", {"action": action.value})
+                for action in (_Action.PICK_UP, _Action.DIAL, _Action.PLAYBACK_ENDED)
+            }
+        self.__session_log = session_log
+        """Receives what the visitors do, for the analysis of their paths."""
+        self.__command: Optional[_Command] = None
+        """The command currently handled."""
+        self.cache = AudioCache(cache_limit, loader)
+        """Decoded audio shared by all playbacks of the controller."""
+        self.__prefetcher: Optional[Prefetcher] = None
+        if prefetch_depth > 0:
+            self.__prefetcher = Prefetcher(self.cache, prefetch_depth, prefetch_budget)
+        self.__prefetch_paths: list[Optional[list[Path]]] = [None] * len(scenario)
+        self.__queue = _CommandQueue()
+        self.__stale: int = 0
+        """Commands skipped because their playback was superseded."""
+        self.__output = output if output else OutputEngine()
+        self.__on_node = on_node
+        """Called with the session and the node whenever a session enters a node."""
+        self.__on_timeout = on_timeout
+        """Called with the session when a call ended because nobody dialed."""
+        self.__scheduler = Scheduler(clock)
+        if not backends:
+            backends = [SimpleaudioBackend()]
+        self.__sessions: list[_Session] = [
+            _Session(index, self.__output.channel(
+                backend,
+                partial(self.__on_output_ended, index),
+                partial(self.__on_output_started, index) if metrics else None,
+            ), scenario, self.__prefetch_paths)
+            for index, backend in enumerate(backends)
+        ]
+
+    @property
+    def sessions(self) -> int:
+        """Number of handsets served by the controller."""
+        return len(self.__sessions)
+
+    def pick_up(self, session: int = 0):
         """Someone picked up the phone."""
-        self.__queue.put(_Command(_Action.PICK_UP))
+        self.__put(_Command(_Action.PICK_UP, session=session))
 
-    def hang_up(self):
+    def hang_up(self, session: int = 0):
         """The phone was hung up therefore ending the execution and resetting."""
-        self.__queue.put(_Command(_Action.HANG_UP))
+        self.__put(_Command(_Action.HANG_UP, session=session))
 
-    def dial(self, number: int):
+    def dial(self, number: int, session: int = 0):
         """A number input occurred."""
-        self.__queue.put(_Command(_Action.DIAL, number))
+        self.__put(_Command(_Action.DIAL, number, session=session))
     
     def quit(self):
         """Quit execution."""
-        self.__queue.put(_Command(_Action.QUIT))
+        self.__put(_Command(_Action.QUIT))
+
+    def reload(self, scenario: CompiledScenario):
+        """
+        Replaces the scenario. Calls which are running continue on the old
+        version, every call started afterwards uses the new one. The cached
+        audio is reused by the new version, except files changed on disk since
+        they were read.
+        """
+        self.__put(_Command(_Action.RELOAD, scenario=scenario))
 
     def run(self):
+        self.__output.start()
         while True:
-            command = self.__queue.get()
-            if command.action is _Action.PICK_UP:
-                self.__on_pick_up()
-            elif command.action is _Action.HANG_UP:
-                self.__on_hang_up()
-            elif command.action is _Action.DIAL:
-                self.__on_dial(command)
-            elif command.action is _Action.PLAYBACK_ENDED:
-                self.__on_playback_ended()
-            elif command.action is _Action.QUIT:
-                self.__on_quit()
-                break
-        
-    def check_paths(self):
-        errors_present: bool = False
-        paths: list[str] = [
-            self.__scenario.invalid_number_audio,
-            self.__scenario.internal_error_audio,
-            self.__scenario.end_call_audio,
-        ]
-        if self.__scenario.invalid_number_fun_audio:
-            paths.append(self.__scenario.invalid_number_fun_audio)
-        paths.extend([node.audio for node in self.__scenario.nodes.root])
-        for path in paths:
-            absolute_path = self.__resolve_path(path)
-            if not absolute_path.exists():
-                print(f"{absolute_path} not found")
-                errors_present = True
-        if not errors_present:
-            print("All paths are valid.")
+            command = self.__queue.get(self.__scheduler.timeout())
+            if command is not None and not self.__dispatch(command):
+                return
+            self.__scheduler.run_due()
+
+    def process_pending(self) -> bool:
+        """
+        Handles all queued commands and due timers without blocking, for driving
+        the controller without it's thread (see `simulation`). Returns False
+        after a quit.
+        """
+        while True:
+            command = self.__queue.get(0)
+            if command is None:
+                if not self.__scheduler.run_due():
+                    return True
+                continue
+            if not self.__dispatch(command):
+                return False
+
+    def next_deadline(self) -> Optional[float]:
+        """When the next timer of the controller is due (on it's clock), None if there is none."""
+        return self.__scheduler.next_deadline()
+
+    @property
+    def dropped(self) -> int:
+        """Commands which were dropped because they belonged to a call or playback which was over."""
+        return self.__queue.dropped + self.__stale
+
+    def __dispatch(self, command: _Command) -> bool:
+        if self.__is_stale(command):
+            self.__stale += 1
+            return True
+        if not self.__metrics:
+            return self.__handle(command)
+        start = time.perf_counter()
+        self.__queue_wait.observe(start - command.queued)
+        self.__queue_depth.observe(len(self.__queue))
+        running = self.__handle(command)
+        self.__handler_time[command.action].observe(time.perf_counter() - start)
+        return running
+
+    def __handle(self, command: _Command) -> bool:
+        """Handles a command, returns False if the controller should stop."""
+        self.__command = command
+        session = self.__sessions[command.session]
+        if command.action is _Action.PICK_UP:
+            self.__on_pick_up(session)
+        elif command.action is _Action.HANG_UP:
+            self.__on_hang_up(session)
+        elif command.action is _Action.DIAL:
+            self.__on_dial(session, command)
+        elif command.action is _Action.PLAYBACK_ENDED:
+            chain = session.chain
+            if chain and chain.queued and command.generation == chain.after:
+                self.__on_chain_started(session, chain)
+            else:
+                self.__on_playback_ended(session)
+        elif command.action is _Action.TIMEOUT:
+            self.__on_inactivity(session)
+        elif command.action is _Action.DIGIT_TIMEOUT:
+            self.__on_digit_timeout(session)
+        elif command.action is _Action.CHAIN_READY and command.chain is not None:
+            self.__on_chain_ready(session, command.chain)
+        elif command.action is _Action.RELOAD and command.scenario is not None:
+            self.__on_reload(command.scenario)
+        elif command.action is _Action.QUIT:
+            self.__on_quit()
+            return False
+        return True
+
+    def __is_stale(self, command: _Command) -> bool:
+        """Whether the command belongs to a playback which was superseded in the meantime."""
+        session = self.__sessions[command.session]
+        if command.action is _Action.PLAYBACK_ENDED:
+            chain = session.chain
+            return command.generation != session.generation and not (
+                chain and chain.queued and command.generation == chain.after
+            )
+        if command.action is _Action.CHAIN_READY:
+            return command.chain is None or command.chain is not session.chain
+        if command.action is _Action.TIMEOUT:
+            return command.generation != session.generation
+        return False
+
+    def __put(self, command: _Command):
+        if not 0 <= command.session < len(self.__sessions):
+            raise ValueError(f"no session {command.session}, the controller has {len(self.__sessions)}")
+        if self.__metrics:
+            command.queued = time.perf_counter()
+        self.__queue.put(command)
     
-    def __on_pick_up(self):
-        if self.__player:
-            self.__player.stop()
-        self.__current_node = self.__scenario.start()
-        self.__start_playback(self.__current_node.audio)
-
-    def __on_hang_up(self):
-        self.__current_node = None
-        if self.__player:
-            self.__player.stop()
-
-    def __on_dial(self, command: _Command):
-        if not self.__current_node:
+    def __on_pick_up(self, session: _Session):
+        self.__stop_playback(session)
+        # A new call starts on the latest version of the scenario.
+        session.scenario = self.__scenario
+        session.prefetch_paths = self.__prefetch_paths
+        session.repeats = 0
+        self.__clear_digits(session)
+        self.__record(SessionEvent.PICK_UP, session)
+        self.__enter_node(session, session.scenario.start)
+
+    def __on_hang_up(self, session: _Session):
+        self.__record(SessionEvent.HANG_UP, session, session.node)
+        session.node = CompiledScenario.NO_NODE
+        self.__clear_digits(session)
+        if self.__prefetcher:
+            self.__prefetcher.cancel(session.index)
+        self.__stop_playback(session)
+
+    def __on_dial(self, session: _Session, command: _Command):
+        """
+        Handles the digits of a dial command. If there are several (a burst),
+        the nodes reached by the first ones are entered without loading their
+        audio, only the last one is played.
+        """
+        if session.node == CompiledScenario.NO_NODE:
+            return
+        if not command.digits:
+            raise RuntimeError("__on_dial called without a number")
+        session.repeats = 0
+        self.__scheduler.cancel(session.timer)
+        session.timer = None
+        silent = False
+        """Whether a node was entered without playing it."""
+        for i, number in enumerate(command.digits):
+            if session.node == CompiledScenario.NO_NODE:
+                return
+            target = self.__add_digit(session, number)
+            if target is None:
+                continue
+            if i == len(command.digits) - 1:
+                self.__follow(session, target, number)
+                return
+            if target == CompiledScenario.NO_NODE:
+                self.__record(SessionEvent.INVALID_DIGIT, session, session.node, number)
+                continue
+            self.__record(SessionEvent.DIAL, session, session.node, number)
+            self.__enter_node(session, target, play=False)
+            silent = True
+        if silent:
+            # The burst ended within a code, the node it led to still has to be played.
+            self.__stop_playback(session)
+            self.__play_node(session)
+            self.__prefetch(session)
+
+    def __add_digit(self, session: _Session, number: int) -> Optional[int]:
+        """
+        Adds a digit to the ones dialed before. Returns the node reached by
+        them, `NO_NODE` if they are invalid and None if they are the beginning
+        of a longer code, then the call waits for further digits.
+        """
+        scenario = session.scenario
+        if not session.digits and session.node not in scenario.codes:
+            # Most nodes only have numbers, no need to collect digits for them.
+            return scenario.target(session.node, number)
+        digits = session.digits + str(number)
+        self.__clear_digits(session)
+        if scenario.expects_more(session.node, digits):
+            session.digits = digits
+            session.digit_timer = self.__scheduler.call_later(
+                scenario.digit_timeout,
+                partial(self.__on_timer, _Action.DIGIT_TIMEOUT, session.index, session.generation),
+            )
+            return None
+        return scenario.code_target(session.node, digits)
+
+    def __follow(self, session: _Session, target: int, number: int):
+        """Enters the node reached by dialing, `number` is the last digit dialed."""
+        if target == CompiledScenario.NO_NODE:
+            self.__record(SessionEvent.INVALID_DIGIT, session, session.node, number)
+            self.__on_invalid_number(session)
             return
-        if command.number is None or not isinstance(command.number, int):
-            raise RuntimeError(f"__on_dial called without a number, type of command.number {type(command.number)}")
-        target = self.__current_node.next_node_id_by_number(command.number)
-        if not target:
-            self.__on_invalid_number()
+        self.__record(SessionEvent.DIAL, session, session.node, number)
+        self.__stop_playback(session)
+        self.__enter_node(session, target)
+
+    def __on_digit_timeout(self, session: _Session):
+        """No further digit was dialed, the ones so far are taken as they are."""
+        session.digit_timer = None
+        digits = session.digits
+        session.digits = ""
+        if session.node == CompiledScenario.NO_NODE or not digits:
             return
-        if self.__player:
-            self.__player.stop()
-        self.__current_node = self.__scenario.node_by_id(target)
-        self.__start_playback(self.__current_node.audio)
+        self.__follow(session, session.scenario.code_target(session.node, digits), int(digits[-1]))
+
+    def __clear_digits(self, session: _Session):
+        session.digits = ""
+        self.__scheduler.cancel(session.digit_timer)
+        session.digit_timer = None
     
-    def __on_invalid_number(self):
-        if self.__player:
-            self.__player.stop()
-        path = self.__scenario.invalid_number_audio
+    def __on_invalid_number(self, session: _Session):
+        self.__stop_playback(session)
+        path = session.scenario.invalid_number_audio
         # See documentation of `Controller.PLAY_NORMAL_MESSAGE` for more
         # Information about this. Why? Because it's fun, that's why.
-        if self.__scenario.invalid_number_fun_audio:
-            if self.__played_normal_invalid_audio == Controller.PLAY_NORMAL_MESSAGE:
-                path = self.__scenario.invalid_number_fun_audio
-                self.__played_normal_invalid_audio = 0
+        if session.scenario.invalid_number_fun_audio:
+            if session.played_normal_invalid_audio == Controller.PLAY_NORMAL_MESSAGE:
+                path = session.scenario.invalid_number_fun_audio
+                session.played_normal_invalid_audio = 0
             else:
-                self.__played_normal_invalid_audio += 1
-        self.__start_playback(path)
-        self.__plays_invalid_audio = True
+                session.played_normal_invalid_audio += 1
+        self.__start_playback(session, path)
+        session.plays_invalid_audio = True
 
-    def __on_playback_ended(self):
-        if not self.__current_node:
+    def __on_playback_ended(self, session: _Session):
+        chain = session.chain
+        if chain:
+            # The chained clip wasn't queued in time, catch up without waiting for the prefetcher.
+            if not chain.loaded:
+                self.__chain_loaded(chain, self.__try_load(chain.path))
+                if chain.clips is None and self.__release_tail(session, chain):
+                    return
+            if chain.clips is not None:
+                self.__queue_chain(session, chain)
+                self.__on_chain_started(session, chain)
+                return
+            session.chain = None
+        node = session.node
+        if node == CompiledScenario.NO_NODE:
             # Block only here vor more clarity, happens when a scenario ended.
             pass
-        elif self.__plays_invalid_audio:
+        elif session.plays_invalid_audio:
             # Invalid audio playback ended, replay the current node.
-            self.__start_playback(self.__current_node.audio)
-            self.__plays_invalid_audio = False
-        elif not self.__current_node.links:
+            self.__play_node(session)
+            session.plays_invalid_audio = False
+        elif session.scenario.kinds[node] == CompiledScenario.END:
             # The current node has no links defined so the scenario execution ends.
-            self.__current_node = None
-            self.__start_playback(self.__scenario.end_call_audio)
-        elif self.__current_node.has_unnumbered_links():
-            selected_link = self.__current_node.random_link()
-            if not selected_link:
-                raise RuntimeError("tried to get an random link on a node with no links")
-            self.__current_node = self.__scenario.node_by_id(selected_link.target)
-            self.__start_playback(self.__current_node.audio)
+            session.node = CompiledScenario.NO_NODE
+            self.__record(SessionEvent.END, session)
+            self.__start_playback(session, session.scenario.end_call_audio)
+        elif session.scenario.kinds[node] == CompiledScenario.RANDOM:
+            self.__enter_node(session, chain.node if chain else session.scenario.random_target(node))
+        elif session.scenario.repeat_after[node] > 0:
+            # Waits for input, played again if nothing is dialed.
+            session.timer = self.__scheduler.call_later(
+                session.scenario.repeat_after[node],
+                partial(self.__on_timer, _Action.TIMEOUT, session.index, session.generation),
+            )
 
-    def __on_quit(self):
-        if self.__player:
-            self.__player.stop()
-    
-    def __start_playback(self, path: str):
-        self.__player = Player(
-            self.__resolve_path(path),
-            self.__queue,
+    def __on_inactivity(self, session: _Session):
+        if session.node == CompiledScenario.NO_NODE or session.digits:
+            return
+        session.timer = None
+        limit = session.scenario.max_repeats
+        if limit is None or session.repeats < limit:
+            session.repeats += 1
+            self.__play_node(session)
+            return
+        self.__record(SessionEvent.TIMEOUT, session, session.node)
+        session.node = CompiledScenario.NO_NODE
+        if self.__prefetcher:
+            self.__prefetcher.cancel(session.index)
+        self.__start_playback(session, session.scenario.end_call_audio)
+        if self.__on_timeout:
+            self.__on_timeout(session.index)
+
+    def __on_chain_ready(self, session: _Session, chain: _Chain):
+        if session.chain is not chain or chain.queued:
+            return
+        if chain.clips is None:
+            # Failed to load, the end of the playback takes the usual way.
+            self.__release_tail(session, chain)
+            return
+        self.__queue_chain(session, chain)
+
+    def __release_tail(self, session: _Session, chain: _Chain) -> bool:
+        """
+        Queues the end held back for the crossfade as it is, used when the
+        chained clip failed to load. Returns False if nothing was held back.
+        """
+        if chain.tail is None:
+            return False
+        session.generation += 1
+        session.output.enqueue(chain.tail, session.generation)
+        chain.tail = None
+        return True
+
+    def __on_chain_started(self, session: _Session, chain: _Chain):
+        """The current clip ended and the chained one took over."""
+        session.chain = None
+        session.node = chain.node
+        if chain.node == CompiledScenario.NO_NODE:
+            self.__record(SessionEvent.END, session)
+            return
+        self.__record(SessionEvent.ENTER, session, chain.node)
+        if self.__on_node:
+            self.__on_node(session.index, chain.node)
+        self.__prepare_chain(session, chain.held)
+        self.__prefetch(session)
+
+    def __on_reload(self, scenario: CompiledScenario):
+        self.__scenario = scenario
+        self.__prefetch_paths = [None] * len(scenario)
+        # Checked here and not by the watcher, so no file can be cached between
+        # the check and the discard.
+        discarded = self.cache.discard(self.cache.changed())
+        logging.info(
+            f"scenario reloaded, {discarded} changed audio file(s) discarded from the cache, "
+            f"{len(self.cache)} reused"
         )
-        self.__player.start()
+
+    def __on_quit(self):
+        self.__output.close()
+        if self.__prefetcher:
+            self.__prefetcher.shutdown()
+        logging.debug(f"audio cache: {self.cache.stats()}")
+
+    def __enter_node(self, session: _Session, node: int, play: bool = True):
+        """Makes the given node the current one of the session and starts it's playback."""
+        session.node = node
+        self.__record(SessionEvent.ENTER, session, node)
+        if self.__on_node:
+            self.__on_node(session.index, node)
+        if play:
+            self.__play_node(session)
+            self.__prefetch(session)
+
+    def __prefetch(self, session: _Session):
+        if not self.__prefetcher:
+            return
+        node = session.node
+        paths = session.prefetch_paths[node]
+        if paths is None:
+            paths = session.prefetch_paths[node] = self.__collect_prefetch_paths(session.scenario, node)
+        self.__prefetcher.prefetch(paths, session.index)
+
+    def __record(
+        self,
+        event: SessionEvent,
+        session: _Session,
+        node: int = CompiledScenario.NO_NODE,
+        digit: int = -1,
+    ):
+        if not self.__session_log:
+            return
+        id = session.scenario.ids[node] if node != CompiledScenario.NO_NODE else None
+        self.__session_log.record(event, session.index, id, digit)
+
+    def __collect_prefetch_paths(self, scenario: CompiledScenario, node: int) -> list[Path]:
+        """
+        Returns the audio files which might be played next after the given node,
+        the ones which are reachable with fewer hops first.
+        """
+        paths: list[Path] = []
+        level = [node]
+        for hop in range(self.__prefetcher.depth if self.__prefetcher else 0):
+            next_level: list[int] = []
+            for current in level:
+                if scenario.kinds[current] == CompiledScenario.END:
+                    paths.append(scenario.end_call_audio)
+                    continue
+                for target in scenario.successors(current):
+                    paths.append(scenario.audio[target])
+                    next_level.append(target)
+            if hop == 0:
+                # Dialing a wrong number is about as likely as any valid one.
+                paths.append(scenario.invalid_number_audio)
+                if scenario.invalid_number_fun_audio:
+                    paths.append(scenario.invalid_number_fun_audio)
+            level = next_level
+        return list(dict.fromkeys(paths))
     
-    def __resolve_path(self, path: str):
-        """Used to resolve paths relative to the scenario file."""
-        return (self.__scenario_location / Path(path)).resolve()
\ No newline at end of file
+    def __play_node(self, session: _Session):
+        """Plays the audio of the current node, chaining the successor of nodes which advance on their own."""
+        clip = self.__load(session, session.scenario.audio[session.node])
+        if clip is None:
+            return
+        clip, tail = self.__hold_back(session.scenario, session.node, clip)
+        self.__play(session, clip)
+        self.__prepare_chain(session, tail)
+
+    def __start_playback(self, session: _Session, path: Path):
+        clip = self.__load(session, path)
+        if clip is not None:
+            self.__play(session, clip)
+
+    def __load(self, session: _Session, path: Path) -> Optional[Clip]:
+        """Returns the clip of a file, if it can't be loaded the internal error audio is played instead."""
+        try:
+            return self.cache.get(path)
+        except Exception as e:
+            logging.error(f"failed to load audio '{path}': {e}")
+            if path == session.scenario.internal_error_audio:
+                self.__stop_playback(session)
+            else:
+                self.__start_playback(session, session.scenario.internal_error_audio)
+            return None
+
+    def __try_load(self, path: Path) -> Optional[Clip]:
+        try:
+            return self.cache.get(path)
+        except Exception as e:
+            # Reported when the file is played the usual way.
+            logging.debug(f"failed to load chained audio '{path}': {e}")
+            return None
+
+    def __play(self, session: _Session, clip: Clip):
+        session.chain = None
+        self.__scheduler.cancel(session.timer)
+        session.timer = None
+        session.generation += 1
+        if self.__metrics and self.__command:
+            session.started_by = (session.generation, self.__command)
+        session.output.play(clip, session.generation)
+
+    def __stop_playback(self, session: _Session):
+        session.chain = None
+        self.__scheduler.cancel(session.timer)
+        session.timer = None
+        session.generation += 1
+        session.output.stop()
+
+    def __prepare_chain(self, session: _Session, tail: Optional[Clip]):
+        """
+        Chooses the clip following the current one if the node advances on it's
+        own and starts loading it. A dial or hang up before the end of the current
+        clip stops the playback and thereby drops the chain.
+        """
+        if not self.__gapless:
+            return
+        scenario = session.scenario
+        node = session.node
+        kind = scenario.kinds[node]
+        if kind == CompiledScenario.RANDOM:
+            successor = scenario.random_target(node)
+            path = scenario.audio[successor]
+        elif kind == CompiledScenario.END:
+            successor = CompiledScenario.NO_NODE
+            path = scenario.end_call_audio
+        else:
+            return
+        chain = session.chain = _Chain(session.generation, successor, path, tail)
+        if self.__prefetcher:
+            self.__prefetcher.fetch(path, partial(self.__on_chain_loaded, session.index, chain))
+        else:
+            self.__on_chain_loaded(session.index, chain, self.__try_load(path))
+
+    def __on_chain_loaded(self, session: int, chain: _Chain, clip: Optional[Clip]):
+        """Called with the loaded clip of a chain, on a worker thread of the prefetcher if there is one."""
+        self.__chain_loaded(chain, clip)
+        self.__put(_Command(_Action.CHAIN_READY, session=session, chain=chain))
+
+    def __chain_loaded(self, chain: _Chain, clip: Optional[Clip]):
+        if clip is not None:
+            clips = [clip]
+            tail = chain.tail
+            if tail is not None:
+                mixed = tail.crossfade(clip) if clip.frames >= tail.frames else None
+                # Clips in different formats can't be mixed, they are just played one after the other.
+                clips = list(mixed) if mixed else [tail, clip]
+            chain.clips = [clip for clip in clips if clip.frames] or None
+        chain.loaded = True
+
+    def __queue_chain(self, session: _Session, chain: _Chain):
+        assert chain.clips
+        last, chain.held = self.__hold_back(session.scenario, chain.node, chain.clips[-1])
+        session.generation += 1
+        for clip in chain.clips[:-1]:
+            session.output.enqueue(clip, _NO_TOKEN)
+        session.output.enqueue(last, session.generation)
+        chain.queued = True
+
+    def __hold_back(self, scenario: CompiledScenario, node: int, clip: Clip) -> tuple[Clip, Optional[Clip]]:
+        """Splits off the end of a clip which will be crossfaded into the chained one."""
+        if (
+            not self.__crossfade
+            or node == CompiledScenario.NO_NODE
+            or scenario.kinds[node] == CompiledScenario.MENU
+        ):
+            return clip, None
+        frames = int(self.__crossfade * clip.sample_rate)
+        if frames == 0 or clip.frames < 2 * frames:
+            return clip, None
+        return clip.split(clip.frames - frames)
+
+    def __on_timer(self, action: _Action, session: int, generation: int):
+        """Called by the scheduler on the controller thread once a session waited too long for input."""
+        command = _Command(action, generation=generation, session=session)
+        if self.__metrics:
+            command.queued = time.perf_counter()
+        self.__dispatch(command)
+
+    def __on_output_ended(self, session: int, generation: int):
+        """Called by the output engine when a clip played until it's end."""
+        self.__put(_Command(_Action.PLAYBACK_ENDED, generation=generation, session=session))
+
+    def __on_output_started(self, session: int, generation: int, seconds: float):
+        """Called by the output engine after the backend started a clip, only if metrics are enabled."""
+        self.__playback_start.observe(seconds)
+        started_by = self.__sessions[session].started_by
+        if started_by and started_by[0] == generation and started_by[1].action in self.__event_to_playback:
+            command = started_by[1]
+            self.__event_to_playback[command.action].observe(time.perf_counter() - command.queued)
@@ -0,0 +1,444 @@
+from .controller import Controller
+from .scheduler import Scheduler
+from .simulation import TraceEvent, read_trace
+
+import errno
+import fcntl
+import json
+import logging
+import os
+from pathlib import Path
+from queue import Queue
+import re
+import selectors
+import socket
+import stat
+import struct
+from threading import Thread
+import time
+from typing import Callable, Iterator, Optional
+
+
+Input = tuple[int, str, Optional[int]]
+"""An input as session, action (see `TraceEvent.ACTIONS` and `QUIT`) and the dialed number."""
+
+QUIT = "quit"
+
+
+class InputSource:
+    """
+    Interface of a device the `InputReceiver` reads from. Sources with a file
+    descriptor (`fileno`) are read once it's readable, others schedule their
+    inputs themselves in `start`. Each source acts on one session unless the
+    inputs name their session.
+    """
+
+    def __init__(self, session: int = 0):
+        self.session = session
+
+    def fileno(self) -> Optional[int]:
+        """File descriptor to watch, None if the source doesn't have one."""
+        return None
+
+    def start(self, scheduler: Scheduler, emit: Callable[[Input], None]):
+        """Called once on the thread of the receiver before anything is read."""
+        pass
+
+    def read(self) -> list[Input]:
+        """
+        Reads what is available without blocking. Raises EOFError once there
+        will be no further input.
+        """
+        return []
+
+    def close(self):
+        pass
+
+
+class EvdevKeypad(InputSource):
+    """
+    A (numeric) keyboard read directly from it's Linux input device, e.g.
+    `/dev/input/by-id/usb-…-event-kbd`. Digits dial, enter picks up and
+    backspace, minus or the decimal point hang up. The device is grabbed, the
+    keys don't reach the console or any other program. No TTY is needed.
+    """
+
+    _EVENT = struct.Struct("llHHi")
+    """`struct input_event`: time (seconds and microseconds), type, code and value."""
+    _EV_KEY = 1
+    _PRESSED = 1
+    _EVIOCGRAB = 0x40044590
+    KEYS: dict[int, tuple[str, Optional[int]]] = {
+        **{code: ("dial", number) for number, code in enumerate((11, 2, 3, 4, 5, 6, 7, 8, 9, 10))},
+        **{code: ("dial", number) for number, code in enumerate((82, 79, 80, 81, 75, 76, 77, 71, 72, 73))},
+        28: ("pick_up", None),
+        96: ("pick_up", None),
+        14: ("hang_up", None),
+        74: ("hang_up", None),
+        83: ("hang_up", None),
+    }
+    """Actions of the key codes (see `linux/input-event-codes.h`)."""
+
+    def __init__(self, path: Path, session: int = 0, grab: bool = True):
+        super().__init__(session)
+        self.path = path
+        self.__fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        if grab:
+            fcntl.ioctl(self.__fd, self._EVIOCGRAB, 1)
+        self.__rest = b""
+
+    def fileno(self) -> Optional[int]:
+        return self.__fd
+
+    def read(self) -> list[Input]:
+        try:
+            data = self.__rest + os.read(self.__fd, 64 * self._EVENT.size)
+        except BlockingIOError:
+            return []
+        except OSError as e:
+            if e.errno == errno.ENODEV:
+                raise EOFError(f"{self.path} was removed")
+            raise
+        if not data:
+            raise EOFError(f"{self.path} was closed")
+        end = len(data) - len(data) % self._EVENT.size
+        self.__rest = data[end:]
+        rsl: list[Input] = []
+        for _, _, kind, code, value in self._EVENT.iter_unpack(data[:end]):
+            if kind != self._EV_KEY or value != self._PRESSED or code not in self.KEYS:
+                continue
+            action, number = self.KEYS[code]
+            rsl.append((self.session, action, number))
+        return rsl
+
+    def close(self):
+        os.close(self.__fd)
+
+
+class _LineSource(InputSource):
+    """
+    Inputs as text, one per line: `pick_up` (or `p`), `hang_up` (or `h`),
+    `dial N`, a sequence of digits which are dialed one after another or
+    `quit`. A line can start with `@SESSION` to act on another session.
+    """
+
+    _WORDS = {"p": "pick_up", "pick_up": "pick_up", "h": "hang_up", "hang_up": "hang_up", "q": QUIT, QUIT: QUIT}
+
+    def __init__(self, session: int = 0):
+        super().__init__(session)
+        self.__rest = b""
+
+    def _lines(self, data: bytes) -> list[Input]:
+        lines = (self.__rest + data).split(b"\n")
+        self.__rest = lines.pop()
+        rsl: list[Input] = []
+        for line in lines:
+            try:
+                rsl.extend(self.__parse(line.decode().split()))
+            except ValueError as e:
+                logging.warning(f"ignored input '{line.decode(errors='replace').strip()}': {e}")
+        return rsl
+
+    def __parse(self, words: list[str]) -> list[Input]:
+        session = self.session
+        if words and words[0].startswith("@"):
+            session = int(words.pop(0)[1:])
+        if not words:
+            return []
+        if words[0] in self._WORDS and len(words) == 1:
+            return [(session, self._WORDS[words[0]], None)]
+        if words[0] == "dial" and len(words) == 2:
+            words = words[1:]
+        if len(words) == 1 and words[0].isdigit():
+            return [(session, "dial", int(digit)) for digit in words[0]]
+        raise ValueError("unknown command")
+
+
+class FifoSource(_LineSource):
+    """
+    A named pipe scripts write their inputs to (see `_LineSource`), it's
+    created if it doesn't exist yet. The pipe is opened for writing as well,
+    thus it stays open when the writers come and go.
+    """
+
+    def __init__(self, path: Path, session: int = 0):
+        super().__init__(session)
+        if not path.exists():
+            os.mkfifo(path)
+        elif not stat.S_ISFIFO(path.stat().st_mode):
+            raise ValueError(f"{path} exists and isn't a named pipe")
+        self.path = path
+        self.__fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+
+    def fileno(self) -> Optional[int]:
+        return self.__fd
+
+    def read(self) -> list[Input]:
+        try:
+            return self._lines(os.read(self.__fd, 4096))
+        except BlockingIOError:
+            return []
+
+    def close(self):
+        os.close(self.__fd)
+
+
+class SocketSource(InputSource):
+    """
+    A UNIX socket accepting any number of connections, each sends it's inputs
+    as lines (see `_LineSource`).
+    """
+
+    def __init__(self, path: Path, session: int = 0):
+        super().__init__(session)
+        if path.is_socket():
+            path.unlink()
+        self.path = path
+        self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__socket.bind(str(path))
+        self.__socket.listen()
+        self.__socket.setblocking(False)
+
+    def fileno(self) -> Optional[int]:
+        return self.__socket.fileno()
+
+    def accept(self) -> Optional["_Connection"]:
+        """The next connection, None if there is none."""
+        try:
+            connection, _ = self.__socket.accept()
+        except BlockingIOError:
+            return None
+        connection.setblocking(False)
+        return _Connection(connection, self.session)
+
+    def close(self):
+        self.__socket.close()
+        self.path.unlink(missing_ok=True)
+
+
+class _Connection(_LineSource):
+    def __init__(self, connection: socket.socket, session: int):
+        super().__init__(session)
+        self.__connection = connection
+
+    def fileno(self) -> Optional[int]:
+        return self.__connection.fileno()
+
+    def read(self) -> list[Input]:
+        try:
+            data = self.__connection.recv(4096)
+        except BlockingIOError:
+            return []
+        if not data:
+            raise EOFError("connection closed")
+        return self._lines(data)
+
+    def close(self):
+        self.__connection.close()
+
+
+class RecordedSource(InputSource):
+    """
+    Replays a recorded (or simulated) trace file (see `TraceEvent`) with the
+    original timing, the sessions are taken from the file. Allows to test a
+    setup without any hardware.
+    """
+
+    def __init__(self, path: Path):
+        super().__init__()
+        self.path = path
+        self.__events: Iterator[TraceEvent] = iter(read_trace(path))
+        self.__scheduler: Optional[Scheduler] = None
+        self.__emit: Optional[Callable[[Input], None]] = None
+        self.__begin: float = 0
+
+    def start(self, scheduler: Scheduler, emit: Callable[[Input], None]):
+        self.__scheduler = scheduler
+        self.__emit = emit
+        self.__begin = scheduler.clock()
+        self.__next()
+
+    def __next(self, event: Optional[TraceEvent] = None):
+        # Only the next event is scheduled, long traces don't fill the scheduler.
+        assert self.__scheduler is not None and self.__emit is not None
+        if event is not None:
+            self.__emit((event.session, event.action, event.number))
+        upcoming = next(self.__events, None)
+        if upcoming is not None:
+            self.__scheduler.call_at(self.__begin + upcoming.time, lambda: self.__next(upcoming))
+
+
+class RotarySource(InputSource):
+    """
+    A dial phone read by rotarypi (Raspberry Pi only). The reader runs on it's
+    own thread, each event it puts into the queue also writes a byte to a pipe
+    the receiver watches.
+    """
+
+    def __init__(self, session: int = 0):
+        if not Path("/etc/rpi-issue").exists():
+            raise NotImplementedError("Reading input from a rotary phone is only implemented for Raspberry Pi's (where the rp.GPIO library is available)")
+        from rotarypi import DialConfiguration, DialPinout, RotaryReader
+
+        super().__init__(session)
+        self.__wake_read, wake_write = os.pipe()
+        os.set_blocking(self.__wake_read, False)
+        self.__queue = _NotifyingQueue(wake_write)
+        self.__reader = RotaryReader(self.__queue, DialPinout(), DialConfiguration(loglevel=logging.DEBUG))
+
+    def fileno(self) -> Optional[int]:
+        return self.__wake_read
+
+    def start(self, scheduler: Scheduler, emit: Callable[[Input], None]):
+        self.__reader.start()
+
+    def read(self) -> list[Input]:
+        from rotarypi import EventType, HandsetState
+
+        try:
+            os.read(self.__wake_read, 4096)
+        except BlockingIOError:
+            pass
+        rsl: list[Input] = []
+        while not self.__queue.empty():
+            event = self.__queue.get_nowait()
+            if event.type == EventType.DIAL_EVENT and isinstance(event.data, int):
+                rsl.append((self.session, "dial", event.data))
+            elif event.type == EventType.HANDSET_EVENT and event.data is HandsetState.PICKED_UP:
+                rsl.append((self.session, "pick_up", None))
+            elif event.type == EventType.HANDSET_EVENT and event.data is HandsetState.HUNG_UP:
+                rsl.append((self.session, "hang_up", None))
+        return rsl
+
+
+class _NotifyingQueue(Queue):
+    def __init__(self, wake: int):
+        super().__init__()
+        self.__wake = wake
+
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        os.write(self.__wake, b"\0")
+
+
+def source_by_name(name: str) -> InputSource:
+    """
+    Returns an input source by it's name as used on the command line:
+    `evdev:PATH`, `fifo:PATH`, `socket:PATH`, `rotary` or `replay:PATH`. All
+    but the replay can end with `@SESSION` to act on another session than the
+    first one.
+    """
+    session = 0
+    spec = name
+    # Only a number after the last @ is a session, paths may contain @ as well.
+    match = re.fullmatch(r"(.*)@(\d+)", spec)
+    if match:
+        spec = match.group(1)
+        session = int(match.group(2))
+    kind, _, path = spec.partition(":")
+    if kind == "evdev" and path:
+        return EvdevKeypad(Path(path), session)
+    if kind == "fifo" and path:
+        return FifoSource(Path(path), session)
+    if kind == "socket" and path:
+        return SocketSource(Path(path), session)
+    if kind == "rotary" and not path:
+        return RotarySource(session)
+    if kind == "replay" and path and spec == name:
+        return RecordedSource(Path(path))
+    raise ValueError(f"unknown input '{name}'")
+
+
+class InputReceiver(Thread):
+    """
+    Reads any number of input sources on a single thread. The file descriptors
+    of the sources are watched with `selectors` (epoll on Linux), the thread
+    sleeps until one is readable or a timer of a replayed trace is due. Once
+    no source is left (e.g. a replay ended) the controller is quit.
+    """
+
+    def __init__(self, controller: Controller, sources: list[InputSource], record: Optional[Path] = None):
+        super().__init__()
+        self.__controller = controller
+        self.__sources = sources
+        self.__selector = selectors.DefaultSelector()
+        self.__scheduler = Scheduler()
+        self.__record = open(record, "a") if record else None
+        """Every input is appended to this trace file."""
+        self.__begin: float = 0
+        self.__do_quit = False
+        self.inputs: int = 0
+        for source in sources:
+            if not isinstance(source, RecordedSource) and source.session >= controller.sessions:
+                raise ValueError(f"input {source.__class__.__name__} uses session {source.session}, the controller has {controller.sessions}")
+
+    def run(self):
+        self.__controller.start()
+        self.__begin = time.monotonic()
+        try:
+            for source in self.__sources:
+                self.__add(source)
+            while not self.__do_quit:
+                if not self.__selector.get_map() and not len(self.__scheduler):
+                    logging.info("all inputs ended")
+                    self.__controller.quit()
+                    return
+                for selected, _ in self.__selector.select(self.__scheduler.timeout()):
+                    self.__read(selected.data)
+                self.__scheduler.run_due()
+        except BaseException:
+            # Also covers KeyboardInterrupt, the controller would keep the process alive.
+            self.__controller.quit()
+            raise
+        finally:
+            for selected in list(self.__selector.get_map().values()):
+                selected.data.close()
+            self.__selector.close()
+            if self.__record:
+                self.__record.close()
+
+    def __add(self, source: InputSource):
+        if source.fileno() is not None:
+            self.__selector.register(source.fileno(), selectors.EVENT_READ, source)
+        source.start(self.__scheduler, self.__on_input)
+
+    def __read(self, source: InputSource):
+        if isinstance(source, SocketSource):
+            connection = source.accept()
+            if connection:
+                self.__add(connection)
+            return
+        try:
+            inputs = source.read()
+        except EOFError as e:
+            logging.info(f"input {source.__class__.__name__} ended: {e}")
+            self.__selector.unregister(source.fileno())
+            source.close()
+            return
+        for item in inputs:
+            self.__on_input(item)
+
+    def __on_input(self, item: Input):
+        session, action, number = item
+        if action == QUIT:
+            print("> Quit")
+            self.__controller.quit()
+            self.__do_quit = True
+            return
+        if not 0 <= session < self.__controller.sessions:
+            logging.warning(f"ignored {action} for session {session}, the controller has {self.__controller.sessions}")
+            return
+        self.inputs += 1
+        if action == "pick_up":
+            print(f"> Pick up phone {session}")
+            self.__controller.pick_up(session)
+        elif action == "hang_up":
+            print(f"> Hang up phone {session}")
+            self.__controller.hang_up(session)
+        elif number is not None:
+            print(f"> Dial number {number} on phone {session}")
+            self.__controller.dial(number, session)
+        if self.__record:
+            event = TraceEvent(round(time.monotonic() - self.__begin, 3), session, action, number)
+            self.__record.write(json.dumps(event.as_dict()) + "\n")
+            self.__record.flush()
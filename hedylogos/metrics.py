@@ -0,0 +1,198 @@
+from bisect import bisect_left
+import json
+import math
+import os
+from pathlib import Path
+from threading import Event, Lock, Thread
+import time
+from typing import Callable, Optional, TypeVar
+
+
+T = TypeVar("T")
+
+
+class Histogram:
+    """
+    Counts observations in fixed buckets, like a Prometheus histogram. An
+    observation costs a binary search and an increment.
+    """
+
+    SECONDS = (
+        0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+        0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    )
+    """Default bucket bounds for durations."""
+
+    COUNTS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+    """Bucket bounds for sizes like the depth of a queue."""
+
+    def __init__(self, bounds: tuple[float, ...] = SECONDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        """Non-cumulative count of each bucket, the last one is for values above all bounds."""
+        self.count: int = 0
+        self.sum: float = 0
+        self.min: float = math.inf
+        self.max: float = -math.inf
+        self.__lock = Lock()
+
+    def observe(self, value: float):
+        with self.__lock:
+            self.counts[bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.sum += value
+            if value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimates a quantile by interpolating within the bucket it falls into,
+        None if nothing was observed.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.bounds[i - 1] if i > 0 else min(self.min, self.bounds[0])
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                estimate = lower + (upper - lower) * (rank - seen) / count
+                return min(max(estimate, self.min), self.max)
+            seen += count
+        return self.max
+
+    def as_dict(self) -> dict:
+        with self.__lock:
+            return {
+                "count": self.count,
+                "sum": self.sum,
+                "min": self.min if self.count else None,
+                "max": self.max if self.count else None,
+                "p50": self.quantile(0.5),
+                "p90": self.quantile(0.9),
+                "p99": self.quantile(0.99),
+                "buckets": {
+                    str(bound): count for bound, count in zip(self.bounds, self.counts)
+                } | {"+Inf": self.counts[-1]},
+            }
+
+
+class Metrics:
+    """
+    Collection of named histograms, optionally with labels. Components which
+    are instrumented take an optional `Metrics` and skip all measurements when
+    there is none, thus disabled instrumentation costs a single check.
+    """
+
+    PREFIX = "hedylogos_"
+    """Prefix of all metric names in the Prometheus export."""
+
+    def __init__(self):
+        self.__histograms: dict[tuple[str, tuple[tuple[str, str], ...]], Histogram] = {}
+        self.__lock = Lock()
+        self.started = time.time()
+
+    def histogram(
+        self,
+        name: str,
+        labels: Optional[dict[str, str]] = None,
+        bounds: tuple[float, ...] = Histogram.SECONDS,
+    ) -> Histogram:
+        """
+        Returns the histogram with the given name and labels, creating it if
+        needed. Callers on a hot path should keep the returned object.
+        """
+        key = (name, tuple(sorted(labels.items())) if labels else ())
+        with self.__lock:
+            if key not in self.__histograms:
+                self.__histograms[key] = Histogram(bounds)
+            return self.__histograms[key]
+
+    def timed(self, name: str, function: Callable[..., T]) -> Callable[..., T]:
+        """Wraps a function so the duration of every call is observed."""
+        histogram = self.histogram(name)
+
+        def wrapper(*args, **kwargs) -> T:
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+
+    def snapshot(self) -> dict:
+        with self.__lock:
+            items = sorted(self.__histograms.items())
+        return {
+            "time": time.time(),
+            "uptime": time.time() - self.started,
+            "histograms": [
+                {"name": name, "labels": dict(labels)} | histogram.as_dict()
+                for (name, labels), histogram in items
+            ],
+        }
+
+    def prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        with self.__lock:
+            items = sorted(self.__histograms.items())
+        lines: list[str] = []
+        previous: Optional[str] = None
+        for (name, labels), histogram in items:
+            name = f"{self.PREFIX}{name}"
+            if name != previous:
+                lines.append(f"# TYPE {name} histogram")
+                previous = name
+            values = histogram.as_dict()
+            cumulative = 0
+            for bound, count in values["buckets"].items():
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {values['sum']}")
+            lines.append(f"{name}_count{_labels(labels)} {values['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path):
+        """
+        Writes the metrics to a file, in the Prometheus format if the name ends
+        with `.prom` and as JSON otherwise. The file is replaced atomically, so
+        readers never see a partial snapshot.
+        """
+        if path.suffix == ".prom":
+            content = self.prometheus()
+        else:
+            content = json.dumps(self.snapshot(), indent=2)
+        temporary = path.with_name(f".{path.name}.tmp")
+        with open(temporary, "w") as f:
+            f.write(content)
+        os.replace(temporary, path)
+
+
+class MetricsWriter(Thread):
+    """Writes the metrics to disk periodically and once more when stopped."""
+
+    def __init__(self, metrics: Metrics, path: Path, interval: float = 10):
+        super().__init__(daemon=True, name="metrics-writer")
+        self.__metrics = metrics
+        self.__path = path
+        self.__interval = interval
+        self.__stopped = Event()
+
+    def run(self):
+        while not self.__stopped.wait(self.__interval):
+            self.__metrics.write(self.__path)
+        self.__metrics.write(self.__path)
+
+    def stop(self):
+        self.__stopped.set()
+        self.join()
+
+
+def _labels(labels: tuple[tuple[str, str], ...], **extra: str) -> str:
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
@@ -2,7 +2,6 @@ from collections import Counter
 from dataclasses import field
 import json
 from pathlib import Path
-import random
 
 from pydantic import BaseModel, Field, RootModel, field_validator
 from typing import Optional
@@ -21,11 +20,40 @@ class Link(BaseModel):
         min_length=1
     )
     number: Optional[int] = Field(
+        default=None,
         ge=0,
         le=9,
         examples=[0],
         description="A number between 0 and 9 for the user to be able to choose the link. If set to null a random link will be chosen."
     )
+    code: Optional[str] = Field(
+        default=None,
+        pattern=r"^[0-9]+$",
+        examples=["42"],
+        description="Optional sequence of digits to dial for the link, instead of a single number. If a code is the beginning of another one, the call waits for further digits until the digit timeout of the scenario."
+    )
+    weight: Optional[float] = Field(
+        default=None,
+        gt=0,
+        examples=[1.0],
+        description="Optional relative probability of a link without a number to be chosen. Links without a weight count as 1."
+    )
+
+    @field_validator("code")
+    def check_either_number_or_code(cls, v, info):
+        if v is not None and info.data.get("number") is not None:
+            raise ValueError("a link can either have a number or a code")
+        return v
+
+    @field_validator("weight")
+    def check_weight_only_on_random_links(cls, v, info):
+        if v is not None and (info.data.get("number") is not None or info.data.get("code") is not None):
+            raise ValueError("a weight can only be set on links without a number")
+        return v
+
+    def is_random(self) -> bool:
+        """Whether the link is chosen randomly instead of by dialing."""
+        return self.number is None and self.code is None
 
 
 class Node(BaseModel):
@@ -56,6 +84,12 @@ class Node(BaseModel):
     links: Optional[list[Link]] = Field(
         description="Links to other nodes next in the story/scenario line. If set to None the scenario will stop at this point."
     )
+    repeat_after: Optional[float] = Field(
+        default=None,
+        ge=0,
+        examples=[10.0],
+        description="Optional seconds without input before the audio of this node is played again, overrides the value of the scenario. 0 never repeats the node."
+    )
 
     @classmethod
     def start_example(cls) -> "Node":
@@ -85,33 +119,33 @@ class Node(BaseModel):
         if not v or len(v) <= 1:
             return v
         is_none = False
-        if v[0].number is None:
+        if v[0].is_random():
             is_none = True
         for link in v:
-            if link.number is None and not is_none:
-                raise ValueError("mixed use of numbers and None in links")
+            if link.is_random() != is_none:
+                raise ValueError("mixed use of random links and links with a number or code")
+        return v
+
+    @field_validator("links")
+    def check_unique_codes(cls, v):
+        if not v:
+            return v
+        # A code of a single digit is the same as the number. Links sharing a
+        # number are fine (the first one is followed), codes have to be unique.
+        codes = Counter(str(link.number) if link.number is not None else link.code for link in v if not link.is_random())
+        duplicates = [
+            code for code, count in codes.items()
+            if count > 1 and any(link.code == code for link in v)
+        ]
+        if len(duplicates) > 0:
+            raise ValueError(f"number(s)/code(s) {format_str_list(duplicates)} used by more than one link")
         return v
 
-    def next_node_id_by_number(self, number: int) -> Optional[str]:
-        """Returns the id of a linked node if the number is valid."""
-        if not self.links:
-            return None 
-        for link in self.links:
-            if link.number == number:
-                return link.target
-        return None
-    
-    def random_link(self) -> Optional[Link]:
-        """Selects randomly one of the links of the node."""
-        if not self.links:
-            return None
-        return random.choice(self.links)
-    
     def has_unnumbered_links(self) -> bool:
         """Returns whether links have numbers assigned to them."""
         if not self.links:
             return False
-        return len([link for link in self.links if not link.number]) > 0
+        return any(link.is_random() for link in self.links)
 
 
 class Nodes(RootModel[list[Node]]):
@@ -139,13 +173,16 @@ class Nodes(RootModel[list[Node]]):
 
     @field_validator("root")
     def check_valid_link_targets(cls, v):
-        ids = [node.id for node in v]
+        ids = {node.id for node in v}
+        errors: list[str] = []
         for node in v:
             if node.links is None:
                 continue
             invalid = [link.target for link in node.links if link.target not in ids]
             if len(invalid) != 0:
-                raise ValueError(f"node '{node.id}' has invalid link target(s) {format_str_list(invalid)}")
+                errors.append(f"node '{node.id}' has invalid link target(s) {format_str_list(invalid)}")
+        if len(errors) > 0:
+            raise ValueError("; ".join(errors))
         return v
     
     def as_dict(self) -> dict[str, Node]:
@@ -198,6 +235,21 @@ class Scenario(BaseModel):
         description="Audio played when scenario ends.",
         min_length=1,
     )
+    repeat_after: Optional[float] = Field(
+        description="Seconds without input after the audio of a node with numbered links before it's played again. If set to None nodes are never repeated.",
+        default=None,
+        gt=0,
+    )
+    max_repeats: Optional[int] = Field(
+        description="How many times a node is repeated before the call is ended with the end call audio. If set to None it's repeated until the user dials or hangs up.",
+        default=None,
+        ge=0,
+    )
+    digit_timeout: float = Field(
+        description="Seconds to wait for the next digit when the digits dialed so far are the beginning of a longer code.",
+        default=3.0,
+        gt=0,
+    )
     nodes_dict: Optional[dict[str, Node]] = Field(exclude=True, default=None)
     """The id of the node which the scenario should start with."""
 
@@ -229,12 +281,13 @@ class Scenario(BaseModel):
         a graphical JSON editor.
         """
         with open(path, "w") as f:
-            f.write(json.dumps(cls.model_json_schema()))
+            json.dump(cls.model_json_schema(), f)
 
     def to_json(self, path: Path):
-        """Write the scenario instance to a JSON file."""
-        with open(path, "w") as f:
-            f.write(self.model_dump_json())
+        """Write the scenario instance to a JSON file, node by node (see `write_scenario`)."""
+        from .stream import write_scenario
+
+        write_scenario(path, self, self.nodes.root)
     
     def start(self) -> Node:
         """Returns the start node."""
@@ -244,7 +297,7 @@ class Scenario(BaseModel):
 
     def get_nodes_dict(self) -> dict[str, Node]:
         """Returns a dict of all nodes with their id as key."""
-        if not self.nodes_dict:
+        if self.nodes_dict is None:
             self.nodes_dict = self.nodes.as_dict()
         return self.nodes_dict
     
@@ -0,0 +1,114 @@
+from .audio import Clip
+from .cache import AudioCache
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Optional
+
+
+class Prefetcher:
+    """
+    Decodes the audio files which might be played next into the `AudioCache`
+    using a small pool of worker threads. Everything the visitor can reach by
+    dialing a single number (or two numbers if `depth` is set to 2) is loaded
+    while the current node is still playing.
+    """
+
+    def __init__(
+        self,
+        cache: AudioCache,
+        depth: int = 1,
+        budget: int = 32 * 1024 * 1024,
+        workers: int = 2,
+    ):
+        if depth not in (1, 2):
+            raise ValueError(f"prefetch depth has to be 1 or 2, got {depth}")
+        self.depth = depth
+        self.budget = budget
+        """How many bytes a single prefetch round may add to the cache."""
+        self.__cache = cache
+        self.__executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix="prefetch",
+        )
+        self.__rounds: dict[int, _Round] = {}
+        self.__lock = Lock()
+
+    def prefetch(self, paths: list[Path], session: int = 0):
+        """
+        Starts a new prefetch round for the given paths (unique and in order of
+        priority). Pending work of the previous round of the same session is
+        discarded, the rounds of other sessions aren't affected.
+        """
+        with self.__lock:
+            current = self.__rounds.get(session)
+            if current:
+                current.cancel()
+            current = self.__rounds[session] = _Round()
+            for path in paths:
+                if path in self.__cache:
+                    continue
+                current.pending.append(self.__executor.submit(self.__load, path, current))
+
+    def fetch(self, path: Path, callback: Callable[[Optional[Clip]], None]):
+        """
+        Loads a single file which is needed soon (like the clip chained to the
+        current playback) and calls `callback` with it on the worker thread,
+        with None if it can't be loaded. Isn't subject to the budget and isn't
+        discarded by a new prefetch round.
+        """
+        self.__executor.submit(self.__fetch, path, callback)
+
+    def cancel(self, session: int = 0):
+        """Discards all pending prefetches of a session, used when it's phone is hung up."""
+        with self.__lock:
+            current = self.__rounds.pop(session, None)
+            if current:
+                current.cancel()
+
+    def shutdown(self):
+        """Stops the worker threads."""
+        with self.__lock:
+            for pending in self.__rounds.values():
+                pending.cancel()
+            self.__rounds.clear()
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+
+    def __load(self, path: Path, current: "_Round"):
+        with self.__lock:
+            if current.cancelled or current.spent >= self.budget:
+                return
+        try:
+            size = self.__cache.preload(path)
+        except Exception as e:
+            # Errors are reported by the playback itself, if the file is ever played.
+            logging.debug(f"prefetch of {path} failed: {e}")
+            return
+        with self.__lock:
+            # Parallel workers may overrun the budget by a few files, that's fine.
+            current.spent += size
+
+    def __fetch(self, path: Path, callback: Callable[[Optional[Clip]], None]):
+        try:
+            clip: Optional[Clip] = self.__cache.get(path)
+        except Exception as e:
+            logging.debug(f"fetch of {path} failed: {e}")
+            clip = None
+        callback(clip)
+
+
+class _Round:
+    """The prefetches started for one node of a session."""
+
+    def __init__(self):
+        self.pending: list[Future] = []
+        self.spent: int = 0
+        self.cancelled: bool = False
+
+    def cancel(self):
+        for future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        self.cancelled = True
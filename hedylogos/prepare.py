@@ -0,0 +1,190 @@
+from .binary import hash_file
+from .model import Scenario
+
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import subprocess
+from typing import Optional
+
+
+class AudioFormat:
+    """The PCM format all audio files of a scenario are converted to."""
+
+    CODECS = {
+        1: "pcm_u8",
+        2: "pcm_s16le",
+        3: "pcm_s24le",
+        4: "pcm_s32le",
+    }
+    """ffmpeg codec for each sample width in bytes."""
+
+    def __init__(
+        self,
+        rate: int = 44100,
+        width: int = 2,
+        channels: int = 1,
+        loudness: Optional[float] = -16.0,
+    ):
+        if width not in self.CODECS:
+            raise ValueError(f"sample width has to be one of {list(self.CODECS)} bytes, got {width}")
+        self.rate = rate
+        self.width = width
+        self.channels = channels
+        self.loudness = loudness
+        """Target integrated loudness in LUFS, None disables normalization."""
+
+    def key(self) -> str:
+        """Identifies the settings as part of the cache key."""
+        return f"{self.rate}:{self.width}:{self.channels}:{self.loudness}"
+
+    def ffmpeg_args(self) -> list[str]:
+        args = [
+            "-ac", str(self.channels),
+            "-ar", str(self.rate),
+            "-c:a", self.CODECS[self.width],
+        ]
+        if self.loudness is not None:
+            args.extend(["-af", f"loudnorm=I={self.loudness}:TP=-1.5:LRA=11"])
+        return args
+
+
+class AudioPreparer:
+    """
+    Converts all audio files of a scenario into one PCM format so playback
+    never has to deal with different formats. The converted files are stored
+    in a content addressed cache directory: the name of each file is derived
+    from the content of the source and the format settings. Therefore only new
+    or changed files are converted again. To avoid reading every source file on
+    each run, their hashes are remembered together with their modification time
+    and size in a manifest within the cache.
+    """
+
+    MANIFEST = "manifest.json"
+
+    def __init__(self, cache_dir: Path, format: AudioFormat, jobs: Optional[int] = None):
+        self.cache_dir = cache_dir
+        self.format = format
+        self.jobs = jobs
+        self.converted: int = 0
+        self.reused: int = 0
+
+    def prepare(self, scenario: Scenario, scenario_path: Path, output: Path) -> Scenario:
+        """
+        Converts the audio of the scenario and writes a copy of it to `output`
+        which uses the converted files.
+        """
+        if not shutil.which("ffmpeg"):
+            raise RuntimeError("ffmpeg is needed to prepare the audio files but wasn't found")
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        location = scenario_path.resolve().parent
+        sources = {
+            path: (location / path).resolve() for path in self.__audio(scenario)
+        }
+        not_found = sorted(str(source) for source in set(sources.values()) if not source.exists())
+        if not_found:
+            raise FileNotFoundError(f"audio file(s) not found: {', '.join(not_found)}")
+        manifest = self.__read_manifest()
+        hashes: dict[Path, str] = {}
+        to_hash: list[Path] = []
+        for source in set(sources.values()):
+            stat = source.stat()
+            entry = manifest.get(str(source))
+            if entry and entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+                hashes[source] = entry["hash"]
+            else:
+                to_hash.append(source)
+
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            for source, hash in zip(to_hash, executor.map(_hash_file, to_hash)):
+                hashes[source] = hash
+                stat = source.stat()
+                manifest[str(source)] = {
+                    "mtime": stat.st_mtime_ns,
+                    "size": stat.st_size,
+                    "hash": hash,
+                }
+            targets = {source: self.__target(hash) for source, hash in hashes.items()}
+            # Sources with the same content share one converted file.
+            missing = {target: source for source, target in targets.items() if not target.exists()}
+            self.reused = len(set(targets.values())) - len(missing)
+            for _ in executor.map(
+                _convert,
+                missing.values(),
+                missing.keys(),
+                [self.format.ffmpeg_args()] * len(missing),
+            ):
+                self.converted += 1
+        self.__write_manifest(manifest)
+
+        output_location = output.resolve().parent
+        paths = {
+            path: os.path.relpath(targets[source], output_location)
+            for path, source in sources.items()
+        }
+        prepared = scenario.model_copy(deep=True)
+        for node in prepared.nodes.root:
+            node.audio = paths[node.audio]
+        prepared.invalid_number_audio = paths[prepared.invalid_number_audio]
+        if prepared.invalid_number_fun_audio:
+            prepared.invalid_number_fun_audio = paths[prepared.invalid_number_fun_audio]
+        prepared.internal_error_audio = paths[prepared.internal_error_audio]
+        prepared.end_call_audio = paths[prepared.end_call_audio]
+        prepared.nodes_dict = None
+        prepared.to_json(output)
+        return prepared
+
+    def __audio(self, scenario: Scenario) -> set[str]:
+        paths = {
+            scenario.invalid_number_audio,
+            scenario.internal_error_audio,
+            scenario.end_call_audio,
+        }
+        if scenario.invalid_number_fun_audio:
+            paths.add(scenario.invalid_number_fun_audio)
+        paths.update(node.audio for node in scenario.nodes.root)
+        return paths
+
+    def __target(self, source_hash: str) -> Path:
+        key = hashlib.sha256(f"{source_hash}:{self.format.key()}".encode()).hexdigest()
+        return self.cache_dir / key[:2] / f"{key}.wav"
+
+    def __read_manifest(self) -> dict[str, dict]:
+        try:
+            with open(self.cache_dir / self.MANIFEST, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def __write_manifest(self, manifest: dict[str, dict]):
+        path = self.cache_dir / self.MANIFEST
+        temporary = path.with_suffix(".tmp")
+        with open(temporary, "w") as f:
+            json.dump(manifest, f)
+        os.replace(temporary, path)
+
+
+def _hash_file(path: Path) -> str:
+    return hash_file(path).hexdigest()
+
+
+def _convert(source: Path, target: Path, args: list[str]):
+    """
+    Runs in a worker process. Writes to a temporary file first so an aborted
+    conversion never leaves a broken file in the cache.
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temporary = target.with_name(f"{target.stem}.{os.getpid()}.tmp.wav")
+    try:
+        subprocess.run(
+            ["ffmpeg", "-nostdin", "-v", "error", "-y", "-i", str(source), *args, str(temporary)],
+            check=True,
+            capture_output=True,
+        )
+    except subprocess.CalledProcessError as e:
+        temporary.unlink(missing_ok=True)
+        raise RuntimeError(f"failed to convert {source}: {e.stderr.decode().strip()}")
+    os.replace(temporary, target)
@@ -9,9 +9,6 @@ from threading import Thread
 from readchar import readkey, key
 
 
-logging.basicConfig(level=logging.DEBUG)
-
-
 class KeyboardReceiver(Thread):
     """
     Provides a simple shell for entering the different commands to the system. This receiver
@@ -19,11 +16,13 @@ class KeyboardReceiver(Thread):
     a simple user facing control panel without the need of setting up a real old dial phone.
     """
 
-    HELP = "P or ENTER: pick up / H: hang up / Q: quit / 0-9: dial number / ?: Help"
+    HELP = "P or ENTER: pick up / H: hang up / Q: quit / 0-9: dial number / S: switch session / ?: Help"
 
     def __init__(self, controller: Controller):
         super().__init__()
         self.__controller: Controller = controller
+        self.__session: int = 0
+        """The session (handset) the keys currently act on."""
         self.__do_quit: bool = False
     
     def run(self):
@@ -37,10 +36,13 @@ class KeyboardReceiver(Thread):
         selection = readkey().lower()
         if selection in ["p", key.ENTER]:
             print("> Pick up phone")
-            self.__controller.pick_up()
+            self.__controller.pick_up(self.__session)
         elif selection == "h":
             print("> Hang up phone")
-            self.__controller.hang_up()
+            self.__controller.hang_up(self.__session)
+        elif selection == "s":
+            self.__session = (self.__session + 1) % self.__controller.sessions
+            print(f"> Switch to session {self.__session}")
         elif selection == "?":
             print(KeyboardReceiver.HELP)
         elif selection == "q":
@@ -49,7 +51,7 @@ class KeyboardReceiver(Thread):
             self.__do_quit = True
         elif str(selection).isdigit() and int(selection) > -1 and int(selection) <= 9:
             print(f"> Dial number {selection}")
-            self.__controller.dial(int(selection))
+            self.__controller.dial(int(selection), self.__session)
         else:
             print("> Invalid command, type ? for help")
 
@@ -59,9 +61,10 @@ if Path("/etc/rpi-issue").exists():
 
 
     class DialPhoneReceiver(Thread):
-        def __init__(self, controller: Controller):
+        def __init__(self, controller: Controller, session: int = 0):
             super().__init__()
             self.__controller: Controller = controller
+            self.__session: int = session
             self.__queue: Queue[DialEvent] = Queue()
             self.__reader: RotaryReader = RotaryReader(
                 self.__queue,
@@ -83,12 +86,12 @@ if Path("/etc/rpi-issue").exists():
                     print("Logic error: got DIAL_EVENT with HandsetData as data")
                     return
                 print(f"> Dial number {event.data}")
-                self.__controller.dial(event.data)
+                self.__controller.dial(event.data, self.__session)
             if event.type == EventType.HANDSET_EVENT:
                 logging.debug("event parsed as EventType.HANDSET_EVENT")
                 if event.data is HandsetState.PICKED_UP:
                     print("> Pick up phone")
-                    self.__controller.pick_up()
+                    self.__controller.pick_up(self.__session)
                 elif event.data is HandsetState.HUNG_UP:
                     print("> Hang up phone")
-                    self.__controller.hang_up()
\ No newline at end of file
+                    self.__controller.hang_up(self.__session)
\ No newline at end of file
@@ -0,0 +1,137 @@
+from .compiled import CompiledScenario
+from .controller import Controller
+
+import logging
+import os
+from pathlib import Path
+from threading import Event, Thread
+from typing import Callable, Optional
+
+
+class ScenarioDiff:
+    """Differences between two versions of a scenario, nodes are compared by id."""
+
+    def __init__(self, old: CompiledScenario, new: CompiledScenario):
+        old_nodes = _nodes(old)
+        new_nodes = _nodes(new)
+        self.added = [id for id in new_nodes if id not in old_nodes]
+        self.removed = [id for id in old_nodes if id not in new_nodes]
+        self.changed = [
+            id for id, node in new_nodes.items()
+            if id in old_nodes and old_nodes[id] != node
+        ]
+        self.settings_changed = _settings(old) != _settings(new)
+        """Whether the start node, one of the special audio files or one of the timeouts changed."""
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed or self.settings_changed)
+
+    def __str__(self) -> str:
+        parts = [
+            f"{len(self.added)} added",
+            f"{len(self.removed)} removed",
+            f"{len(self.changed)} changed node(s)",
+        ]
+        if self.settings_changed:
+            parts.append("changed settings")
+        return ", ".join(parts)
+
+
+class ScenarioWatcher(Thread):
+    """
+    Polls the scenario file for changes and hands each valid new version to the
+    controller. Changes are only picked up once the file stayed the same for
+    one interval, as editors often write in several steps. Versions which
+    can't be loaded are rejected and the controller keeps the current one.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        controller: Controller,
+        scenario: CompiledScenario,
+        load: Callable[[Path], CompiledScenario],
+        interval: float = 1,
+    ):
+        super().__init__(daemon=True, name="scenario-watcher")
+        self.__path = path
+        self.__controller = controller
+        self.__scenario = scenario
+        """The version the controller currently uses."""
+        self.__load = load
+        self.__interval = interval
+        self.__stopped = Event()
+
+    def run(self):
+        last = _signature(self.__path)
+        while not self.__stopped.wait(self.__interval):
+            current = _signature(self.__path)
+            if current == last or current is None:
+                continue
+            if self.__stopped.wait(self.__interval):
+                break
+            if _signature(self.__path) != current:
+                # Still being written, look again in the next round.
+                continue
+            last = current
+            self.reload()
+
+    def reload(self) -> Optional[ScenarioDiff]:
+        """Loads the file and passes it to the controller if it changed and is valid."""
+        try:
+            scenario = self.__load(self.__path)
+        except Exception as e:
+            logging.error(f"changed scenario {self.__path} rejected, keeping the current version: {e}")
+            return None
+        diff = ScenarioDiff(self.__scenario, scenario)
+        if not diff:
+            return diff
+        logging.info(f"reloading scenario {self.__path}: {diff}")
+        self.__controller.reload(scenario)
+        self.__scenario = scenario
+        return diff
+
+    def stop(self):
+        self.__stopped.set()
+
+
+def _signature(path: Path) -> Optional[tuple[int, int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        # Editors replacing the file might remove it for a moment.
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def _nodes(scenario: CompiledScenario) -> dict[str, tuple]:
+    """Each node by id with everything that defines it, targets as ids."""
+    ids = scenario.ids
+
+    def id_of(target: int) -> Optional[str]:
+        return None if target == CompiledScenario.NO_NODE else ids[target]
+
+    return {
+        id: (
+            scenario.audio[node],
+            scenario.kinds[node],
+            tuple(id_of(target) for target in scenario.targets[10 * node:10 * node + 10]),
+            tuple(ids[target] for target in scenario.random_targets[node]),
+            scenario.random_weights[node],
+            scenario.repeat_after[node],
+            tuple(sorted((code, ids[target]) for code, target in scenario.codes.get(node, {}).items())),
+        )
+        for node, id in enumerate(ids)
+    }
+
+
+def _settings(scenario: CompiledScenario) -> tuple:
+    return (
+        scenario.ids[scenario.start],
+        scenario.invalid_number_audio,
+        scenario.invalid_number_fun_audio,
+        scenario.internal_error_audio,
+        scenario.end_call_audio,
+        scenario.max_repeats,
+        scenario.digit_timeout,
+    )
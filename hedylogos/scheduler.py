@@ -0,0 +1,88 @@
+import heapq
+from itertools import count
+import time
+from typing import Callable, Optional
+
+
+class Timer:
+    """A callback due at a point in time, cancelled with `Scheduler.cancel`."""
+
+    __slots__ = ("deadline", "callback", "cancelled")
+
+    def __init__(self, deadline: float, callback: Callable[[], None]):
+        self.deadline = deadline
+        self.callback: Optional[Callable[[], None]] = callback
+        """None once the timer ran."""
+        self.cancelled = False
+
+
+class Scheduler:
+    """
+    Timers of a single thread kept in a heap ordered by their deadline. The
+    thread asks for the `timeout` until the next deadline, waits for its other
+    events at most that long and then calls `run_due`. Starting a timer is
+    O(log n), cancelling it O(1). Cancelled timers stay in the heap until they
+    come up, if they make up more than half of it the heap is rebuilt without
+    them.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.__timers: list[tuple[float, int, Timer]] = []
+        self.__sequence = count()
+        """Keeps the order of timers with the same deadline and saves comparing them."""
+        self.__cancelled: int = 0
+
+    def __len__(self) -> int:
+        """Number of timers which weren't cancelled yet."""
+        return len(self.__timers) - self.__cancelled
+
+    def call_later(self, delay: float, callback: Callable[[], None]) -> Timer:
+        return self.call_at(self.clock() + delay, callback)
+
+    def call_at(self, deadline: float, callback: Callable[[], None]) -> Timer:
+        timer = Timer(deadline, callback)
+        heapq.heappush(self.__timers, (deadline, next(self.__sequence), timer))
+        return timer
+
+    def cancel(self, timer: Optional[Timer]):
+        """Cancels a timer, does nothing for None or timers which already ran or were cancelled."""
+        if timer is None or timer.cancelled or timer.callback is None:
+            return
+        timer.cancelled = True
+        self.__cancelled += 1
+        if self.__cancelled > 64 and 2 * self.__cancelled > len(self.__timers):
+            self.__timers = [entry for entry in self.__timers if not entry[2].cancelled]
+            heapq.heapify(self.__timers)
+            self.__cancelled = 0
+
+    def next_deadline(self) -> Optional[float]:
+        """Deadline of the next timer, None if there is none."""
+        self.__drop_cancelled()
+        return self.__timers[0][0] if self.__timers else None
+
+    def timeout(self) -> Optional[float]:
+        """Seconds until the next timer is due (0 if it already is), None if there is none."""
+        deadline = self.next_deadline()
+        if deadline is None:
+            return None
+        return max(0.0, deadline - self.clock())
+
+    def run_due(self) -> int:
+        """Calls the callbacks of all timers which are due, returns how many ran."""
+        now = self.clock()
+        ran = 0
+        while True:
+            self.__drop_cancelled()
+            if not self.__timers or self.__timers[0][0] > now:
+                return ran
+            _, _, timer = heapq.heappop(self.__timers)
+            callback, timer.callback = timer.callback, None
+            assert callback
+            callback()
+            ran += 1
+
+    def __drop_cancelled(self):
+        while self.__timers and self.__timers[0][2].cancelled:
+            heapq.heappop(self.__timers)
+            self.__cancelled -= 1
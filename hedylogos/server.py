@@ -0,0 +1,588 @@
+from .analysis import Issue, Severity
+from .check import AudioInfo, inspect
+from .model import Node, Scenario, format_str_list
+
+from collections import Counter, deque
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+from pathlib import Path
+import re
+import secrets
+from threading import Lock
+import time
+from typing import Any, Iterable, Optional
+from urllib.parse import urlsplit
+
+from pydantic import ValidationError
+
+
+SPECIAL_AUDIO = ("invalid_number_audio", "invalid_number_fun_audio", "internal_error_audio", "end_call_audio")
+"""Fields of the scenario referring to audio files."""
+
+EDITOR_ORIGIN = "https://72nd.github.io"
+"""Origin of the hosted editor, allowed by default."""
+
+TOKEN_HEADER = "X-Hedylogos-Token"
+
+
+class EditError(Exception):
+    """Raised when an edit can't be applied, carries the HTTP status for the response."""
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class LiveScenario:
+    """
+    A scenario kept in memory while it's edited. Every edit only validates what
+    it affects: the fields of the changed node, the links from and to it and
+    it's audio file. Reachability is kept as a tree of the links it was found
+    by: new links extend it and removing a link only matters if the tree uses
+    it, then just the part of the tree below it is searched again. Audio files
+    are inspected once and afterwards only when their size or modification
+    time changes.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.__location = path.resolve().parent
+        self.__settings: dict[str, Any] = {}
+        self.__raw: dict[str, dict[str, Any]] = {}
+        """The nodes as sent by the editor, by id and in order."""
+        self.__targets: dict[str, list[str]] = {}
+        """Link targets of every valid node."""
+        self.__incoming: dict[str, set[str]] = {}
+        """Nodes linking to an id, the id doesn't have to exist."""
+        self.__node_issues: dict[str, list[Issue]] = {}
+        self.__link_issues: dict[str, Issue] = {}
+        self.__audio_issues: dict[str, Issue] = {}
+        """Problems with audio files by node id, or by field for the special audio."""
+        self.__settings_issues: list[Issue] = []
+        self.__load_issues: list[Issue] = []
+        self.__parents: dict[str, Optional[str]] = {}
+        """Reachable nodes by the node they are reached from, None for the start node."""
+        self.__children: dict[str, set[str]] = {}
+        self.__audio: dict[Path, tuple[Optional[tuple[int, int]], AudioInfo]] = {}
+
+    @classmethod
+    def from_json(cls, path: Path) -> "LiveScenario":
+        rsl = cls(path)
+        with open(path, "r") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError(f"{path}: scenario has to be a JSON object")
+        rsl.replace(data)
+        return rsl
+
+    def as_dict(self) -> dict[str, Any]:
+        """The scenario in the form of the JSON file."""
+        return {**self.__settings, "nodes": list(self.__raw.values())}
+
+    def replace(self, data: dict[str, Any]):
+        """
+        Takes a whole scenario (as the editor has it), only the nodes which
+        differ from the current version are validated again.
+        """
+        raw_nodes = data.get("nodes")
+        self.__load_issues = []
+        if not isinstance(raw_nodes, list):
+            self.__load_issues.append(Issue(Severity.ERROR, "fields", "nodes has to be a list"))
+            raw_nodes = []
+        nodes: dict[str, dict[str, Any]] = {}
+        counts: Counter[str] = Counter()
+        for position, raw in enumerate(raw_nodes):
+            id = raw.get("id") if isinstance(raw, dict) else None
+            if not isinstance(id, str) or not id:
+                self.__load_issues.append(Issue(Severity.ERROR, "fields", "node without a valid id", f"#{position}"))
+                continue
+            counts[id] += 1
+            nodes.setdefault(id, raw)
+        for id, count in counts.items():
+            if count > 1:
+                self.__load_issues.append(Issue(Severity.ERROR, "unique ids", f"id is used by {count} nodes", id))
+        start = self.__settings.get("start_node")
+        removed = [id for id in self.__raw if id not in nodes]
+        for id in removed:
+            self.__remove(id)
+        changed = [id for id, raw in nodes.items() if self.__raw.get(id) != raw]
+        for id in changed:
+            self.__put(id, nodes[id])
+        self.__raw = {id: self.__raw[id] for id in nodes}
+        self.__set_settings({key: value for key, value in data.items() if key not in ("nodes", "nodes_dict")})
+        if removed or changed or self.__settings.get("start_node") != start:
+            self.__compute_reachable()
+
+    def update_settings(self, fields: dict[str, Any]):
+        """Changes fields of the scenario itself, like the start node."""
+        if "nodes" in fields:
+            raise EditError(HTTPStatus.BAD_REQUEST, "nodes can't be changed with the settings")
+        start = self.__settings.get("start_node")
+        self.__set_settings({**self.__settings, **fields})
+        if self.__settings.get("start_node") != start:
+            self.__compute_reachable()
+
+    def add_node(self, raw: dict[str, Any]):
+        id = _node_id(raw)
+        if id in self.__raw:
+            raise EditError(HTTPStatus.CONFLICT, f"there is already a node with the id '{id}'")
+        self.__put(id, raw)
+        self.__extend_reachable(id, [])
+
+    def update_node(self, id: str, raw: dict[str, Any]):
+        """Replaces a node, a different id in the new version renames it."""
+        self.__require(id)
+        new_id = _node_id(raw)
+        if new_id != id:
+            if new_id in self.__raw:
+                raise EditError(HTTPStatus.CONFLICT, f"there is already a node with the id '{new_id}'")
+            position = list(self.__raw).index(id)
+            self.__remove(id)
+            self.__put(new_id, raw)
+            order = list(self.__raw)
+            order.insert(position, order.pop())
+            self.__raw = {node: self.__raw[node] for node in order}
+            self.__cut(id)
+            self.__extend_reachable(new_id, [])
+            return
+        previous = self.__targets.get(id, [])
+        self.__put(id, raw)
+        current = self.__targets.get(id, [])
+        for target in set(previous) - set(current):
+            if target in self.__parents and self.__parents[target] == id:
+                self.__cut(target)
+        self.__extend_reachable(id, previous)
+
+    def remove_node(self, id: str):
+        self.__require(id)
+        self.__remove(id)
+        self.__cut(id)
+
+    def set_link(self, id: str, index: int, link: Optional[dict[str, Any]]):
+        """Replaces the link at an index, appends it if the index is the number of links, removes it if `link` is None."""
+        raw = dict(self.__require(id))
+        links = list(raw.get("links") or [])
+        if not 0 <= index <= len(links) or (index == len(links) and link is None):
+            raise EditError(HTTPStatus.NOT_FOUND, f"node '{id}' has no link {index}")
+        if link is None:
+            links.pop(index)
+        elif index == len(links):
+            links.append(link)
+        else:
+            links[index] = link
+        raw["links"] = links if links else None
+        self.update_node(id, raw)
+
+    def recheck_audio(self):
+        """Checks all audio files again, only the ones which changed on disk are inspected."""
+        for id, raw in self.__raw.items():
+            self.__check_node_audio(id, raw)
+        self.__check_special_audio()
+
+    def status(self) -> dict[str, Any]:
+        issues = self.issues()
+        unreachable = [id for id in self.__raw if id not in self.__parents]
+        return {
+            "valid": not any(issue.severity is Severity.ERROR for issue in issues),
+            "nodes": len(self.__raw),
+            "reachable": len(self.__raw) - len(unreachable),
+            "unreachable": unreachable,
+            "issues": [issue.as_dict() for issue in issues],
+        }
+
+    def issues(self) -> list[Issue]:
+        rsl = self.__load_issues + self.__settings_issues
+        start = self.__settings.get("start_node")
+        if isinstance(start, str) and start and start not in self.__raw:
+            rsl.append(Issue(Severity.ERROR, "start node", f"start node '{start}' doesn't exist"))
+        for issues in self.__node_issues.values():
+            rsl.extend(issues)
+        rsl.extend(self.__link_issues.values())
+        rsl.extend(self.__audio_issues.values())
+        return rsl
+
+    def save(self, path: Optional[Path] = None):
+        """Writes the scenario as JSON after validating it completely, refuses if it isn't valid."""
+        try:
+            scenario = Scenario.model_validate(self.as_dict())
+        except ValidationError as e:
+            raise EditError(HTTPStatus.CONFLICT, f"scenario isn't valid, {e.error_count()} error(s)")
+        scenario.to_json(path if path else self.path)
+
+    def __require(self, id: str) -> dict[str, Any]:
+        if id not in self.__raw:
+            raise EditError(HTTPStatus.NOT_FOUND, f"there is no node with the id '{id}'")
+        return self.__raw[id]
+
+    def __put(self, id: str, raw: dict[str, Any]):
+        self.__unlink(id)
+        self.__raw[id] = raw
+        issues: list[Issue] = []
+        try:
+            node: Optional[Node] = Node.model_validate(raw)
+        except ValidationError as e:
+            node = None
+            for error in e.errors():
+                field = ".".join(str(part) for part in error["loc"])
+                issues.append(Issue(Severity.ERROR, "fields", f"{field}: {error['msg']}", id))
+        _set(self.__node_issues, id, issues if issues else None)
+        if node is not None:
+            targets = [link.target for link in node.links] if node.links else []
+            self.__targets[id] = targets
+            for target in targets:
+                self.__incoming.setdefault(target, set()).add(id)
+        self.__check_links(id)
+        # Links to this id might just have become valid.
+        for source in self.__incoming.get(id, ()):
+            self.__check_links(source)
+        self.__check_node_audio(id, raw)
+
+    def __remove(self, id: str):
+        self.__unlink(id)
+        del self.__raw[id]
+        for issues in (self.__node_issues, self.__link_issues, self.__audio_issues):
+            issues.pop(id, None)
+        for source in self.__incoming.get(id, ()):
+            self.__check_links(source)
+
+    def __unlink(self, id: str):
+        for target in self.__targets.pop(id, []):
+            sources = self.__incoming.get(target)
+            if sources is not None:
+                sources.discard(id)
+                if not sources:
+                    del self.__incoming[target]
+
+    def __check_links(self, id: str):
+        invalid = [target for target in self.__targets.get(id, []) if target not in self.__raw]
+        _set(self.__link_issues, id, Issue(
+            Severity.ERROR,
+            "link targets",
+            f"invalid link target(s) {format_str_list(invalid)}",
+            id,
+        ) if invalid else None)
+
+    def __set_settings(self, settings: dict[str, Any]):
+        self.__settings = settings
+        self.__settings_issues = []
+        try:
+            Scenario.model_validate({**settings, "nodes": []})
+        except ValidationError as e:
+            for error in e.errors():
+                field = ".".join(str(part) for part in error["loc"])
+                self.__settings_issues.append(Issue(Severity.ERROR, "fields", f"{field}: {error['msg']}"))
+        self.__check_special_audio()
+
+    def __check_node_audio(self, id: str, raw: dict[str, Any]):
+        audio = raw.get("audio")
+        error = self.__audio_error(audio) if isinstance(audio, str) and audio else None
+        _set(self.__audio_issues, id, Issue(Severity.ERROR, "audio", error, id) if error else None)
+
+    def __check_special_audio(self):
+        for field in SPECIAL_AUDIO:
+            audio = self.__settings.get(field)
+            error = self.__audio_error(audio) if isinstance(audio, str) and audio else None
+            _set(self.__audio_issues, field, Issue(Severity.ERROR, "audio", f"{field}: {error}") if error else None)
+
+    def __audio_error(self, audio: str) -> Optional[str]:
+        path = (self.__location / audio).resolve()
+        try:
+            stat = os.stat(path)
+            key: Optional[tuple[int, int]] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            key = None
+        cached = self.__audio.get(path)
+        if cached and cached[0] == key and key is not None:
+            info = cached[1]
+        else:
+            info = inspect(path)
+            self.__audio[path] = (key, info)
+        return info.error and str(info)
+
+    def __compute_reachable(self):
+        self.__parents = {}
+        self.__children = {}
+        start = self.__settings.get("start_node")
+        if isinstance(start, str) and start in self.__raw:
+            self.__parents[start] = None
+            self.__expand([start])
+
+    def __extend_reachable(self, id: str, previous: Iterable[str]):
+        """Follows the links a node gained, or the node itself if it just became reachable."""
+        if id in self.__parents:
+            reached: list[str] = []
+            for target in self.__targets.get(id, []):
+                if target not in previous and target not in self.__parents and target in self.__raw:
+                    self.__adopt(id, target)
+                    reached.append(target)
+            self.__expand(reached)
+        else:
+            self.__attach(id)
+
+    def __attach(self, id: str):
+        """Makes a node reachable if one of the nodes linking to it is."""
+        if id not in self.__raw:
+            return
+        if id == self.__settings.get("start_node"):
+            self.__parents[id] = None
+            self.__expand([id])
+            return
+        for source in self.__incoming.get(id, ()):
+            if source in self.__parents:
+                self.__adopt(source, id)
+                self.__expand([id])
+                return
+
+    def __cut(self, id: str):
+        """
+        Removes a node and everything reached through it from the tree, then
+        attaches each of these nodes again if it's still reachable another way.
+        """
+        if id not in self.__parents:
+            return
+        parent = self.__parents[id]
+        if parent is not None:
+            self.__children[parent].discard(id)
+        subtree = [id]
+        for node in subtree:
+            subtree.extend(self.__children.pop(node, ()))
+            del self.__parents[node]
+        if parent is None:
+            # The start node itself, nothing can be reached.
+            self.__compute_reachable()
+            return
+        for node in subtree:
+            if node not in self.__parents:
+                self.__attach(node)
+
+    def __expand(self, frontier: list[str]):
+        """Adds everything reachable from the frontier (which is already part of it) to the tree."""
+        queue = deque(frontier)
+        while queue:
+            current = queue.popleft()
+            for target in self.__targets.get(current, []):
+                if target not in self.__parents and target in self.__raw:
+                    self.__adopt(current, target)
+                    queue.append(target)
+
+    def __adopt(self, parent: str, id: str):
+        self.__parents[id] = parent
+        self.__children.setdefault(parent, set()).add(id)
+
+
+def _node_id(raw: Any) -> str:
+    if not isinstance(raw, dict):
+        raise EditError(HTTPStatus.BAD_REQUEST, "a node has to be a JSON object")
+    id = raw.get("id")
+    if not isinstance(id, str) or not id:
+        raise EditError(HTTPStatus.BAD_REQUEST, "a node needs an id")
+    return id
+
+
+def _set(issues: dict, key: str, value: Any):
+    if value:
+        issues[key] = value
+    else:
+        issues.pop(key, None)
+
+
+class ScenarioServer(ThreadingHTTPServer):
+    """
+    Local HTTP server for the editor. It keeps a `LiveScenario` and answers
+    every request with the result of the validation as JSON:
+
+    - `GET /scenario`, `PUT /scenario` (whole scenario), `PATCH /scenario` (fields besides the nodes)
+    - `GET /status`
+    - `POST /nodes`, `PUT /nodes/ID`, `DELETE /nodes/ID`
+    - `PUT /nodes/ID/links/INDEX`, `DELETE /nodes/ID/links/INDEX`
+    - `POST /audio` checks the audio files again, `POST /save` writes the file
+
+    Browsers only get answers for pages from the allowed `origins`, by default
+    the hosted editor and pages served from the local machine. Every request
+    besides `GET` also has to carry the `token` (created on each start) in the
+    `X-Hedylogos-Token` header, thus other pages can't change or overwrite
+    the scenario.
+    """
+
+    daemon_threads = True
+    max_body = 64 * 1024 * 1024
+    """Bodies of requests larger than this (in bytes) are rejected without reading them."""
+
+    def __init__(
+        self,
+        scenario: LiveScenario,
+        address: tuple[str, int],
+        origins: Optional[list[str]] = None,
+        token: Optional[str] = None,
+    ):
+        super().__init__(address, _Handler)
+        self.scenario = scenario
+        self.lock = Lock()
+        self.origins = origins if origins is not None else [EDITOR_ORIGIN]
+        """Additionally to these, origins on localhost are always allowed."""
+        self.token = token if token else secrets.token_urlsafe(16)
+
+    def allows_origin(self, origin: str) -> bool:
+        if origin in self.origins:
+            return True
+        try:
+            parts = urlsplit(origin)
+        except ValueError:
+            return False
+        return parts.scheme in ("http", "https") and parts.hostname in ("localhost", "127.0.0.1", "::1")
+
+
+_ROUTES = [
+    ("GET", re.compile(r"/scenario"), "scenario"),
+    ("PUT", re.compile(r"/scenario"), "replace"),
+    ("PATCH", re.compile(r"/scenario"), "settings"),
+    ("GET", re.compile(r"/status"), "status"),
+    ("POST", re.compile(r"/nodes"), "add"),
+    ("PUT", re.compile(r"/nodes/([^/]+)"), "update"),
+    ("DELETE", re.compile(r"/nodes/([^/]+)"), "remove"),
+    ("PUT", re.compile(r"/nodes/([^/]+)/links/(\d+)"), "link"),
+    ("DELETE", re.compile(r"/nodes/([^/]+)/links/(\d+)"), "unlink"),
+    ("POST", re.compile(r"/audio"), "audio"),
+    ("POST", re.compile(r"/save"), "save"),
+]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: ScenarioServer
+
+    def do_GET(self):
+        self.__handle("GET")
+
+    def do_PUT(self):
+        self.__handle("PUT")
+
+    def do_PATCH(self):
+        self.__handle("PATCH")
+
+    def do_POST(self):
+        self.__handle("POST")
+
+    def do_DELETE(self):
+        self.__handle("DELETE")
+
+    def do_OPTIONS(self):
+        # Preflight of the editor, which is opened from another origin.
+        methods = [method for method, pattern, _ in _ROUTES if pattern.fullmatch(self.__route_path())]
+        if not self.__origin_allowed() or not methods:
+            self.send_response(HTTPStatus.FORBIDDEN if methods else HTTPStatus.NOT_FOUND)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(HTTPStatus.NO_CONTENT)
+        self.__cors()
+        self.send_header("Access-Control-Allow-Methods", ", ".join(methods))
+        self.send_header("Access-Control-Allow-Headers", f"Content-Type, {TOKEN_HEADER}")
+        self.end_headers()
+
+    def log_message(self, format: str, *args):
+        pass
+
+    def __handle(self, method: str):
+        from urllib.parse import unquote
+
+        if not self.__origin_allowed():
+            self.__respond(HTTPStatus.FORBIDDEN, {"error": f"origin {self.headers.get('Origin')} isn't allowed, see serve --allow-origin"})
+            return
+        if method != "GET" and not secrets.compare_digest(self.headers.get(TOKEN_HEADER, ""), self.server.token):
+            self.__respond(HTTPStatus.FORBIDDEN, {"error": f"missing or wrong {TOKEN_HEADER} header, the token is printed by serve"})
+            return
+        path = self.__route_path()
+        for route_method, pattern, action in _ROUTES:
+            match = pattern.fullmatch(path)
+            if match and route_method == method:
+                break
+        else:
+            self.__respond(HTTPStatus.NOT_FOUND, {"error": f"no route for {method} {path}"})
+            return
+        args = [unquote(group) for group in match.groups()]
+        try:
+            body = self.__body()
+            start = time.perf_counter()
+            with self.server.lock:
+                rsl = self.__apply(action, args, body)
+                if rsl is None:
+                    rsl = self.server.scenario.status()
+            rsl["milliseconds"] = (time.perf_counter() - start) * 1000
+            self.__respond(HTTPStatus.OK, rsl)
+        except EditError as e:
+            self.__respond(e.status, {"error": str(e)})
+
+    def __apply(self, action: str, args: list[str], body: Any) -> Optional[dict[str, Any]]:
+        """Applies the action, returns the response if it isn't the status."""
+        scenario = self.server.scenario
+        if action == "scenario":
+            return scenario.as_dict()
+        elif action == "replace":
+            scenario.replace(_object(body))
+        elif action == "settings":
+            scenario.update_settings(_object(body))
+        elif action == "add":
+            scenario.add_node(body)
+        elif action == "update":
+            scenario.update_node(args[0], body)
+        elif action == "remove":
+            scenario.remove_node(args[0])
+        elif action == "link":
+            scenario.set_link(args[0], int(args[1]), _object(body))
+        elif action == "unlink":
+            scenario.set_link(args[0], int(args[1]), None)
+        elif action == "audio":
+            scenario.recheck_audio()
+        elif action == "save":
+            scenario.save()
+        return None
+
+    def __body(self) -> Any:
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            raise EditError(HTTPStatus.BAD_REQUEST, f"invalid Content-Length '{self.headers.get('Content-Length')}'")
+        if length > self.server.max_body:
+            # The body stays unread, the connection can't be used any further.
+            self.close_connection = True
+            raise EditError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"request body larger than {self.server.max_body} bytes")
+        if not length:
+            return None
+        try:
+            return json.loads(self.rfile.read(length))
+        except json.JSONDecodeError as e:
+            raise EditError(HTTPStatus.BAD_REQUEST, f"invalid JSON: {e}")
+
+    def __respond(self, status: HTTPStatus, data: dict[str, Any]):
+        content = json.dumps(data).encode()
+        self.send_response(status)
+        self.__cors()
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def __route_path(self) -> str:
+        return self.path.split("?", 1)[0].rstrip("/")
+
+    def __origin_allowed(self) -> bool:
+        """Requests without an origin don't come from a browser page."""
+        origin = self.headers.get("Origin")
+        return origin is None or self.server.allows_origin(origin)
+
+    def __cors(self):
+        origin = self.headers.get("Origin")
+        if origin is not None and self.server.allows_origin(origin):
+            self.send_header("Access-Control-Allow-Origin", origin)
+            self.send_header("Vary", "Origin")
+
+
+def _object(body: Any) -> dict[str, Any]:
+    if not isinstance(body, dict):
+        raise EditError(HTTPStatus.BAD_REQUEST, "expected a JSON object")
+    return body
@@ -0,0 +1,425 @@
+from .audio import Backend, Channel, Clip, NullBackend, OutputEngine
+from .compiled import CompiledScenario
+from .controller import Controller
+
+from collections import Counter, deque
+import heapq
+from itertools import count
+import json
+from pathlib import Path
+import random
+from threading import Condition
+import time
+from typing import Callable, Iterable, Optional
+import wave
+
+
+class VirtualClock:
+    """Simulated time in seconds, only advances when the simulation says so."""
+
+    def __init__(self):
+        self.now: float = 0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class _HeaderClip(Clip):
+    """A clip without audio data which still knows it's duration."""
+
+    def __init__(self, frames: int, channels: int, sample_width: int, sample_rate: int):
+        super().__init__(b"", channels, sample_width, sample_rate)
+        self.__frames = frames
+
+    @property
+    def frames(self) -> int:
+        return self.__frames
+
+
+def read_header(path: Path) -> Clip:
+    """Loader for the simulation, reads only the header of a WAV file."""
+    with wave.open(str(path), "rb") as f:
+        return _HeaderClip(f.getnframes(), f.getnchannels(), f.getsampwidth(), f.getframerate())
+
+
+class _VirtualChannel(Channel):
+    def __init__(
+        self,
+        output: "VirtualOutput",
+        session: int,
+        on_ended: Callable[[int], None],
+        on_started: Optional[Callable[[int, float], None]],
+    ):
+        super().__init__(NullBackend(), on_ended, output.condition, 0, on_started)
+        self.__output = output
+        self.__session = session
+        self.__on_ended = on_ended
+        self.__on_started = on_started
+        self.__pending: deque[tuple[Clip, int]] = deque()
+        self.__playing = False
+        self.__epoch: int = 0
+        """Incremented on every stop, end events of stopped clips are ignored."""
+
+    @property
+    def idle(self) -> bool:
+        return not self.__playing and not self.__pending
+
+    def play(self, clip: Clip, token: int):
+        self.stop()
+        self.enqueue(clip, token)
+
+    def enqueue(self, clip: Clip, token: int):
+        self.__pending.append((clip, token))
+        if not self.__playing:
+            self.__next()
+
+    def stop(self):
+        self.__pending.clear()
+        self.__playing = False
+        self.__epoch += 1
+
+    def __next(self):
+        clip, token = self.__pending.popleft()
+        self.__playing = True
+        if self.__on_started:
+            self.__on_started(token, 0)
+        epoch = self.__epoch
+        self.__output.schedule(clip.duration, self.__session, lambda: self.__ended(epoch, token))
+
+    def __ended(self, epoch: int, token: int):
+        if epoch != self.__epoch:
+            return
+        self.__playing = False
+        self.__on_ended(token)
+        if self.__pending:
+            self.__next()
+
+
+class VirtualOutput(OutputEngine):
+    """
+    Replaces the output engine in the simulation. Nothing is played, instead
+    the end of each clip is scheduled on the virtual clock. Everything happens
+    on the thread running the simulation.
+    """
+
+    def __init__(self, clock: VirtualClock):
+        super().__init__()
+        self.clock = clock
+        self.condition = Condition()
+        self.channels: list[_VirtualChannel] = []
+        self.__events: list[tuple[float, int, int, Callable[[], None]]] = []
+        self.__sequence = count()
+
+    def channel(
+        self,
+        backend: Backend,
+        on_ended: Callable[[int], None],
+        on_started: Optional[Callable[[int, float], None]] = None,
+    ) -> Channel:
+        channel = _VirtualChannel(self, len(self.channels), on_ended, on_started)
+        self.channels.append(channel)
+        return channel
+
+    def start(self):
+        pass
+
+    def close(self):
+        for channel in self.channels:
+            channel.stop()
+
+    def schedule(self, delay: float, session: int, callback: Callable[[], None]):
+        """Calls the callback for the given session after `delay` simulated seconds."""
+        heapq.heappush(self.__events, (self.clock.now + delay, next(self.__sequence), session, callback))
+
+    def next_time(self) -> Optional[float]:
+        """When the next event is due, None if there is none."""
+        return self.__events[0][0] if self.__events else None
+
+    def pop(self) -> Optional[tuple[int, Callable[[], None]]]:
+        """Advances the clock to the next event and returns it's session and callback."""
+        if not self.__events:
+            return None
+        self.clock.now, _, session, callback = heapq.heappop(self.__events)
+        return session, callback
+
+
+class TraceEvent:
+    """An input of a handset at a point in (simulated) time."""
+
+    ACTIONS = ("pick_up", "hang_up", "dial")
+
+    def __init__(self, time: float, session: int, action: str, number: Optional[int] = None):
+        if action not in self.ACTIONS:
+            raise ValueError(f"unknown action '{action}', has to be one of {', '.join(self.ACTIONS)}")
+        if (action == "dial") != (number is not None):
+            raise ValueError("a number is needed for (and only for) dial events")
+        self.time = time
+        self.session = session
+        self.action = action
+        self.number = number
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TraceEvent":
+        return cls(data["time"], data.get("session", 0), data["action"], data.get("number"))
+
+    def as_dict(self) -> dict:
+        rsl = {"time": self.time, "session": self.session, "action": self.action}
+        if self.number is not None:
+            rsl["number"] = self.number
+        return rsl
+
+
+def read_trace(path: Path) -> list[TraceEvent]:
+    """Reads a trace file, one JSON object per line."""
+    with open(path, "r") as f:
+        return [TraceEvent.from_dict(json.loads(line)) for line in f if line.strip()]
+
+
+def write_trace(events: Iterable[TraceEvent], path: Path):
+    with open(path, "w") as f:
+        for event in events:
+            f.write(json.dumps(event.as_dict()) + "\n")
+
+
+class _Visitor:
+    """State of the random visitor of one session."""
+
+    def __init__(self, visits: int):
+        self.remaining = visits
+        self.visit: int = 0
+        """Number of the current visit, scheduled events of past visits are dropped."""
+        self.active = False
+        self.waiting = False
+        self.node: int = CompiledScenario.NO_NODE
+
+
+class Simulation:
+    """
+    Runs the real controller logic without audio hardware and without waiting:
+    clips only have a duration (read from the WAV header) and a virtual clock
+    jumps from one event to the next. Inputs come either from a trace or from
+    random visitors which wait for the audio to end, dial random numbers and
+    hang up once the scenario ended.
+    """
+
+    def __init__(
+        self,
+        scenario: CompiledScenario,
+        sessions: int = 1,
+        loader: Optional[Callable[[Path], Clip]] = None,
+        seed: Optional[int] = None,
+    ):
+        self.scenario = scenario
+        self.clock = VirtualClock()
+        self.__output = VirtualOutput(self.clock)
+        self.__controller = Controller(
+            scenario,
+            prefetch_depth=0,
+            backends=[NullBackend(self.clock) for _ in range(sessions)],
+            loader=loader if loader else read_header,
+            output=self.__output,
+            on_node=self.__on_node,
+            clock=self.clock,
+            on_timeout=self.__on_timeout,
+        )
+        self.__random = random.Random(seed)
+        self.__visitors: list[_Visitor] = []
+        self.__previous: list[int] = [CompiledScenario.NO_NODE] * sessions
+        self.sessions = sessions
+        self.trace: list[TraceEvent] = []
+        """All inputs in the order they were simulated."""
+        self.events: int = 0
+        self.visits: int = 0
+        self.completed: int = 0
+        """Visits which reached the end of the scenario."""
+        self.timed_out: int = 0
+        """Visits ended by the controller because nobody dialed."""
+        self.node_visits: list[int] = [0] * len(scenario)
+        self.random_choices: dict[int, Counter] = {}
+        """How often each target of a node with unnumbered links was chosen."""
+        self.wall_time: float = 0
+
+    def replay(self, trace: Iterable[TraceEvent], until: Optional[float] = None):
+        """Feeds a trace into the controller, runs until `until` (defaults to an hour after the last event)."""
+        last = 0.0
+        for event in trace:
+            if not 0 <= event.session < self.sessions:
+                raise ValueError(f"trace uses session {event.session} but only {self.sessions} are simulated")
+            self.__output.schedule(event.time, event.session, lambda event=event: self.__input(event))
+            last = max(last, event.time)
+        self.__run(until if until is not None else last + 3600)
+
+    def visit(
+        self,
+        visits: int,
+        think_time: float = 2,
+        pause: float = 10,
+        hang_up_probability: float = 0.05,
+        max_duration: float = 600,
+    ):
+        """
+        Simulates `visits` random visits spread over all sessions. Visitors
+        wait about `think_time` seconds before they dial, hang up early with
+        `hang_up_probability` on each menu and after `max_duration` at the
+        latest. Between two visits of a session there are about `pause` seconds.
+        """
+        self.__think_time = think_time
+        self.__pause = pause
+        self.__hang_up_probability = hang_up_probability
+        self.__max_duration = max_duration
+        self.__visitors = [
+            _Visitor(visits // self.sessions + (1 if session < visits % self.sessions else 0))
+            for session in range(self.sessions)
+        ]
+        for session, visitor in enumerate(self.__visitors):
+            if visitor.remaining:
+                self.__schedule_pick_up(session)
+        self.__run(None)
+
+    def as_dict(self) -> dict:
+        return {
+            "sessions": self.sessions,
+            "events": self.events,
+            "visits": self.visits,
+            "completed": self.completed,
+            "timed_out": self.timed_out,
+            "simulated_seconds": self.clock.now,
+            "wall_seconds": self.wall_time,
+            "events_per_second": self.events / self.wall_time if self.wall_time else None,
+            "node_visits": {
+                self.scenario.ids[node]: visits for node, visits in enumerate(self.node_visits)
+            },
+            "random_links": [
+                {
+                    "node": self.scenario.ids[node],
+                    "total": sum(choices.values()),
+                    "targets": [
+                        {
+                            "target": self.scenario.ids[target],
+                            "expected": expected,
+                            "observed": choices[target] / sum(choices.values()),
+                        }
+                        for target, expected in self.expected_choices(node).items()
+                    ],
+                }
+                for node, choices in sorted(self.random_choices.items())
+            ],
+        }
+
+    def expected_choices(self, node: int) -> dict[int, float]:
+        """Probability of each target of a node with unnumbered links."""
+        targets = self.scenario.random_targets[node]
+        weights = self.scenario.random_weights[node]
+        rsl: dict[int, float] = {}
+        for i, target in enumerate(targets):
+            if weights is None:
+                share = 1 / len(targets)
+            else:
+                share = (weights[i] - (weights[i - 1] if i else 0)) / weights[-1]
+            rsl[target] = rsl.get(target, 0) + share
+        return rsl
+
+    def __run(self, until: Optional[float]):
+        start = time.perf_counter()
+        controller = self.__controller
+        while True:
+            deadline = controller.next_deadline()
+            upcoming = self.__output.next_time()
+            if deadline is not None and (upcoming is None or deadline < upcoming):
+                # A timer of the controller comes first, like the repetition of a node.
+                if until is not None and deadline > until:
+                    break
+                self.clock.now = deadline
+                controller.process_pending()
+                self.events += 1
+                if self.__visitors:
+                    for session in range(self.sessions):
+                        self.__check_idle(session)
+                continue
+            event = self.__output.pop()
+            if event is None or (until is not None and self.clock.now > until):
+                break
+            session, callback = event
+            callback()
+            self.events += 1
+            controller.process_pending()
+            if self.__visitors:
+                self.__check_idle(session)
+        controller.quit()
+        controller.process_pending()
+        self.wall_time += time.perf_counter() - start
+
+    def __input(self, event: TraceEvent):
+        self.trace.append(event)
+        if event.action == "pick_up":
+            self.visits += 1
+            self.__previous[event.session] = CompiledScenario.NO_NODE
+            self.__controller.pick_up(event.session)
+        elif event.action == "hang_up":
+            self.__controller.hang_up(event.session)
+        elif event.number is not None:
+            self.__controller.dial(event.number, event.session)
+
+    def __on_node(self, session: int, node: int):
+        self.node_visits[node] += 1
+        if self.scenario.kinds[node] == CompiledScenario.END:
+            self.completed += 1
+        previous = self.__previous[session]
+        if previous != CompiledScenario.NO_NODE and self.scenario.kinds[previous] == CompiledScenario.RANDOM:
+            self.random_choices.setdefault(previous, Counter())[node] += 1
+        self.__previous[session] = node
+        if self.__visitors:
+            self.__visitors[session].node = node
+
+    def __on_timeout(self, session: int):
+        self.timed_out += 1
+        if self.__visitors:
+            self.__visitors[session].node = CompiledScenario.NO_NODE
+
+    def __check_idle(self, session: int):
+        visitor = self.__visitors[session]
+        if not visitor.active or visitor.waiting or not self.__output.channels[session].idle:
+            return
+        kind = self.scenario.kinds[visitor.node] if visitor.node != CompiledScenario.NO_NODE else None
+        if kind == CompiledScenario.MENU and self.__random.random() >= self.__hang_up_probability:
+            number = self.__random.randrange(10)
+            self.__schedule(session, self.__random.expovariate(1 / self.__think_time), "dial", number)
+            return
+        self.__hang_up(session)
+
+    def __schedule(self, session: int, delay: float, action: str, number: Optional[int] = None):
+        visitor = self.__visitors[session]
+        visitor.waiting = True
+        visit = visitor.visit
+
+        def act():
+            if visitor.visit != visit or not visitor.active:
+                return
+            visitor.waiting = False
+            self.__input(TraceEvent(self.clock.now, session, action, number))
+        self.__output.schedule(delay, session, act)
+
+    def __schedule_pick_up(self, session: int):
+        visitor = self.__visitors[session]
+
+        def pick_up():
+            visitor.visit += 1
+            visitor.active = True
+            visitor.waiting = False
+            visitor.node = CompiledScenario.NO_NODE
+            self.__input(TraceEvent(self.clock.now, session, "pick_up"))
+            visit = visitor.visit
+            self.__output.schedule(
+                self.__max_duration,
+                session,
+                lambda: self.__hang_up(session) if visitor.visit == visit and visitor.active else None,
+            )
+        self.__output.schedule(self.__random.expovariate(1 / self.__pause), session, pick_up)
+
+    def __hang_up(self, session: int):
+        visitor = self.__visitors[session]
+        visitor.active = False
+        visitor.remaining -= 1
+        self.__input(TraceEvent(self.clock.now, session, "hang_up"))
+        if visitor.remaining > 0:
+            self.__schedule_pick_up(session)
@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+from typing import Optional
+
+
+_IMPORTED = time.perf_counter()
+
+
+class StartupProfile:
+    """
+    Durations of the phases from the start of the process until a command is
+    ready, to track the boot-to-ready time of an exhibit. The first phase is
+    the interpreter itself (up to the import of this module), every call of
+    `mark` ends the current phase.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.phases: list[tuple[str, float]] = []
+        interpreter = _process_age()
+        if interpreter is not None:
+            self.phases.append(("interpreter", interpreter))
+        self.__last = _IMPORTED
+        self.__reported = False
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.__last))
+        self.__last = now
+
+    def report(self, phase: Optional[str] = None):
+        """
+        Ends the current phase (if a name for it is given) and prints all phases
+        to stderr. Does nothing if the profile isn't enabled or was already printed.
+        """
+        if not self.enabled or self.__reported:
+            return
+        self.__reported = True
+        if phase:
+            self.mark(phase)
+        total = sum(duration for _, duration in self.phases)
+        for phase, duration in self.phases:
+            print(f"{phase:>16}: {duration * 1000:8.1f} ms", file=sys.stderr)
+        print(f"{'total':>16}: {total * 1000:8.1f} ms", file=sys.stderr)
+
+
+def _process_age() -> Optional[float]:
+    """Seconds since the process was started, only available on Linux (with a resolution of a clock tick)."""
+    try:
+        with open("/proc/self/stat", "r") as f:
+            # The command name may contain spaces, the fields after it don't.
+            fields = f.read().rsplit(")", 1)[1].split()
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return max(0.0, time.clock_gettime(time.CLOCK_BOOTTIME) - started)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
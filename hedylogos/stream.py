@@ -0,0 +1,193 @@
+from .model import Node, Scenario, format_str_list
+
+import json
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional, TextIO
+
+
+class _Tokens:
+    """
+    Reads JSON values one after another from a file, only the value currently
+    decoded (and the rest of the chunk it's in) is held in memory.
+    """
+
+    def __init__(self, f: TextIO, chunk_size: int):
+        self.__file = f
+        self.__chunk_size = chunk_size
+        self.__decoder = json.JSONDecoder()
+        self.__buffer = ""
+        self.__position = 0
+        self.__offset = 0
+        """Characters dropped from the front of the buffer, for the positions in error messages."""
+        self.__eof = False
+
+    def peek(self) -> str:
+        """Skips whitespace and returns the next character, an empty string at the end of the file."""
+        while True:
+            buffer = self.__buffer
+            while self.__position < len(buffer) and buffer[self.__position] in " \t\n\r":
+                self.__position += 1
+            if self.__position < len(buffer) or not self.__fill():
+                return self.__buffer[self.__position:self.__position + 1]
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            found = self.peek() or "end of file"
+            raise ValueError(f"invalid JSON at character {self.__offset + self.__position}: expected '{char}', found '{found}'")
+        self.__position += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.__decoder.raw_decode(self.__buffer, self.__position)
+            except json.JSONDecodeError as e:
+                if self.__cut_off(e) and self.__fill():
+                    continue
+                raise ValueError(f"invalid JSON at character {self.__offset + e.pos}: {e.msg}")
+            # A number at the end of the chunk might continue in the next one.
+            if self.__incomplete(value, end) and self.__fill():
+                continue
+            self.__position = end
+            return value
+
+    def __cut_off(self, error: json.JSONDecodeError) -> bool:
+        """
+        Whether the error may come from a value continuing in the next chunk,
+        other errors are raised without reading the rest of the file.
+        """
+        # Unterminated strings are reported at their beginning, literals and
+        # escapes cut off by the end of the chunk a few characters before it.
+        return error.msg.startswith("Unterminated string") or error.pos >= len(self.__buffer) - 8
+
+    def __incomplete(self, value: Any, end: int) -> bool:
+        if end == len(self.__buffer):
+            return True
+        return isinstance(value, (int, float)) and not isinstance(value, bool) and self.__buffer[end] in ".eE+-0123456789"
+
+    def __fill(self) -> bool:
+        """Reads more of the file, returns False at it's end."""
+        if self.__eof:
+            return False
+        # Growing with the buffer keeps values spanning many chunks linear.
+        data = self.__file.read(max(self.__chunk_size, len(self.__buffer) - self.__position))
+        if not data:
+            self.__eof = True
+            return False
+        self.__offset += self.__position
+        self.__buffer = self.__buffer[self.__position:] + data
+        self.__position = 0
+        return True
+
+
+class ScenarioReader:
+    """
+    Reads a scenario JSON file without holding all of it in memory. `nodes`
+    parses the nodes one by one and validates each of them as it arrives. The
+    checks spanning several nodes (unique ids, link targets) only keep the
+    ids. The remaining fields of the scenario are available from `settings`
+    once all nodes were read, they can come before or after the nodes.
+
+    With `skip_content` the transcripts of the nodes are dropped right after
+    parsing, they aren't needed to run the scenario.
+    """
+
+    def __init__(self, path: Path, skip_content: bool = False, chunk_size: int = 64 * 1024):
+        self.path = path
+        self.skip_content = skip_content
+        self.chunk_size = chunk_size
+        self.__settings: Optional[Scenario] = None
+
+    def nodes(self) -> Iterator[Node]:
+        """Validated nodes in the order of the file, raises ValueError on the first invalid one."""
+        settings: dict[str, Any] = {}
+        has_nodes = False
+        with open(self.path, "r", encoding="utf-8") as f:
+            tokens = _Tokens(f, self.chunk_size)
+            tokens.expect("{")
+            while tokens.peek() != "}":
+                if settings or has_nodes:
+                    tokens.expect(",")
+                key = tokens.value()
+                if not isinstance(key, str):
+                    raise ValueError("invalid JSON: keys of the scenario have to be strings")
+                tokens.expect(":")
+                if key == "nodes":
+                    has_nodes = True
+                    yield from self.__nodes(tokens)
+                else:
+                    settings[key] = tokens.value()
+            tokens.expect("}")
+            if tokens.peek():
+                raise ValueError("invalid JSON: data after the scenario")
+        if not has_nodes:
+            raise ValueError("nodes: Field required")
+        # The nodes were validated on their own, an empty list skips the validators of Nodes.
+        self.__settings = Scenario.model_validate({**settings, "nodes": []})
+
+    def settings(self) -> Scenario:
+        """The scenario without it's nodes, only available after `nodes` was consumed."""
+        if self.__settings is None:
+            raise RuntimeError("ScenarioReader.settings called before all nodes were read")
+        return self.__settings
+
+    def __nodes(self, tokens: _Tokens) -> Iterator[Node]:
+        ids: set[str] = set()
+        unresolved: dict[str, str] = {}
+        """Link targets which didn't appear as an id yet with the first node linking to them."""
+        tokens.expect("[")
+        position = 0
+        while tokens.peek() != "]":
+            if position > 0:
+                tokens.expect(",")
+            raw = tokens.value()
+            if self.skip_content and isinstance(raw, dict) and raw.get("content") is not None:
+                raw["content"] = None
+            try:
+                node = Node.model_validate(raw)
+            except ValueError as e:
+                label = raw.get("id") if isinstance(raw, dict) else None
+                raise ValueError(f"node '{label}': {e}" if label else f"node #{position}: {e}") from e
+            if node.id in ids:
+                raise ValueError(f"node id(s) {format_str_list([node.id])} not unique")
+            ids.add(node.id)
+            unresolved.pop(node.id, None)
+            for link in node.links or []:
+                if link.target not in ids:
+                    unresolved.setdefault(link.target, node.id)
+            position += 1
+            yield node
+        tokens.expect("]")
+        if unresolved:
+            invalid: dict[str, list[str]] = {}
+            for target, node_id in unresolved.items():
+                invalid.setdefault(node_id, []).append(target)
+            raise ValueError("; ".join(
+                f"node '{node_id}' has invalid link target(s) {format_str_list(targets)}"
+                for node_id, targets in invalid.items()
+            ))
+
+
+def write_scenario(path: Path, scenario: Scenario, nodes: Iterable[Node]):
+    """
+    Writes a scenario node by node, the nodes are taken from `nodes` instead
+    of the scenario and can be generated while writing. The output is the
+    same as `Scenario.model_dump_json`.
+    """
+    fields = scenario.model_dump(mode="json", exclude={"nodes"})
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{")
+        for i, name in enumerate(field for field in Scenario.model_fields if field in fields or field == "nodes"):
+            if i > 0:
+                f.write(",")
+            f.write(f"{json.dumps(name)}:")
+            if name != "nodes":
+                f.write(json.dumps(fields[name], ensure_ascii=False, separators=(",", ":")))
+                continue
+            f.write("[")
+            for j, node in enumerate(nodes):
+                if j > 0:
+                    f.write(",")
+                f.write(node.model_dump_json())
+            f.write("]")
+        f.write("}")
@@ -0,0 +1,38 @@
+from scenarios import node, scenario
+
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+
+@pytest.fixture
+def scenario_data() -> dict[str, Any]:
+    """A scenario using every kind of node and link."""
+    return scenario(
+        [
+            node("menu", [
+                {"target": "alfa", "number": 1},
+                {"target": "bravo", "number": 2},
+                {"target": "secret", "code": "42"},
+                {"target": "menu", "code": "0"},
+            ], audio="menu.wav", repeat_after=5.0),
+            node("alfa", [{"target": "end"}, {"target": "bravo"}], audio="alfa.wav"),
+            node("bravo", [
+                {"target": "end", "weight": 3.0},
+                {"target": "alfa", "weight": 1.0},
+            ], audio="bravo.wav"),
+            node("secret", [{"target": "menu", "number": 0}], audio="charlie.wav"),
+            node("end", None, audio="kilo.wav"),
+        ],
+        max_repeats=2,
+        digit_timeout=1.5,
+    )
+
+
+@pytest.fixture
+def scenario_file(tmp_path: Path, scenario_data: dict[str, Any]) -> Path:
+    path = tmp_path / "scenario.json"
+    path.write_text(json.dumps(scenario_data))
+    return path
@@ -0,0 +1,114 @@
+from hedylogos.audio import Backend, Channel, Clip, NullBackend
+from hedylogos.compiled import CompiledScenario
+from hedylogos.controller import Controller
+from hedylogos.simulation import VirtualClock, VirtualOutput, read_header
+
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+
+class _RecordingChannel:
+    """Passes everything on to the virtual channel and records it."""
+
+    def __init__(self, phone: "Phone", session: int, channel: Channel):
+        self.__phone = phone
+        self.__session = session
+        self.__channel = channel
+
+    def play(self, clip: Clip, token: int):
+        self.__phone._record(self.__session, "play", clip)
+        self.__channel.play(clip, token)
+
+    def enqueue(self, clip: Clip, token: int):
+        self.__phone._record(self.__session, "enqueue", clip)
+        self.__channel.enqueue(clip, token)
+
+    def stop(self):
+        self.__phone._record(self.__session, "stop", None)
+        self.__channel.stop()
+
+
+class _RecordingOutput(VirtualOutput):
+    def __init__(self, phone: "Phone"):
+        super().__init__(phone.clock)
+        self.__phone = phone
+
+    def channel(
+        self,
+        backend: Backend,
+        on_ended: Callable[[int], None],
+        on_started: Optional[Callable[[int, float], None]] = None,
+    ) -> Any:
+        return _RecordingChannel(self.__phone, len(self.channels), super().channel(backend, on_ended, on_started))
+
+
+class Phone:
+    """
+    Drives a controller on a virtual clock like the simulation does and records
+    the entered nodes and the audio handed to the output of each session.
+    """
+
+    def __init__(self, scenario: CompiledScenario, sessions: int = 1, **options: Any):
+        self.clock = VirtualClock()
+        self.output = _RecordingOutput(self)
+        self.nodes: list[tuple[float, int, int]] = []
+        """Time, session and index of every entered node."""
+        self.audio: list[tuple[float, int, str, Optional[str]]] = []
+        """Time, session, action (play, enqueue or stop) and the name of the audio file."""
+        self.timeouts: list[tuple[float, int]] = []
+        self.loaded: list[str] = []
+        self.__names: dict[int, str] = {}
+        self.__clips: list[Clip] = []
+        options.setdefault("prefetch_depth", 0)
+        self.controller = Controller(
+            scenario,
+            backends=[NullBackend(self.clock) for _ in range(sessions)],
+            loader=self.__load,
+            output=self.output,
+            on_node=lambda session, node: self.nodes.append((self.clock.now, session, node)),
+            clock=self.clock,
+            on_timeout=lambda session: self.timeouts.append((self.clock.now, session)),
+            **options,
+        )
+
+    def at(self, time: float, action: Callable[[], None], session: int = 0):
+        """Runs the action (e.g. a dial) at the given time."""
+        self.output.schedule(time - self.clock.now, session, action)
+
+    def run(self, until: float):
+        """Processes all events and timers up to the given time."""
+        controller = self.controller
+        controller.process_pending()
+        while True:
+            deadline = controller.next_deadline()
+            upcoming = self.output.next_time()
+            if deadline is not None and (upcoming is None or deadline < upcoming):
+                if deadline > until:
+                    break
+                self.clock.now = deadline
+            elif upcoming is not None and upcoming <= until:
+                event = self.output.pop()
+                assert event is not None
+                event[1]()
+            else:
+                break
+            controller.process_pending()
+        self.clock.now = until
+
+    def played(self, session: int = 0) -> list[tuple[float, str, Optional[str]]]:
+        """What was handed to the output of a session."""
+        return [(round(time, 6), action, name) for time, index, action, name in self.audio if index == session]
+
+    def entered(self, session: int = 0) -> list[int]:
+        return [node for _, index, node in self.nodes if index == session]
+
+    def _record(self, session: int, action: str, clip: Optional[Clip]):
+        self.audio.append((self.clock.now, session, action, self.__names.get(id(clip)) if clip else None))
+
+    def __load(self, path: Path) -> Clip:
+        clip = read_header(path)
+        # Keeps the clips alive, so their ids stay unique.
+        self.__clips.append(clip)
+        self.__names[id(clip)] = path.name
+        self.loaded.append(path.name)
+        return clip
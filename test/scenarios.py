@@ -0,0 +1,64 @@
+from hedylogos.compiled import CompiledScenario
+from hedylogos.model import Scenario
+
+from pathlib import Path
+from typing import Any, Optional
+
+
+AUDIO = Path(__file__).parent / "audio"
+"""Short WAV files the scenarios of the tests refer to."""
+
+
+def node(id: str, links: Optional[list[dict[str, Any]]], audio: str = "alfa.wav", **fields: Any) -> dict[str, Any]:
+    return {
+        "id": id,
+        "name": id.capitalize(),
+        "content": None,
+        "audio": str(AUDIO / audio),
+        "links": links,
+        **fields,
+    }
+
+
+def scenario(nodes: list[dict[str, Any]], **fields: Any) -> dict[str, Any]:
+    return {
+        "name": "Test",
+        "description": None,
+        "start_node": nodes[0]["id"],
+        "invalid_number_audio": str(AUDIO / "delta.wav"),
+        "invalid_number_fun_audio": None,
+        "internal_error_audio": str(AUDIO / "echo.wav"),
+        "end_call_audio": str(AUDIO / "foxtrot.wav"),
+        "nodes": nodes,
+        **fields,
+    }
+
+
+def compiled(data: dict[str, Any]) -> CompiledScenario:
+    """Validates and compiles a scenario, the audio paths are absolute already."""
+    return CompiledScenario.from_scenario(Scenario.model_validate(data), AUDIO / "scenario.json")
+
+
+def tables(scenario: CompiledScenario) -> dict[str, Any]:
+    """Everything the controller uses of a compiled scenario as plain values."""
+    return {
+        "ids": list(scenario.ids),
+        "kinds": list(scenario.kinds),
+        "audio": [path.name for path in scenario.audio],
+        "targets": list(scenario.targets),
+        "random_targets": [list(targets) if targets is not None else None for targets in scenario.random_targets],
+        "random_weights": [list(weights) if weights is not None else None for weights in scenario.random_weights],
+        "start": scenario.start,
+        "specials": [
+            path.name if path else None for path in (
+                scenario.invalid_number_audio,
+                scenario.invalid_number_fun_audio,
+                scenario.internal_error_audio,
+                scenario.end_call_audio,
+            )
+        ],
+        "repeat_after": list(scenario.repeat_after),
+        "max_repeats": scenario.max_repeats,
+        "codes": scenario.codes,
+        "digit_timeout": scenario.digit_timeout,
+    }
@@ -0,0 +1,105 @@
+from hedylogos.analysis import Analysis
+from scenarios import node, scenario
+
+from pathlib import Path
+from typing import Any
+
+
+FIXTURES = Path(__file__).parent
+
+
+def analyze(data: dict[str, Any]) -> Analysis:
+    analysis = Analysis()
+    analysis.run(data)
+    return analysis
+
+
+def messages(analysis: Analysis, check: str) -> list[str]:
+    return [str(issue) for issue in analysis.issues if issue.check == check]
+
+
+def test_cycle_without_exit_is_reported():
+    analysis = analyze(scenario([
+        node("start", [{"target": "a", "number": 1}, {"target": "end", "number": 2}]),
+        node("a", [{"target": "b"}]),
+        node("b", [{"target": "c"}]),
+        node("c", [{"target": "a"}]),
+        node("end", None),
+    ]))
+    assert analysis.is_valid
+    assert messages(analysis, "cycles") == ["warning: node 'a': the call can't leave the cycle a, b, c anymore"]
+
+
+def test_cycle_with_exit_isnt_reported():
+    analysis = analyze(scenario([
+        node("start", [{"target": "a", "number": 1}]),
+        node("a", [{"target": "b"}]),
+        node("b", [{"target": "a", "number": 1}, {"target": "end", "number": 2}]),
+        node("end", None),
+    ]))
+    assert messages(analysis, "cycles") == []
+
+
+def test_self_loop_is_a_cycle():
+    analysis = analyze(scenario([
+        node("start", [{"target": "start", "number": 1}]),
+    ]))
+    assert messages(analysis, "cycles") == ["warning: node 'start': the call can't leave the cycle start anymore"]
+
+
+def test_unreachable_cycle_isnt_reported():
+    analysis = analyze(scenario([
+        node("start", None),
+        node("a", [{"target": "b"}]),
+        node("b", [{"target": "a"}]),
+    ]))
+    assert messages(analysis, "cycles") == []
+    assert messages(analysis, "reachability") == [
+        "warning: node 'a': not reachable from the start node",
+        "warning: node 'b': not reachable from the start node",
+    ]
+
+
+def test_nested_components_are_separated():
+    # start -> (a <-> b) -> (c <-> d), only the second one can't be left.
+    analysis = analyze(scenario([
+        node("start", [{"target": "a", "number": 1}]),
+        node("a", [{"target": "b", "number": 1}, {"target": "c", "number": 2}]),
+        node("b", [{"target": "a", "number": 1}]),
+        node("c", [{"target": "d"}]),
+        node("d", [{"target": "c"}]),
+    ]))
+    assert messages(analysis, "cycles") == ["warning: node 'c': the call can't leave the cycle c, d anymore"]
+
+
+def test_long_chain_doesnt_recurse():
+    count = 50_000
+    nodes = [node(f"n{i}", [{"target": f"n{i + 1}"}]) for i in range(count - 1)]
+    nodes.append(node(f"n{count - 1}", [{"target": "n0"}]))
+    analysis = analyze(scenario(nodes))
+    assert len(messages(analysis, "cycles")) == 1
+    assert sum(analysis.reachable) == count
+
+
+def test_all_errors_are_collected():
+    analysis = analyze(scenario([
+        node("start", [{"target": "missing", "number": 1}]),
+        node("start", None),
+        node("other", [{"target": "start", "number": 1}, {"target": "start"}]),
+    ], start_node="nowhere"))
+    assert not analysis.is_valid
+    checks = {issue.check for issue in analysis.errors}
+    assert checks == {"fields", "unique ids", "link targets", "start node"}
+
+
+def test_fixtures_are_invalid():
+    # Some of them also lack the audio fields of the scenario.
+    for name, check in [
+        ("ids-not-unique.json", "unique ids"),
+        ("invalid-link-target.json", "link targets"),
+        ("mixed-link-types.json", "fields"),
+    ]:
+        analysis = Analysis.from_json(FIXTURES / name)
+        assert check in {issue.check for issue in analysis.errors}, name
+    analysis = Analysis.from_json(FIXTURES / "links-without-number.json")
+    assert analysis.is_valid
@@ -0,0 +1,130 @@
+from hedylogos import analytics
+from hedylogos.analytics import SessionEvent, SessionLog, SessionStats, aggregate, log_files
+
+import os
+from pathlib import Path
+from threading import Event
+
+import pytest
+
+
+def events(path: Path) -> list[tuple[int, object, SessionEvent, int]]:
+    return [(session, node, event, digit) for _, session, node, event, digit in analytics.read(path)]
+
+
+def test_events_are_written_and_read(tmp_path: Path):
+    path = tmp_path / "sessions.log"
+    log = SessionLog(path, interval=0.01)
+    log.start()
+    log.record(SessionEvent.PICK_UP, 0)
+    log.record(SessionEvent.ENTER, 0, "menü")
+    log.record(SessionEvent.DIAL, 0, "menü", 1)
+    log.record(SessionEvent.ENTER, 1, "menü")
+    log.stop()
+    assert events(path) == [
+        (0, None, SessionEvent.PICK_UP, -1),
+        (0, "menü", SessionEvent.ENTER, -1),
+        (0, "menü", SessionEvent.DIAL, 1),
+        (1, "menü", SessionEvent.ENTER, -1),
+    ]
+    assert log.written == 4
+    assert log.errors == 0
+
+
+def test_incomplete_record_at_the_end_is_ignored(tmp_path: Path):
+    path = tmp_path / "sessions.log"
+    log = SessionLog(path)
+    log.start()
+    log.record(SessionEvent.ENTER, 0, "menu")
+    log.stop()
+    with open(path, "ab") as f:
+        f.write(bytes(5))
+    assert events(path) == [(0, "menu", SessionEvent.ENTER, -1)]
+
+
+def test_files_are_rotated(tmp_path: Path):
+    path = tmp_path / "sessions.log"
+    for i in range(4):
+        log = SessionLog(path, max_files=2)
+        log.start()
+        log.record(SessionEvent.ENTER, i, "menu")
+        log.stop()
+    files = log_files(path)
+    assert [file.name for file in files] == ["sessions.log.2", "sessions.log.3", "sessions.log"]
+    assert [events(file)[0][0] for file in files] == [1, 2, 3]
+
+
+def test_long_node_ids_are_cut(tmp_path: Path):
+    path = tmp_path / "sessions.log"
+    log = SessionLog(path)
+    log.start()
+    log.record(SessionEvent.ENTER, 0, "ä" * 40000)
+    log.stop()
+    assert events(path) == [(0, "ä" * 32767, SessionEvent.ENTER, -1)]
+
+
+def test_failed_writes_are_counted(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    path = tmp_path / "sessions.log"
+    log = SessionLog(path, interval=0.01)
+    fsync = os.fsync
+    failed = Event()
+
+    def failing_fsync(fd: int):
+        if not failed.is_set():
+            failed.set()
+            raise OSError(28, "No space left on device")
+        fsync(fd)
+
+    monkeypatch.setattr(analytics.os, "fsync", failing_fsync)
+    log.start()
+    log.record(SessionEvent.ENTER, 0, "lost")
+    assert failed.wait(5)
+    log.record(SessionEvent.ENTER, 0, "menu")
+    log.stop()
+    assert log.errors == 1
+    assert log.written == 1
+    # The log goes on in a new file, the rotated one keeps what reached it.
+    assert events(path) == [(0, "menu", SessionEvent.ENTER, -1)]
+    assert [file.name for file in log_files(path)] == ["sessions.log.1", "sessions.log"]
+
+
+def test_stats(tmp_path: Path):
+    path = tmp_path / "sessions.log"
+    log = SessionLog(path)
+    log.start()
+    calls = [
+        [(SessionEvent.PICK_UP, None, -1), (SessionEvent.ENTER, "menu", -1), (SessionEvent.DIAL, "menu", 1),
+         (SessionEvent.ENTER, "end", -1), (SessionEvent.END, "end", -1)],
+        [(SessionEvent.PICK_UP, None, -1), (SessionEvent.ENTER, "menu", -1), (SessionEvent.INVALID_DIGIT, "menu", 7),
+         (SessionEvent.HANG_UP, "menu", -1)],
+    ]
+    for call in calls:
+        for event, node, digit in call:
+            log.record(event, 0, node, digit)
+    log.stop()
+    stats = aggregate([path])
+    assert stats.records == 9
+    assert (stats.calls, stats.completed, stats.timed_out) == (2, 1, 0)
+    nodes = {node["node"]: node for node in stats.as_dict()["nodes"]}
+    assert nodes["menu"]["visits"] == 2
+    assert nodes["menu"]["drop_offs"] == 1
+    assert nodes["menu"]["invalid_rate"] == 0.5
+    assert nodes["end"]["dials"] == 0
+
+
+def test_listen_time():
+    stats = SessionStats()
+    stats.add(10, 0, None, SessionEvent.PICK_UP)
+    stats.add(10, 0, "menu", SessionEvent.ENTER)
+    stats.add(14, 0, "alfa", SessionEvent.ENTER)
+    stats.add(15, 0, "alfa", SessionEvent.HANG_UP)
+    stats.add(20, 0, "menu", SessionEvent.ENTER)
+    stats.add(22, 0, "menu", SessionEvent.HANG_UP)
+    assert stats.listened == {"menu": 6, "alfa": 1}
+    nodes = {node["node"]: node for node in stats.as_dict()["nodes"]}
+    assert nodes["menu"]["mean_listen_seconds"] == 3
+
+
+def test_missing_log_is_reported(tmp_path: Path):
+    with pytest.raises(FileNotFoundError):
+        aggregate([tmp_path / "missing.log"])
@@ -0,0 +1,211 @@
+from hedylogos.audio import AlsaBackend, Channel, Clip, FileBackend, NullBackend, OutputEngine, Stream
+from scenarios import AUDIO
+
+from pathlib import Path
+import stat
+from threading import Condition, Event
+import time
+from typing import Iterator
+import wave
+
+import pytest
+
+
+FAKE_APLAY = """#!/bin/sh
+# Logs the call and records the audio instead of playing it.
+echo "$@" >> "$(dirname "$0")/calls"
+cat > "$(dirname "$0")/played.raw"
+"""
+
+
+def clip(seconds: float, value: int, sample_rate: int = 8000, channels: int = 1) -> Clip:
+    frames = int(seconds * sample_rate)
+    return Clip(bytes([value]) * (2 * channels * frames), channels, 2, sample_rate)
+
+
+class Ended:
+    """Collects the tokens of ended clips."""
+
+    def __init__(self):
+        self.tokens: list[int] = []
+        self.__event = Event()
+
+    def __call__(self, token: int):
+        self.tokens.append(token)
+        self.__event.set()
+
+    def wait_for(self, token: int, timeout: float = 5):
+        deadline = time.monotonic() + timeout
+        while token not in self.tokens:
+            assert time.monotonic() < deadline, f"clip {token} didn't end, ended: {self.tokens}"
+            self.__event.wait(0.01)
+            self.__event.clear()
+
+
+class CountingBackend(FileBackend):
+    def __init__(self, path: Path):
+        super().__init__(path)
+        self.opened: list[int] = []
+        """Sample rates of the opened streams."""
+
+    def open(self, channels: int, sample_width: int, sample_rate: int) -> Stream:
+        self.opened.append(sample_rate)
+        return super().open(channels, sample_width, sample_rate)
+
+
+class CountingNullBackend(NullBackend):
+    def __init__(self):
+        super().__init__()
+        self.opened: list[int] = []
+
+    def open(self, channels: int, sample_width: int, sample_rate: int) -> Stream:
+        self.opened.append(sample_rate)
+        return super().open(channels, sample_width, sample_rate)
+
+
+@pytest.fixture
+def engine() -> Iterator[OutputEngine]:
+    engine = OutputEngine()
+    engine.start()
+    yield engine
+    engine.close()
+    engine.join()
+
+
+def recorded(path: Path) -> bytes:
+    with wave.open(str(path), "rb") as f:
+        return f.readframes(f.getnframes())
+
+
+def test_clips_play_back_to_back_on_one_stream(engine: OutputEngine, tmp_path: Path):
+    backend = CountingBackend(tmp_path / "out.wav")
+    ended = Ended()
+    channel = engine.channel(backend, ended)
+    clips = [clip(0.05, value) for value in (1, 2, 3)]
+    start = time.monotonic()
+    for token, queued in enumerate(clips):
+        channel.enqueue(queued, token)
+    ended.wait_for(2)
+    assert time.monotonic() - start >= 0.15
+    assert ended.tokens == [0, 1, 2]
+    assert backend.opened == [8000]
+    channel.enqueue(clip(0.01, 4), 3)
+    ended.wait_for(3)
+    assert backend.opened == [8000]
+    engine.close()
+    engine.join()
+    assert recorded(tmp_path / "out.wav") == b"".join(bytes(c.data) for c in clips) + bytes([4]) * 160
+
+
+def test_play_switches_at_a_frame_boundary(engine: OutputEngine, tmp_path: Path):
+    ended = Ended()
+    channel = engine.channel(FileBackend(tmp_path / "out.wav"), ended)
+    start = time.monotonic()
+    channel.play(clip(1, 1, channels=2), 0)
+    time.sleep(0.1)
+    elapsed = time.monotonic() - start
+    channel.play(clip(0.05, 2, channels=2), 1)
+    ended.wait_for(1)
+    assert ended.tokens == [1]
+    engine.close()
+    engine.join()
+    data = recorded(tmp_path / "out.wav")
+    switch = data.index(2)
+    assert switch % 4 == 0
+    assert data[:switch] == bytes([1]) * switch
+    assert data[switch:] == bytes([2]) * 1600
+    # The first clip stops after at most the buffer of the stream.
+    assert switch / 4 / 8000 <= elapsed + Stream.BUFFER_TIME
+
+
+def test_stopped_clips_dont_end(engine: OutputEngine):
+    ended = Ended()
+    channel = engine.channel(NullBackend(), ended)
+    channel.play(clip(0.05, 1), 0)
+    channel.enqueue(clip(0.05, 1), 1)
+    channel.stop()
+    channel.enqueue(clip(0.02, 1), 2)
+    ended.wait_for(2)
+    assert ended.tokens == [2]
+
+
+def test_other_formats_open_a_new_stream(engine: OutputEngine):
+    backend = CountingNullBackend()
+    ended = Ended()
+    channel = engine.channel(backend, ended)
+    channel.enqueue(clip(0.02, 1), 0)
+    channel.enqueue(clip(0.02, 1, sample_rate=16000), 1)
+    channel.enqueue(clip(0.02, 1), 2)
+    ended.wait_for(2)
+    assert ended.tokens == [0, 1, 2]
+    assert backend.opened == [8000, 16000, 8000]
+
+
+def test_failing_output_ends_the_clips(engine: OutputEngine, tmp_path: Path):
+    backend = CountingBackend(tmp_path / "out.wav")
+    ended = Ended()
+    channel = engine.channel(backend, ended)
+    channel.enqueue(clip(0.02, 1), 0)
+    channel.enqueue(clip(0.02, 1, sample_rate=16000), 1)
+    channel.enqueue(clip(0.02, 1), 2)
+    ended.wait_for(2)
+    # The file only takes one format, the clips after the error count as ended.
+    assert ended.tokens == [0, 1, 2]
+    assert backend.opened == [8000, 16000]
+
+
+def test_aplay_runs_once_for_all_clips(engine: OutputEngine, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    aplay = tmp_path / "aplay"
+    aplay.write_text(FAKE_APLAY)
+    aplay.chmod(aplay.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", str(tmp_path), prepend=":")
+    ended = Ended()
+    channel = engine.channel(AlsaBackend("plughw:1,0"), ended)
+    clips = [clip(0.05, value) for value in (1, 2, 3)]
+    for token, queued in enumerate(clips):
+        channel.enqueue(queued, token)
+    ended.wait_for(2)
+    channel.enqueue(clip(0.05, 4), 3)
+    ended.wait_for(3)
+    engine.close()
+    engine.join()
+    calls = (tmp_path / "calls").read_text().splitlines()
+    assert len(calls) == 1
+    assert "-D plughw:1,0 -f S16_LE -c 1 -r 8000" in calls[0]
+    played = (tmp_path / "played.raw").read_bytes()
+    expected = b"".join(bytes(c.data) for c in clips)
+    assert played.startswith(expected)
+    # Silence keeps aplay busy in between.
+    rest = played[len(expected):].strip(b"\0")
+    assert rest == bytes([4]) * 800
+
+
+def test_mapped_clips_are_read_ahead_of_the_playback():
+    clock = [0.0]
+    ended = Ended()
+    channel = Channel(NullBackend(lambda: clock[0]), ended, Condition(), 1600)
+    data = bytes(range(256)) * 100
+    channel.enqueue(Clip(memoryview(data), 1, 2, 8000, mapped=True), 0)
+    read = []
+    while not ended.tokens:
+        region = channel._service()
+        if region is not None:
+            # Each part is read once, never more than the read-ahead beyond the playback.
+            assert bytes(region) == data[len(read):len(read) + len(region)]
+            assert len(read) + len(region) <= int(clock[0] * 8000) * 2 + 1600
+            read.extend(region)
+        clock[0] += 0.01
+    assert bytes(read) == data
+    assert 1.6 <= clock[0] < 1.7
+
+
+def test_mapped_file_plays_as_one_clip(engine: OutputEngine, tmp_path: Path):
+    path = AUDIO / "juliett.wav"
+    mapped = Clip.map_wave_file(path)
+    ended = Ended()
+    channel = engine.channel(FileBackend(tmp_path / "out.wav"), ended)
+    channel.play(mapped, 0)
+    ended.wait_for(0)
+    engine.close()
+    engine.join()
+    assert recorded(tmp_path / "out.wav") == bytes(Clip.from_wave_file(path).data)
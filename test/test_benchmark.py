@@ -0,0 +1,53 @@
+from hedylogos.__main__ import app
+from hedylogos.analysis import Analysis
+from hedylogos.benchmark import Benchmark, ScenarioGenerator, compare
+from hedylogos.model import Scenario
+
+import json
+from pathlib import Path
+
+import pytest
+from typer.testing import CliRunner
+
+
+def test_generated_scenarios_are_valid_and_reachable(tmp_path: Path):
+    generator = ScenarioGenerator(nodes=200, fan_out=4, audio_files=3, audio_seconds=0.1)
+    path = generator.write(tmp_path)
+    scenario = Scenario.from_json(path)
+    assert len(scenario.nodes.root) == 200
+    assert len(list((tmp_path / "audio").iterdir())) == 3
+    analysis = Analysis.from_json(path)
+    assert analysis.is_valid
+    assert all(analysis.reachable)
+    # The same seed gives the same scenario.
+    assert generator.scenario().model_dump() == ScenarioGenerator(**generator.parameters()).scenario().model_dump()
+
+
+def test_fan_out_is_limited_to_the_digits():
+    with pytest.raises(ValueError, match="fan out"):
+        ScenarioGenerator(fan_out=11)
+
+
+def test_results_are_compared_by_median():
+    current = {"results": {"load": {"median": 2.0}, "new": {"median": 1.0}}}
+    baseline = {"results": {"load": {"median": 4.0}}}
+    assert compare(current, baseline) == [("load", 2.0, 0.5), ("new", 1.0, None)]
+    assert compare(current, None) == [("load", 2.0, None), ("new", 1.0, None)]
+
+
+def test_benchmark_command(tmp_path: Path):
+    output = tmp_path / "results.json"
+    result = CliRunner().invoke(app, [
+        "benchmark", "--nodes", "50", "--audio-files", "2", "--audio-seconds", "0.1",
+        "--repeat", "1", "--output", str(output), "--keep", str(tmp_path / "scenario"),
+    ])
+    assert result.exit_code == 0, result.output
+    results = json.loads(output.read_text())
+    assert results["results"]
+    assert all(values["median"] >= 0 for values in results["results"].values())
+    again = CliRunner().invoke(app, [
+        "benchmark", "--nodes", "50", "--audio-files", "2", "--audio-seconds", "0.1",
+        "--repeat", "1", "--baseline", str(output),
+    ])
+    assert again.exit_code == 0, again.output
+    assert "x)" in again.output
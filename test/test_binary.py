@@ -0,0 +1,46 @@
+from hedylogos import binary
+from hedylogos.compiled import CompiledScenario
+from scenarios import tables
+
+from pathlib import Path
+
+import pytest
+
+
+def test_round_trip(scenario_file: Path, tmp_path: Path):
+    scenario = CompiledScenario.from_json(scenario_file)
+    path = tmp_path / "scenario.hedc"
+    binary.write(scenario, binary.source_hash(scenario_file), path)
+    loaded = binary.load(path)
+    assert tables(loaded) == tables(scenario)
+    # Equal paths, not just the same files, as they're the keys of the cache.
+    assert loaded.audio == scenario.audio
+    assert binary.read_hash(path) == binary.source_hash(scenario_file)
+
+
+def test_load_for_checks_the_source(scenario_file: Path):
+    assert binary.load_for(scenario_file) is None
+    scenario = CompiledScenario.from_json(scenario_file)
+    binary.write(scenario, binary.source_hash(scenario_file), binary.default_path(scenario_file))
+    assert binary.load_for(scenario_file) is not None
+    scenario_file.write_text(scenario_file.read_text() + "\n")
+    assert binary.load_for(scenario_file) is None
+
+
+def test_truncated_files_are_invalid(scenario_file: Path):
+    scenario = CompiledScenario.from_json(scenario_file)
+    data = binary.encode(scenario, binary.source_hash(scenario_file), scenario_file.parent)
+    for length in range(0, len(data), 7):
+        with pytest.raises(binary.InvalidBinary):
+            binary.decode(memoryview(data[:length]), scenario_file.parent)
+    compiled = binary.default_path(scenario_file)
+    compiled.write_bytes(data[:len(data) // 2])
+    assert binary.load_for(scenario_file) is None
+
+
+def test_other_versions_are_invalid(scenario_file: Path):
+    scenario = CompiledScenario.from_json(scenario_file)
+    data = bytearray(binary.encode(scenario, binary.source_hash(scenario_file), scenario_file.parent))
+    data[8] += 1
+    with pytest.raises(binary.InvalidBinary, match="version"):
+        binary.decode(memoryview(bytes(data)), scenario_file.parent)
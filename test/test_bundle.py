@@ -0,0 +1,84 @@
+from hedylogos import binary, bundle
+from hedylogos.audio import Clip
+from hedylogos.bundle import Bundle, InvalidBundle
+from hedylogos.compiled import CompiledScenario
+from scenarios import tables
+
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+
+@pytest.fixture
+def bundle_file(scenario_file: Path, tmp_path: Path) -> Path:
+    scenario = CompiledScenario.from_json(scenario_file)
+    path = tmp_path / "scenario.hedb"
+    Bundle.write(scenario, binary.source_hash(scenario_file), path)
+    return path
+
+
+def replace_index(path: Path, index: bytes):
+    """Appends a new index to a bundle and points the header to it."""
+    data = bytearray(path.read_bytes())
+    header = list(bundle._HEADER.unpack_from(data))
+    header[-2:] = [len(data), len(index)]
+    data[:bundle._HEADER.size] = bundle._HEADER.pack(*header)
+    path.write_bytes(bytes(data) + index)
+
+
+def test_round_trip(scenario_file: Path, bundle_file: Path):
+    scenario = CompiledScenario.from_json(scenario_file)
+    scenario_bundle = Bundle(bundle_file)
+    expected = tables(scenario)
+    bundled = tables(scenario_bundle.scenario)
+    # Audio is renamed to the hash of it's content.
+    assert {key: value for key, value in bundled.items() if key not in ("audio", "specials")} == {
+        key: value for key, value in expected.items() if key not in ("audio", "specials")
+    }
+    for original, name in zip(scenario.audio, scenario_bundle.scenario.audio):
+        clip = scenario_bundle.clip(name)
+        assert clip.mapped
+        assert bytes(clip.data) == bytes(Clip.from_wave_file(original).data)
+    with pytest.raises(FileNotFoundError):
+        scenario_bundle.clip(Path("missing.wav"))
+
+
+@pytest.mark.parametrize("index, message", [
+    (b"{\"audio\": ", "index of the bundle is corrupt"),
+    (b"\xff\xfe", "index of the bundle is corrupt"),
+    (b"[]", "index of the bundle is corrupt"),
+    (b"{\"audio\": {\"a.wav\": [0]}}", "index of the bundle is corrupt"),
+    (b"{\"audio\": {\"a.wav\": [\"0\", 1]}}", "index of the bundle is corrupt"),
+    (b"{\"audio\": {\"a.wav\": [-1, 10]}}", "'a.wav' lies outside"),
+    (b"{\"audio\": {\"a.wav\": [0, 1000000000]}}", "'a.wav' lies outside"),
+])
+def test_corrupt_index_is_invalid(bundle_file: Path, index: bytes, message: str):
+    replace_index(bundle_file, index)
+    with pytest.raises(InvalidBundle, match=message):
+        Bundle(bundle_file)
+
+
+def test_truncated_bundle_is_invalid(bundle_file: Path):
+    data = bundle_file.read_bytes()
+    for length in (0, bundle._HEADER.size - 1, bundle._HEADER.size, len(data) // 2, len(data) - 1):
+        bundle_file.write_bytes(data[:length])
+        with pytest.raises(InvalidBundle):
+            Bundle(bundle_file)
+
+
+def test_other_files_are_invalid(scenario_file: Path):
+    with pytest.raises(InvalidBundle, match="not a bundle"):
+        Bundle(scenario_file)
+
+
+def test_audio_which_isnt_wave_is_rejected(tmp_path: Path, scenario_data: dict[str, Any]):
+    broken = tmp_path / "broken.wav"
+    broken.write_bytes(b"RIFF")
+    scenario_data["nodes"][0]["audio"] = str(broken)
+    path = tmp_path / "broken.json"
+    path.write_text(json.dumps(scenario_data))
+    scenario = CompiledScenario.from_json(path)
+    with pytest.raises(ValueError, match="broken.wav"):
+        Bundle.write(scenario, binary.source_hash(path), tmp_path / "broken.hedb")
@@ -0,0 +1,96 @@
+from hedylogos.audio import Clip
+from hedylogos.cache import AudioCache
+from scenarios import AUDIO
+
+import os
+from pathlib import Path
+import shutil
+
+import pytest
+
+
+def clip(size: int, mapped: bool = False) -> Clip:
+    return Clip(bytes(size), 1, 2, 8000, mapped)
+
+
+def cache_of(sizes: dict[str, int], limit: int, mapped: bool = False) -> AudioCache:
+    return AudioCache(limit, lambda path: clip(sizes[path.name], mapped))
+
+
+def test_counts_hits_and_misses():
+    cache = cache_of({"a": 10}, 100)
+    first = cache.get(Path("a"))
+    assert cache.get(Path("a")) is first
+    assert cache.stats() == {
+        "entries": 1,
+        "size": 10,
+        "limit": 100,
+        "hits": 1,
+        "misses": 1,
+        "evictions": 0,
+    }
+
+
+def test_evicts_least_recently_used():
+    cache = cache_of({"a": 40, "b": 40, "c": 40}, 100)
+    cache.get(Path("a"))
+    cache.get(Path("b"))
+    cache.get(Path("a"))
+    cache.get(Path("c"))
+    assert Path("b") not in cache
+    assert Path("a") in cache and Path("c") in cache
+    assert cache.size == 80
+    assert cache.evictions == 1
+
+
+def test_clip_bigger_than_limit_isnt_cached():
+    cache = cache_of({"big": 200, "a": 10}, 100)
+    cache.get(Path("a"))
+    assert cache.get(Path("big")).nbytes == 200
+    assert Path("big") not in cache
+    assert Path("a") in cache
+    assert cache.size == 10
+
+
+def test_mapped_clips_count_with_nominal_weight():
+    limit = 3 * AudioCache.MAPPED_WEIGHT
+    cache = cache_of({str(i): 10 * AudioCache.MAPPED_WEIGHT for i in range(5)}, limit, mapped=True)
+    for i in range(5):
+        cache.get(Path(str(i)))
+    assert len(cache) == 3
+    assert cache.size == limit
+    assert cache.evictions == 2
+
+
+def test_small_mapped_clips_count_with_their_size():
+    cache = cache_of({"a": 100}, AudioCache.MAPPED_WEIGHT, mapped=True)
+    cache.get(Path("a"))
+    assert cache.size == 100
+
+
+def test_preload_returns_added_size_without_counting():
+    cache = cache_of({"a": 10}, 100)
+    assert cache.preload(Path("a")) == 10
+    assert cache.preload(Path("a")) == 0
+    assert cache.hits == 0 and cache.misses == 0
+
+
+def test_negative_limit_is_rejected():
+    with pytest.raises(ValueError):
+        AudioCache(-1)
+
+
+def test_changed_files_are_discarded(tmp_path: Path):
+    path = tmp_path / "a.wav"
+    shutil.copy(AUDIO / "alfa.wav", path)
+    cache = AudioCache()
+    cache.get(path)
+    size = cache.size
+    assert cache.changed() == []
+    os.utime(path, ns=(1, 1))
+    changed = cache.changed()
+    assert changed == [path]
+    assert cache.discard(changed) == 1
+    assert path not in cache
+    assert cache.size == 0 < size
+    assert cache.discard(changed) == 0
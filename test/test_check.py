@@ -0,0 +1,104 @@
+from hedylogos.__main__ import app
+from hedylogos.check import AudioChecker, AudioInfo, common_format, inspect
+from scenarios import AUDIO
+
+import json
+import os
+from pathlib import Path
+import shutil
+import wave
+
+import pytest
+from typer.testing import CliRunner
+
+
+def test_valid_file():
+    info = inspect(AUDIO / "juliett.wav")
+    assert info.error is None
+    assert info.format == (22050, 2, 1)
+    assert info.duration == pytest.approx(0.889, abs=0.001)
+    assert info.nbytes == 2 * info.frames
+
+
+@pytest.mark.parametrize("content, error", [
+    (None, "not found"),
+    (b"", "empty file"),
+    (b"ID3\x03" + bytes(100), "MP3 file"),
+    (b"OggS" + bytes(100), "Ogg file"),
+    (b"fLaC" + bytes(100), "FLAC file"),
+    (b"RIFF" + bytes(8), ""),
+])
+def test_broken_files(tmp_path: Path, content: bytes, error: str):
+    path = tmp_path / "broken.wav"
+    if content is not None:
+        path.write_bytes(content)
+    info = inspect(path)
+    assert info.error is not None and error in info.error
+
+
+def test_truncated_data_is_an_error(tmp_path: Path):
+    path = tmp_path / "truncated.wav"
+    data = (AUDIO / "alfa.wav").read_bytes()
+    path.write_bytes(data[:len(data) // 2])
+    assert inspect(path).error
+
+
+def test_common_format(tmp_path: Path):
+    path = tmp_path / "stereo.wav"
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(8000)
+        f.writeframes(bytes(400))
+    infos = [inspect(AUDIO / "alfa.wav"), inspect(path), inspect(AUDIO / "bravo.wav"), AudioInfo(path, "broken")]
+    assert common_format(infos) == (22050, 2, 1)
+    assert common_format([]) is None
+
+
+def test_results_are_cached_until_a_file_changes(tmp_path: Path):
+    paths = []
+    for name in ("alfa.wav", "bravo.wav"):
+        shutil.copy(AUDIO / name, tmp_path / name)
+        paths.append(tmp_path / name)
+    cache = tmp_path / "cache" / "check.json"
+    checker = AudioChecker(cache, jobs=2)
+    infos = checker.check(paths + [paths[0]])
+    assert [info.path for info in infos] == paths
+    assert (checker.inspected, checker.cached) == (2, 0)
+    assert len(json.loads(cache.read_text())) == 2
+    checker.check(paths)
+    assert (checker.inspected, checker.cached) == (0, 2)
+    paths[1].write_bytes(b"")
+    infos = checker.check(paths)
+    assert (checker.inspected, checker.cached) == (1, 1)
+    assert infos[1].error == "empty file"
+    os.utime(paths[0], ns=(1, 1))
+    checker.check(paths)
+    assert (checker.inspected, checker.cached) == (1, 1)
+
+
+def test_broken_cache_is_ignored(tmp_path: Path):
+    cache = tmp_path / "check.json"
+    cache.write_text("{")
+    checker = AudioChecker(cache)
+    assert not checker.check([AUDIO / "alfa.wav"])[0].error
+    assert checker.inspected == 1
+
+
+def test_check_command(scenario_file: Path):
+    runner = CliRunner()
+    result = runner.invoke(app, ["check", str(scenario_file), "--verbose"])
+    assert result.exit_code == 0, result.output
+    assert "menu.wav: 22050 Hz, 16 bit, mono" in result.output
+    assert "0 error(s)" in result.output
+    again = runner.invoke(app, ["check", str(scenario_file)])
+    assert "0 inspected" in again.output
+
+
+def test_check_command_fails_on_broken_audio(scenario_file: Path):
+    data = json.loads(scenario_file.read_text())
+    data["nodes"][0]["audio"] = str(AUDIO / "empty.wav")
+    scenario_file.write_text(json.dumps(data))
+    result = CliRunner().invoke(app, ["check", str(scenario_file), "--no-cache"])
+    assert result.exit_code == 1
+    assert "empty.wav: empty file" in result.output
@@ -0,0 +1,90 @@
+from hedylogos.controller import _Action, _Command, _CommandQueue
+
+from typing import Optional
+
+
+def queue_of(*commands: _Command) -> _CommandQueue:
+    queue = _CommandQueue()
+    for command in commands:
+        queue.put(command)
+    return queue
+
+
+def dial(number: int, session: int = 0) -> _Command:
+    return _Command(_Action.DIAL, number=number, session=session)
+
+
+def drain(queue: _CommandQueue) -> list[tuple[_Action, int, list[int]]]:
+    rsl = []
+    while True:
+        command: Optional[_Command] = queue.get(timeout=0)
+        if command is None:
+            return rsl
+        rsl.append((command.action, command.session, command.digits))
+
+
+def test_get_times_out_when_empty():
+    assert _CommandQueue().get(timeout=0.01) is None
+
+
+def test_quit_comes_first():
+    queue = queue_of(_Command(_Action.PICK_UP), dial(1), _Command(_Action.QUIT))
+    assert [action for action, _, _ in drain(queue)] == [_Action.QUIT, _Action.PICK_UP, _Action.DIAL]
+
+
+def test_hang_up_drops_the_rest_of_the_call():
+    queue = queue_of(
+        _Command(_Action.PICK_UP),
+        dial(1),
+        dial(2, session=1),
+        _Command(_Action.PLAYBACK_ENDED, generation=1),
+        _Command(_Action.HANG_UP),
+    )
+    assert drain(queue) == [
+        (_Action.PICK_UP, 0, []),
+        (_Action.DIAL, 1, [2]),
+        (_Action.HANG_UP, 0, []),
+    ]
+    assert queue.dropped == 2
+
+
+def test_hang_up_without_queued_pick_up_is_urgent():
+    queue = queue_of(_Command(_Action.PICK_UP, session=1), dial(3), dial(4), _Command(_Action.HANG_UP))
+    assert drain(queue) == [
+        (_Action.HANG_UP, 0, []),
+        (_Action.PICK_UP, 1, []),
+    ]
+    assert queue.dropped == 2
+
+
+def test_hang_up_keeps_the_next_call():
+    queue = queue_of(
+        dial(1),
+        _Command(_Action.HANG_UP),
+        _Command(_Action.PICK_UP),
+        dial(2),
+        _Command(_Action.HANG_UP),
+    )
+    assert drain(queue) == [
+        (_Action.HANG_UP, 0, []),
+        (_Action.PICK_UP, 0, []),
+        (_Action.HANG_UP, 0, []),
+    ]
+
+
+def test_digit_burst_is_coalesced_per_session():
+    queue = queue_of(dial(1), dial(7, session=1), dial(2), dial(3), dial(8, session=1))
+    assert drain(queue) == [
+        (_Action.DIAL, 0, [1, 2, 3]),
+        (_Action.DIAL, 1, [7, 8]),
+    ]
+    assert len(queue) == 0
+
+
+def test_burst_stops_at_other_commands_of_the_session():
+    queue = queue_of(dial(1), dial(2), _Command(_Action.PLAYBACK_ENDED, generation=1), dial(3))
+    assert drain(queue) == [
+        (_Action.DIAL, 0, [1, 2]),
+        (_Action.PLAYBACK_ENDED, 0, []),
+        (_Action.DIAL, 0, [3]),
+    ]
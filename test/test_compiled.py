@@ -0,0 +1,47 @@
+from hedylogos.compiled import CompiledScenario
+from hedylogos.model import Node
+from scenarios import compiled, node, scenario
+
+from pathlib import Path
+
+from pydantic import ValidationError
+import pytest
+
+
+def test_compiled_tables(scenario_file: Path):
+    scenario = CompiledScenario.from_json(scenario_file)
+    menu, alfa, bravo, secret, end = range(5)
+    assert scenario.kinds[menu] == CompiledScenario.MENU
+    assert scenario.target(menu, 1) == alfa
+    assert scenario.target(menu, 0) == menu
+    assert scenario.target(menu, 5) == CompiledScenario.NO_NODE
+    assert scenario.kinds[alfa] == CompiledScenario.RANDOM
+    assert scenario.random_weights[alfa] is None
+    assert list(scenario.random_weights[bravo]) == [3.0, 4.0]
+    assert scenario.kinds[end] == CompiledScenario.END
+    assert list(scenario.repeat_after)[menu] == 5.0
+    assert scenario.successors(menu) == [menu, alfa, bravo, secret]
+    assert scenario.code_target(menu, "42") == secret
+    assert scenario.code_target(menu, "0") == menu
+    assert scenario.code_target(menu, "43") == CompiledScenario.NO_NODE
+    assert scenario.expects_more(menu, "4")
+    assert not scenario.expects_more(menu, "42")
+    assert not scenario.expects_more(secret, "4")
+
+
+def test_first_link_with_a_number_wins():
+    first = compiled(scenario([
+        node("menu", [{"target": "a", "number": 1}, {"target": "b", "number": 1}]),
+        node("a", None),
+        node("b", None),
+    ]))
+    assert first.target(0, 1) == 1
+
+
+@pytest.mark.parametrize("links", [
+    [{"target": "a", "number": 1}, {"target": "a", "code": "1"}],
+    [{"target": "a", "code": "42"}, {"target": "a", "code": "42"}],
+])
+def test_codes_are_unique(links: list[dict]):
+    with pytest.raises(ValidationError, match="used by more than one link"):
+        Node.model_validate(node("menu", links))
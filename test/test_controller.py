@@ -0,0 +1,254 @@
+from phone import Phone
+from scenarios import AUDIO, compiled, node, scenario
+
+import os
+from pathlib import Path
+import shutil
+
+import pytest
+
+
+MENU, A, B = range(3)
+
+
+def menus() -> Phone:
+    """Two handsets on a scenario of menus only."""
+    return Phone(compiled(scenario([
+        node("menu", [{"target": "a", "number": 1}, {"target": "b", "number": 2}], audio="menu.wav"),
+        node("a", [{"target": "menu", "number": 0}], audio="alfa.wav"),
+        node("b", [{"target": "menu", "number": 0}], audio="bravo.wav"),
+    ])), sessions=2)
+
+
+def test_sessions_have_their_own_position():
+    phone = menus()
+    controller = phone.controller
+    controller.pick_up(0)
+    phone.at(0.1, lambda: controller.pick_up(1), session=1)
+    phone.at(0.2, lambda: controller.dial(1, 0))
+    phone.at(0.3, lambda: controller.dial(2, 1), session=1)
+    phone.at(0.4, lambda: controller.dial(0, 0))
+    phone.run(10)
+    assert phone.entered(0) == [MENU, A, MENU]
+    assert phone.entered(1) == [MENU, B]
+    assert [name for _, action, name in phone.played(1) if action == "play"] == ["menu.wav", "bravo.wav"]
+
+
+def test_hang_up_only_stops_its_session():
+    phone = menus()
+    controller = phone.controller
+    controller.pick_up(0)
+    controller.pick_up(1)
+    phone.at(0.1, lambda: controller.hang_up(1), session=1)
+    phone.at(0.2, lambda: controller.dial(1, 1), session=1)
+    phone.at(0.3, lambda: controller.dial(1, 0))
+    phone.run(10)
+    assert phone.entered(0) == [MENU, A]
+    assert phone.entered(1) == [MENU]
+    assert phone.played(1)[-1] == (0.1, "stop", None)
+
+
+def test_unknown_session_is_rejected():
+    phone = menus()
+    with pytest.raises(ValueError, match="no session 2"):
+        phone.controller.pick_up(2)
+
+
+def chained(**options) -> Phone:
+    """A menu leading to an intro, which continues to the end of the call on it's own."""
+    return Phone(compiled(scenario([
+        node("menu", [{"target": "intro", "number": 1}], audio="menu.wav"),
+        node("intro", [{"target": "end", "random": True}], audio="alfa.wav"),
+        node("end", None, audio="kilo.wav"),
+    ])), **options)
+
+
+def test_successor_is_queued_while_the_node_plays():
+    phone = chained()
+    controller = phone.controller
+    controller.pick_up(0)
+    phone.at(0.1, lambda: controller.dial(1, 0))
+    phone.run(10)
+    assert phone.entered() == [0, 1, 2]
+    assert phone.played()[3:] == [
+        (0.1, "play", "alfa.wav"),
+        (0.1, "enqueue", "kilo.wav"),
+        (0.636871, "enqueue", "foxtrot.wav"),
+    ]
+    # The queued node is entered once it's audio starts.
+    assert round(phone.nodes[-1][0], 3) == 0.637
+
+
+def test_dial_drops_the_queued_successor():
+    phone = chained()
+    controller = phone.controller
+    controller.pick_up(0)
+    phone.at(0.1, lambda: controller.dial(1, 0))
+    phone.at(0.2, lambda: controller.dial(5, 0))
+    phone.run(10)
+    # The invalid number stops the queued end, the intro plays again afterwards.
+    assert phone.played()[5:8] == [(0.2, "stop", None), (0.2, "play", "delta.wav"), (0.824036, "play", "alfa.wav")]
+    assert round(phone.nodes[-1][0], 6) == 1.360907
+
+
+def test_hang_up_drops_the_chain():
+    phone = chained()
+    controller = phone.controller
+    controller.pick_up(0)
+    phone.at(0.1, lambda: controller.dial(1, 0))
+    phone.at(0.2, controller.hang_up)
+    phone.run(10)
+    assert phone.entered() == [0, 1]
+    assert phone.played()[-1] == (0.2, "stop", None)
+
+
+def test_without_gapless_the_successor_plays_after_the_end():
+    phone = chained(gapless=False)
+    controller = phone.controller
+    controller.pick_up(0)
+    phone.at(0.1, lambda: controller.dial(1, 0))
+    phone.run(10)
+    assert phone.entered() == [0, 1, 2]
+    assert [played for played in phone.played() if played[1] != "stop"] == [
+        (0, "play", "menu.wav"),
+        (0.1, "play", "alfa.wav"),
+        (0.636871, "play", "kilo.wav"),
+        (1.267846, "play", "foxtrot.wav"),
+    ]
+
+
+def idle(**fields) -> Phone:
+    return Phone(compiled(scenario([
+        node("menu", [{"target": "a", "number": 1}], audio="menu.wav"),
+        node("a", [{"target": "menu", "number": 0}], audio="alfa.wav", repeat_after=0),
+    ], repeat_after=5.0, max_repeats=2, **fields)))
+
+
+def plays(phone: Phone) -> list[tuple[float, str]]:
+    """Start (to the centisecond) and audio of everything played."""
+    return [(round(time, 2), name) for time, action, name in phone.played() if action == "play"]
+
+
+def test_idle_calls_are_repeated_and_ended():
+    phone = idle()
+    phone.controller.pick_up(0)
+    phone.run(30)
+    # The menu audio takes 0.63 seconds.
+    assert plays(phone) == [(0, "menu.wav"), (5.63, "menu.wav"), (11.26, "menu.wav"), (16.89, "foxtrot.wav")]
+    assert [round(time, 2) for time, _ in phone.timeouts] == [16.89]
+
+
+def test_dialing_resets_the_repeats():
+    phone = idle()
+    controller = phone.controller
+    controller.pick_up(0)
+    phone.at(3, lambda: controller.dial(1, 0))
+    phone.at(4, lambda: controller.dial(0, 0))
+    phone.run(30)
+    # The node without repeats just waits, the menu counts from zero again.
+    assert [time for time, _ in plays(phone)] == [0, 3, 4, 9.63, 15.26, 20.89]
+    assert [round(time, 2) for time, _ in phone.timeouts] == [20.89]
+
+
+def test_nodes_without_repeats_wait_forever():
+    phone = idle()
+    controller = phone.controller
+    controller.pick_up(0)
+    phone.at(1, lambda: controller.dial(1, 0))
+    phone.run(100)
+    assert phone.entered() == [MENU, A]
+    assert phone.timeouts == []
+
+
+def coded() -> Phone:
+    return Phone(compiled(scenario([
+        node("menu", [
+            {"target": "a", "number": 1},
+            {"target": "secret", "code": "42"},
+        ], audio="menu.wav"),
+        node("a", [{"target": "menu", "number": 0}], audio="alfa.wav"),
+        node("secret", [{"target": "menu", "number": 0}], audio="charlie.wav"),
+    ], digit_timeout=1.5)))
+
+
+def test_digit_burst_only_plays_the_last_node():
+    phone = coded()
+    controller = phone.controller
+
+    def burst():
+        for number in (1, 0, 1):
+            controller.dial(number)
+
+    controller.pick_up(0)
+    phone.at(0.1, burst)
+    phone.run(10)
+    assert phone.entered() == [MENU, A, MENU, A]
+    assert plays(phone) == [(0, "menu.wav"), (0.1, "alfa.wav")]
+    assert phone.loaded.count("alfa.wav") == 1
+
+
+def test_codes_wait_for_further_digits():
+    phone = coded()
+    controller = phone.controller
+    controller.pick_up(0)
+    phone.at(0.1, lambda: controller.dial(4))
+    phone.at(1, lambda: controller.dial(2))
+    phone.run(10)
+    assert phone.entered() == [MENU, 2]
+    assert plays(phone) == [(0, "menu.wav"), (1, "charlie.wav")]
+
+
+def test_beginning_of_a_code_times_out():
+    phone = coded()
+    controller = phone.controller
+    controller.pick_up(0)
+    phone.at(0.1, lambda: controller.dial(4))
+    phone.at(0.2, lambda: controller.dial(1))
+    phone.run(10)
+    # The 1 extends the 4 to an invalid code instead of following the number.
+    assert phone.entered() == [MENU]
+    assert plays(phone) == [(0, "menu.wav"), (0.2, "delta.wav"), (0.82, "menu.wav")]
+    phone = coded()
+    controller = phone.controller
+    controller.pick_up(0)
+    phone.at(0.1, lambda: controller.dial(4))
+    phone.run(10)
+    assert plays(phone)[1] == (1.6, "delta.wav")
+
+
+def test_running_calls_keep_the_old_scenario():
+    phone = menus()
+    controller = phone.controller
+    swapped = compiled(scenario([
+        node("menu", [{"target": "b", "number": 1}, {"target": "a", "number": 2}], audio="menu.wav"),
+        node("a", [{"target": "menu", "number": 0}], audio="alfa.wav"),
+        node("b", [{"target": "menu", "number": 0}], audio="bravo.wav"),
+    ]))
+    controller.pick_up(0)
+    phone.at(0.1, lambda: controller.reload(swapped))
+    phone.at(0.2, lambda: controller.dial(1))
+    phone.at(0.3, controller.hang_up)
+    phone.at(0.4, controller.pick_up)
+    phone.at(0.5, lambda: controller.dial(1))
+    phone.run(10)
+    assert phone.entered() == [MENU, A, MENU, B]
+
+
+def test_reload_only_reads_changed_audio_again(tmp_path: Path):
+    audio = tmp_path / "changing.wav"
+    shutil.copy(AUDIO / "alfa.wav", audio)
+    data = scenario([
+        node("menu", [{"target": "a", "number": 1}], audio="menu.wav"),
+        node("a", [{"target": "menu", "number": 0}], audio=str(audio)),
+    ])
+    phone = Phone(compiled(data))
+    controller = phone.controller
+    controller.pick_up(0)
+    phone.at(0.1, lambda: controller.dial(1))
+    phone.at(0.2, lambda: os.utime(audio, ns=(1, 1)))
+    phone.at(0.3, lambda: controller.reload(compiled(data)))
+    phone.at(0.4, controller.pick_up)
+    phone.at(0.5, lambda: controller.dial(1))
+    phone.run(10)
+    assert phone.loaded.count("menu.wav") == 1
+    assert phone.loaded.count("changing.wav") == 2
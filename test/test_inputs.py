@@ -0,0 +1,139 @@
+from hedylogos.__main__ import app
+from hedylogos.inputs import FifoSource, InputReceiver, RecordedSource, SocketSource, source_by_name
+from hedylogos.simulation import TraceEvent, read_trace, write_trace
+
+import os
+from pathlib import Path
+import socket
+import time
+
+import pytest
+from typer.testing import CliRunner
+
+
+class Controller:
+    """Records what the receiver passes on instead of playing anything."""
+
+    def __init__(self, sessions: int = 2):
+        self.sessions = sessions
+        self.calls: list[tuple] = []
+        self.quitted = False
+
+    def start(self):
+        pass
+
+    def quit(self):
+        self.quitted = True
+
+    def pick_up(self, session: int = 0):
+        self.calls.append(("pick_up", session))
+
+    def hang_up(self, session: int = 0):
+        self.calls.append(("hang_up", session))
+
+    def dial(self, number: int, session: int = 0):
+        self.calls.append(("dial", session, number))
+
+
+def receive(controller: Controller, receiver: InputReceiver, timeout: float = 5):
+    receiver.start()
+    receiver.join(timeout)
+    assert not receiver.is_alive()
+    assert controller.quitted
+
+
+@pytest.mark.parametrize("name, path, session", [
+    ("fifo:{}", "in", 0),
+    ("fifo:{}@1", "in", 1),
+    # Only a number after the last @ is a session.
+    ("fifo:{}", "in@home", 0),
+    ("fifo:{}@12", "in@2", 12),
+])
+def test_source_by_name(tmp_path: Path, name: str, path: str, session: int):
+    fifo = tmp_path / path
+    source = source_by_name(name.format(fifo))
+    try:
+        assert isinstance(source, FifoSource)
+        assert source.path == fifo
+        assert source.session == session
+    finally:
+        source.close()
+
+
+@pytest.mark.parametrize("name", ["fifo", "keyboard:x", "rotary:x", "replay:trace.jsonl@1"])
+def test_unknown_sources_are_rejected(name: str):
+    with pytest.raises(ValueError, match="unknown input"):
+        source_by_name(name)
+
+
+def test_lines_from_a_fifo(tmp_path: Path):
+    controller = Controller()
+    source = FifoSource(tmp_path / "in", session=1)
+    receiver = InputReceiver(controller, [source], record=tmp_path / "trace.jsonl")
+    writer = os.open(tmp_path / "in", os.O_WRONLY)
+    os.write(writer, b"p\n@0 pick_up\ndial 4\n12\nunknown\n")
+    os.write(writer, b"h\nq\n")
+    os.close(writer)
+    receive(controller, receiver)
+    assert controller.calls == [
+        ("pick_up", 1),
+        ("pick_up", 0),
+        ("dial", 1, 4),
+        ("dial", 1, 1),
+        ("dial", 1, 2),
+        ("hang_up", 1),
+    ]
+    assert receiver.inputs == 6
+    trace = read_trace(tmp_path / "trace.jsonl")
+    assert [(event.session, event.action, event.number) for event in trace][2:] == [
+        (1, "dial", 4), (1, "dial", 1), (1, "dial", 2), (1, "hang_up", None),
+    ]
+
+
+def test_socket_connections(tmp_path: Path):
+    controller = Controller()
+    source = SocketSource(tmp_path / "in.sock")
+    receiver = InputReceiver(controller, [source])
+    receiver.start()
+    for line in (b"p\n", b"q\n"):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(str(tmp_path / "in.sock"))
+            client.sendall(line)
+        # One connection after the other, so the order is kept.
+        time.sleep(0.1)
+    receiver.join(5)
+    assert controller.quitted
+    assert controller.calls == [("pick_up", 0)]
+    assert not (tmp_path / "in.sock").exists()
+
+
+def test_replay_keeps_the_timing_and_quits(tmp_path: Path):
+    path = tmp_path / "trace.jsonl"
+    write_trace([
+        TraceEvent(0, 0, "pick_up"),
+        TraceEvent(0.1, 1, "pick_up"),
+        TraceEvent(0.2, 1, "dial", 3),
+        TraceEvent(0.3, 0, "hang_up"),
+    ], path)
+    controller = Controller()
+    receiver = InputReceiver(controller, [RecordedSource(path)])
+    start = time.monotonic()
+    receive(controller, receiver)
+    assert time.monotonic() - start >= 0.3
+    assert controller.calls == [("pick_up", 0), ("pick_up", 1), ("dial", 1, 3), ("hang_up", 0)]
+
+
+def test_sessions_beyond_the_controller_are_rejected(tmp_path: Path):
+    source = FifoSource(tmp_path / "in", session=2)
+    try:
+        with pytest.raises(ValueError, match="uses session 2"):
+            InputReceiver(Controller(), [source])
+    finally:
+        source.close()
+
+
+@pytest.mark.skipif(Path("/etc/rpi-issue").exists(), reason="a Raspberry Pi can read a dial phone")
+def test_dial_phone_is_checked_before_loading(tmp_path: Path):
+    result = CliRunner().invoke(app, ["run-phone", str(tmp_path / "missing.json")])
+    # The missing scenario would be reported if it was loaded first.
+    assert isinstance(result.exception, NotImplementedError)
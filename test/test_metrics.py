@@ -0,0 +1,78 @@
+from hedylogos.metrics import Histogram, Metrics
+from phone import Phone
+from scenarios import compiled, node, scenario
+
+import json
+from pathlib import Path
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram((1, 2, 4))
+    for value in (0.5, 1, 1.5, 3, 10):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1, 1]
+    values = histogram.as_dict()
+    assert (values["count"], values["sum"], values["min"], values["max"]) == (5, 16, 0.5, 10)
+    assert values["buckets"] == {"1": 2, "2": 1, "4": 1, "+Inf": 1}
+    assert 0.5 <= values["p50"] <= 2
+    assert values["p99"] <= 10
+
+
+def test_empty_histogram():
+    values = Histogram().as_dict()
+    assert values["count"] == 0
+    assert values["min"] is None and values["p50"] is None
+
+
+def test_prometheus_buckets_are_cumulative():
+    metrics = Metrics()
+    metrics.histogram("handler_seconds", {"action": "dial"}, (0.1, 1)).observe(0.5)
+    metrics.histogram("handler_seconds", {"action": "dial"}, (0.1, 1)).observe(0.05)
+    metrics.histogram("queue_depth", bounds=(1,)).observe(3)
+    assert metrics.prometheus().splitlines() == [
+        "# TYPE hedylogos_handler_seconds histogram",
+        'hedylogos_handler_seconds_bucket{action="dial",le="0.1"} 1',
+        'hedylogos_handler_seconds_bucket{action="dial",le="1"} 2',
+        'hedylogos_handler_seconds_bucket{action="dial",le="+Inf"} 2',
+        'hedylogos_handler_seconds_sum{action="dial"} 0.55',
+        'hedylogos_handler_seconds_count{action="dial"} 2',
+        "# TYPE hedylogos_queue_depth histogram",
+        'hedylogos_queue_depth_bucket{le="1"} 0',
+        'hedylogos_queue_depth_bucket{le="+Inf"} 1',
+        "hedylogos_queue_depth_sum 3",
+        "hedylogos_queue_depth_count 1",
+    ]
+
+
+def test_write_by_suffix(tmp_path: Path):
+    metrics = Metrics()
+    metrics.timed("work_seconds", lambda: None)()
+    metrics.write(tmp_path / "metrics.json")
+    metrics.write(tmp_path / "metrics.prom")
+    snapshot = json.loads((tmp_path / "metrics.json").read_text())
+    assert [histogram["name"] for histogram in snapshot["histograms"]] == ["work_seconds"]
+    assert "hedylogos_work_seconds_count 1" in (tmp_path / "metrics.prom").read_text()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["metrics.json", "metrics.prom"]
+
+
+def test_controller_measures_the_handlers():
+    metrics = Metrics()
+    phone = Phone(compiled(scenario([
+        node("menu", [{"target": "a", "number": 1}], audio="menu.wav"),
+        node("a", [{"target": "menu", "number": 0}], audio="alfa.wav"),
+    ])), metrics=metrics)
+    controller = phone.controller
+    controller.pick_up(0)
+    phone.at(0.1, lambda: controller.dial(1))
+    phone.at(0.2, lambda: controller.dial(0))
+    phone.run(5)
+    counts = {
+        (histogram["name"], histogram["labels"].get("action")): histogram["count"]
+        for histogram in metrics.snapshot()["histograms"]
+    }
+    assert counts[("handler_seconds", "dial")] == 2
+    assert counts[("handler_seconds", "pick_up")] == 1
+    # The inputs and the end of the menu audio.
+    assert counts[("queue_wait_seconds", None)] == 4
+    assert counts[("audio_load_seconds", None)] == 2
+    assert counts[("event_to_playback_seconds", "dial")] == 2
@@ -0,0 +1,87 @@
+from hedylogos.model import Scenario
+from hedylogos.prepare import AudioFormat, AudioPreparer
+
+import json
+from pathlib import Path
+import shutil
+import stat
+from typing import Any
+
+import pytest
+
+
+FAKE_FFMPEG = """#!/bin/sh
+# Copies the input to the last argument and logs the call.
+for last; do :; done
+while [ $# -gt 0 ]; do
+    if [ "$1" = "-i" ]; then source=$2; fi
+    shift
+done
+echo "$source" >> "$(dirname "$0")/calls"
+cp "$source" "$last"
+"""
+
+
+@pytest.fixture
+def ffmpeg(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Puts a fake ffmpeg on the path, returns the file logging it's calls."""
+    bin = tmp_path / "bin"
+    bin.mkdir()
+    path = bin / "ffmpeg"
+    path.write_text(FAKE_FFMPEG)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", str(bin), prepend=":")
+    return bin / "calls"
+
+
+def prepare(scenario_file: Path, cache_dir: Path) -> tuple[AudioPreparer, Scenario]:
+    preparer = AudioPreparer(cache_dir, AudioFormat(), jobs=1)
+    output = scenario_file.with_name("prepared.json")
+    prepared = preparer.prepare(Scenario.from_json(scenario_file), scenario_file, output)
+    return preparer, prepared
+
+
+def test_converts_each_file_once(ffmpeg: Path, scenario_file: Path, tmp_path: Path):
+    preparer, prepared = prepare(scenario_file, tmp_path / "cache")
+    paths = [node.audio for node in prepared.nodes.root]
+    assert preparer.converted == len(ffmpeg.read_text().splitlines()) == 8
+    assert preparer.reused == 0
+    assert all(not Path(path).is_absolute() for path in paths)
+    assert all((scenario_file.parent / path).exists() for path in paths)
+    assert Scenario.from_json(scenario_file.with_name("prepared.json")).nodes == prepared.nodes
+    manifest = json.loads((tmp_path / "cache" / AudioPreparer.MANIFEST).read_text())
+    assert len(manifest) == 8
+
+
+def test_unchanged_files_are_reused(ffmpeg: Path, scenario_file: Path, tmp_path: Path):
+    prepare(scenario_file, tmp_path / "cache")
+    preparer, _ = prepare(scenario_file, tmp_path / "cache")
+    assert preparer.converted == 0
+    assert preparer.reused == 8
+    assert len(ffmpeg.read_text().splitlines()) == 8
+
+
+def test_copies_share_one_converted_file(ffmpeg: Path, scenario_data: dict[str, Any], tmp_path: Path):
+    copy = tmp_path / "copy.wav"
+    shutil.copy(scenario_data["nodes"][0]["audio"], copy)
+    scenario_data["nodes"][1]["audio"] = str(copy)
+    path = tmp_path / "scenario.json"
+    path.write_text(json.dumps(scenario_data))
+    preparer, prepared = prepare(path, tmp_path / "cache")
+    assert preparer.converted == 7
+    assert prepared.nodes.root[0].audio == prepared.nodes.root[1].audio
+
+
+def test_format_is_part_of_the_key():
+    assert AudioFormat().key() != AudioFormat(loudness=None).key()
+    assert "loudnorm" not in " ".join(AudioFormat(loudness=None).ffmpeg_args())
+    with pytest.raises(ValueError):
+        AudioFormat(width=5)
+
+
+def test_missing_audio_is_reported(ffmpeg: Path, scenario_data: dict[str, Any], tmp_path: Path):
+    scenario_data["nodes"][0]["audio"] = str(tmp_path / "missing.wav")
+    path = tmp_path / "scenario.json"
+    path.write_text(json.dumps(scenario_data))
+    with pytest.raises(FileNotFoundError, match="missing.wav"):
+        prepare(path, tmp_path / "cache")
@@ -0,0 +1,84 @@
+from hedylogos.scheduler import Scheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_runs_due_timers_in_order():
+    clock = Clock()
+    scheduler = Scheduler(clock)
+    ran: list[str] = []
+    scheduler.call_later(2, lambda: ran.append("b"))
+    scheduler.call_later(1, lambda: ran.append("a"))
+    scheduler.call_later(2, lambda: ran.append("c"))
+    assert scheduler.timeout() == 1
+    assert scheduler.run_due() == 0
+    clock.now = 2
+    assert scheduler.run_due() == 3
+    assert ran == ["a", "b", "c"]
+    assert scheduler.timeout() is None
+    assert len(scheduler) == 0
+
+
+def test_timeout_is_zero_when_overdue():
+    clock = Clock()
+    scheduler = Scheduler(clock)
+    scheduler.call_at(1, lambda: None)
+    clock.now = 5
+    assert scheduler.timeout() == 0
+
+
+def test_cancelled_timers_dont_run():
+    clock = Clock()
+    scheduler = Scheduler(clock)
+    ran: list[int] = []
+    first = scheduler.call_later(1, lambda: ran.append(1))
+    scheduler.call_later(2, lambda: ran.append(2))
+    scheduler.cancel(first)
+    scheduler.cancel(first)
+    scheduler.cancel(None)
+    assert len(scheduler) == 1
+    assert scheduler.next_deadline() == 2
+    clock.now = 3
+    assert scheduler.run_due() == 1
+    assert ran == [2]
+
+
+def test_cancelling_a_timer_which_ran_does_nothing():
+    clock = Clock()
+    scheduler = Scheduler(clock)
+    timer = scheduler.call_later(0, lambda: None)
+    assert scheduler.run_due() == 1
+    scheduler.cancel(timer)
+    assert len(scheduler) == 0
+
+
+def test_timers_started_by_callbacks():
+    clock = Clock()
+    scheduler = Scheduler(clock)
+    ran: list[str] = []
+    scheduler.call_later(1, lambda: (ran.append("first"), scheduler.call_later(0, lambda: ran.append("due"))))
+    scheduler.call_later(1, lambda: scheduler.call_later(1, lambda: ran.append("later")))
+    clock.now = 1
+    assert scheduler.run_due() == 3
+    assert ran == ["first", "due"]
+    clock.now = 2
+    scheduler.run_due()
+    assert ran == ["first", "due", "later"]
+
+
+def test_many_cancelled_timers_are_dropped():
+    clock = Clock()
+    scheduler = Scheduler(clock)
+    timers = [scheduler.call_later(i, lambda: None) for i in range(1000)]
+    for timer in timers[:900]:
+        scheduler.cancel(timer)
+    assert len(scheduler) == 100
+    assert scheduler.next_deadline() == 900
+    clock.now = 1000
+    assert scheduler.run_due() == 100
@@ -0,0 +1,109 @@
+from hedylogos.server import TOKEN_HEADER, LiveScenario, ScenarioServer
+from scenarios import node
+
+from http.client import HTTPConnection
+import json
+from pathlib import Path
+from threading import Thread
+from typing import Any, Iterator, Optional
+
+import pytest
+
+
+@pytest.fixture
+def live(scenario_file: Path) -> LiveScenario:
+    return LiveScenario.from_json(scenario_file)
+
+
+@pytest.fixture
+def server(live: LiveScenario) -> Iterator[ScenarioServer]:
+    server = ScenarioServer(live, ("127.0.0.1", 0), token="secret")
+    thread = Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def request(
+    server: ScenarioServer,
+    method: str,
+    path: str,
+    body: Optional[bytes] = None,
+    headers: Optional[dict[str, str]] = None,
+) -> tuple[int, dict[str, Any]]:
+    connection = HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+    try:
+        connection.putrequest(method, path)
+        for name, value in (headers if headers is not None else {TOKEN_HEADER: "secret"}).items():
+            connection.putheader(name, value)
+        if body is not None and "Content-Length" not in (headers or {}):
+            connection.putheader("Content-Length", str(len(body)))
+        connection.endheaders(body)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_edits_update_the_status(live: LiveScenario):
+    status = live.status()
+    assert status["valid"]
+    assert status["unreachable"] == []
+    # Secret is only reached by it's code.
+    live.set_link("menu", 2, None)
+    assert live.status()["unreachable"] == ["secret"]
+    live.add_node(node("lonely", [{"target": "nowhere", "number": 1}]))
+    status = live.status()
+    assert not status["valid"]
+    assert status["unreachable"] == ["secret", "lonely"]
+    live.remove_node("lonely")
+    live.update_node("secret", node("hidden", [{"target": "menu", "number": 0}], audio="charlie.wav"))
+    assert live.status()["valid"]
+    assert [raw["id"] for raw in live.as_dict()["nodes"]] == ["menu", "alfa", "bravo", "hidden", "end"]
+
+
+def test_only_valid_scenarios_are_saved(live: LiveScenario, tmp_path: Path):
+    live.add_node(node("broken", [{"target": "nowhere", "number": 1}]))
+    with pytest.raises(Exception, match="isn't valid"):
+        live.save(tmp_path / "saved.json")
+    assert not (tmp_path / "saved.json").exists()
+
+
+def test_requests(server: ScenarioServer):
+    status, rsl = request(server, "GET", "/status", headers={})
+    assert status == 200 and rsl["valid"]
+    status, rsl = request(server, "POST", "/nodes", json.dumps(node("new", None)).encode())
+    assert status == 200 and rsl["unreachable"] == ["new"]
+    status, rsl = request(server, "GET", "/scenario", headers={})
+    assert rsl["nodes"][-1]["id"] == "new"
+    status, _ = request(server, "POST", "/nodes", json.dumps(node("new", None)).encode())
+    assert status == 409
+
+
+@pytest.mark.parametrize("headers, status", [
+    ({}, 403),
+    ({TOKEN_HEADER: "wrong"}, 403),
+    ({TOKEN_HEADER: "secret", "Origin": "https://example.com"}, 403),
+    ({TOKEN_HEADER: "secret", "Origin": "http://localhost:8000"}, 200),
+])
+def test_changes_need_the_token_and_an_allowed_origin(server: ScenarioServer, headers: dict[str, str], status: int):
+    assert request(server, "POST", "/audio", headers=headers)[0] == status
+
+
+@pytest.mark.parametrize("body, length, status", [
+    (b"{", None, 400),
+    (b"[]", None, 400),
+    (b"{}", "many", 400),
+    (b"{}", "-2", 400),
+    (b"{}", str(2 ** 40), 413),
+])
+def test_bad_bodies_are_rejected(server: ScenarioServer, body: bytes, length: Optional[str], status: int):
+    headers = {TOKEN_HEADER: "secret"}
+    if length is not None:
+        headers["Content-Length"] = length
+    code, rsl = request(server, "PATCH", "/scenario", body, headers)
+    assert code == status
+    assert "error" in rsl
+    # Nothing changed.
+    assert request(server, "GET", "/status", headers={})[1]["valid"]
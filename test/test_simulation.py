@@ -0,0 +1,101 @@
+from hedylogos.__main__ import app
+from hedylogos.compiled import CompiledScenario
+from hedylogos.simulation import Simulation, TraceEvent, read_trace
+
+import json
+from pathlib import Path
+import random
+
+import pytest
+from typer.testing import CliRunner
+
+
+MENU, ALFA, BRAVO, SECRET, END = range(5)
+
+
+@pytest.fixture
+def compiled_scenario(scenario_file: Path) -> CompiledScenario:
+    return CompiledScenario.from_json(scenario_file)
+
+
+def result(simulation: Simulation) -> dict:
+    rsl = simulation.as_dict()
+    del rsl["wall_seconds"], rsl["events_per_second"]
+    return rsl
+
+
+def test_trace_is_followed(compiled_scenario: CompiledScenario):
+    simulation = Simulation(compiled_scenario, seed=1)
+    simulation.replay([
+        TraceEvent(0, 0, "pick_up"),
+        TraceEvent(1, 0, "dial", 4),
+        TraceEvent(1.5, 0, "dial", 2),
+        TraceEvent(3, 0, "dial", 0),
+        TraceEvent(4, 0, "hang_up"),
+    ])
+    assert simulation.node_visits[MENU] == 2
+    assert simulation.node_visits[SECRET] == 1
+    assert simulation.visits == 1
+    assert simulation.completed == 0
+
+
+def test_idle_calls_time_out(compiled_scenario: CompiledScenario):
+    simulation = Simulation(compiled_scenario)
+    simulation.replay([TraceEvent(0, 0, "pick_up")])
+    assert simulation.timed_out == 1
+    # Played three times (repeated twice) and waited 5 seconds after each.
+    assert 3 * 5 < simulation.clock.now
+
+
+def test_trace_sessions_have_to_exist(compiled_scenario: CompiledScenario):
+    with pytest.raises(ValueError, match="session 1"):
+        Simulation(compiled_scenario).replay([TraceEvent(0, 1, "pick_up")])
+
+
+def test_visits_are_reproducible(compiled_scenario: CompiledScenario):
+    runs = []
+    for _ in range(2):
+        # The seed is for the visitors, the controller chooses random links like on a real phone.
+        random.seed(7)
+        simulation = Simulation(compiled_scenario, sessions=2, seed=7)
+        simulation.visit(50)
+        runs.append((result(simulation), [event.as_dict() for event in simulation.trace]))
+    assert runs[0] == runs[1]
+    simulation_result = runs[0][0]
+    assert simulation_result["visits"] == 50
+    assert simulation_result["node_visits"]["menu"] >= 50
+
+
+def test_replaying_the_trace_of_visits(compiled_scenario: CompiledScenario):
+    random.seed(3)
+    visited = Simulation(compiled_scenario, seed=3)
+    visited.visit(20)
+    random.seed(3)
+    replayed = Simulation(compiled_scenario)
+    replayed.replay(visited.trace)
+    # The random links are chosen in the same order.
+    assert replayed.node_visits == visited.node_visits
+    assert replayed.visits == visited.visits
+
+
+def test_random_links_follow_their_weights(compiled_scenario: CompiledScenario):
+    simulation = Simulation(compiled_scenario, seed=5)
+    assert simulation.expected_choices(BRAVO) == {END: 0.75, ALFA: 0.25}
+    assert simulation.expected_choices(ALFA) == {END: 0.5, BRAVO: 0.5}
+    random.seed(5)
+    simulation.visit(2000, hang_up_probability=0)
+    (bravo,) = [node for node in simulation.as_dict()["random_links"] if node["node"] == "bravo"]
+    for target in bravo["targets"]:
+        assert abs(target["observed"] - target["expected"]) < 0.05
+
+
+def test_simulate_command(scenario_file: Path, tmp_path: Path):
+    trace = tmp_path / "trace.jsonl"
+    runner = CliRunner()
+    visited = runner.invoke(app, ["simulate", str(scenario_file), "--visits", "10", "--seed", "2", "--save-trace", str(trace), "--json"])
+    assert visited.exit_code == 0, visited.output
+    assert json.loads(visited.output)["visits"] == 10
+    assert read_trace(trace)
+    replayed = runner.invoke(app, ["simulate", str(scenario_file), "--trace", str(trace), "--seed", "2", "--json"])
+    assert replayed.exit_code == 0, replayed.output
+    assert json.loads(replayed.output)["node_visits"] == json.loads(visited.output)["node_visits"]
@@ -0,0 +1,120 @@
+from hedylogos.compiled import CompiledScenario
+from hedylogos.model import Scenario
+from hedylogos.stream import ScenarioReader, _Tokens, write_scenario
+from scenarios import node, scenario, tables
+
+import io
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+
+def read(path: Path, **kwargs: Any) -> Scenario:
+    reader = ScenarioReader(path, **kwargs)
+    nodes = list(reader.nodes())
+    return reader.settings().model_copy(update={"nodes": nodes})
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64 * 1024])
+def test_reader_matches_validation(scenario_file: Path, chunk_size: int):
+    expected = Scenario.from_json(scenario_file)
+    scenario = read(scenario_file, chunk_size=chunk_size)
+    assert [node.model_dump() for node in scenario.nodes] == [node.model_dump() for node in expected.nodes.root]
+    assert scenario.model_dump(exclude={"nodes"}) == expected.model_dump(exclude={"nodes"})
+
+
+def test_settings_after_nodes(tmp_path: Path, scenario_data: dict[str, Any]):
+    path = tmp_path / "after.json"
+    nodes = scenario_data.pop("nodes")
+    path.write_text(json.dumps({"nodes": nodes, **scenario_data}, indent=2))
+    scenario = read(path, chunk_size=5)
+    assert scenario.digit_timeout == 1.5
+    assert len(scenario.nodes) == len(nodes)
+
+
+def test_numbers_split_across_chunks(tmp_path: Path):
+    path = tmp_path / "numbers.json"
+    data = scenario([node("start", [{"target": "start", "number": 1}], repeat_after=12.5e-1)], digit_timeout=2.25)
+    path.write_text(json.dumps(data, separators=(",", ":")))
+    for chunk_size in range(1, 20):
+        scenario_read = read(path, chunk_size=chunk_size)
+        assert scenario_read.digit_timeout == 2.25
+        assert scenario_read.nodes[0].repeat_after == 1.25
+
+
+def test_skip_content(tmp_path: Path):
+    path = tmp_path / "content.json"
+    path.write_text(json.dumps(scenario([node("start", None, content="Hallo")])))
+    assert read(path).nodes[0].content == "Hallo"
+    assert read(path, skip_content=True).nodes[0].content is None
+
+
+def test_settings_need_all_nodes(scenario_file: Path):
+    reader = ScenarioReader(scenario_file)
+    next(reader.nodes())
+    with pytest.raises(RuntimeError):
+        reader.settings()
+
+
+@pytest.mark.parametrize("content, message", [
+    ('{"nodes": [', "invalid JSON"),
+    ('{"nodes": []} []', "data after the scenario"),
+    ('{"name": "x"}', "nodes"),
+    ('[]', "expected '{'"),
+])
+def test_invalid_json(tmp_path: Path, content: str, message: str):
+    path = tmp_path / "invalid.json"
+    path.write_text(content)
+    with pytest.raises(ValueError, match=message):
+        list(ScenarioReader(path).nodes())
+
+
+def test_errors_dont_read_the_rest_of_the_file():
+    f = io.StringIO('[{"id": x}, ' + " " * 100_000 + "]")
+    tokens = _Tokens(f, 64)
+    with pytest.raises(ValueError, match="invalid JSON at character 8"):
+        tokens.value()
+    assert f.tell() == 64
+
+
+def test_values_cut_off_by_the_chunk_are_read(tmp_path: Path):
+    path = tmp_path / "cut.json"
+    data = scenario([node("start", None, content="\u00fc" + "x" * 100)])
+    path.write_text(json.dumps(data, ensure_ascii=True))
+    for chunk_size in range(1, 40):
+        assert read(path, chunk_size=chunk_size).nodes[0].content == "ü" + "x" * 100
+
+
+def test_invalid_nodes(tmp_path: Path):
+    path = tmp_path / "invalid.json"
+    for nodes, message in [
+        ([node("a", None), node("a", None)], "not unique"),
+        ([node("a", [{"target": "b", "number": 1}])], "node 'a' has invalid link target"),
+        ([node("a", [{"target": "a", "number": 1}, {"target": "a", "code": "1"}])], r"node 'a'(.|\n)*used by more than one link"),
+    ]:
+        path.write_text(json.dumps(scenario(nodes)))
+        with pytest.raises(ValueError, match=message):
+            list(ScenarioReader(path).nodes())
+
+
+def test_writer_matches_model_dump(tmp_path: Path, scenario_data: dict[str, Any]):
+    scenario_data["nodes"][0]["content"] = "Grüße \"quoted\"\nnext line"
+    scenario_data["authors"] = ["Jürgen"]
+    scenario = Scenario.model_validate(scenario_data)
+    path = tmp_path / "written.json"
+    write_scenario(path, scenario, iter(scenario.nodes.root))
+    assert path.read_text(encoding="utf-8") == scenario.model_dump_json()
+
+
+def test_writer_takes_generated_nodes(tmp_path: Path, scenario_data: dict[str, Any]):
+    scenario = Scenario.model_validate(scenario_data)
+    path = tmp_path / "generated.json"
+    write_scenario(path, scenario, (node for node in scenario.nodes.root))
+    assert read(path).nodes == scenario.nodes.root
+
+
+def test_streamed_compile_matches_models(scenario_file: Path):
+    from_models = CompiledScenario.from_scenario(Scenario.from_json(scenario_file), scenario_file)
+    assert tables(CompiledScenario.from_json(scenario_file)) == tables(from_models)